@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import time
+
+class PendingResolution(object):
+    'Packets waiting for the HW address of a single next hop'
+
+    def __init__(self, next_hop, now, retry_interval):
+        self.next_hop= next_hop
+        self.packets= collections.deque()
+
+        self.requests_sent= 1
+        self.retry_interval= retry_interval
+        self.retry_at= now + retry_interval
+
+class ArpQueue(object):
+    '''
+    A table of next hops that ARP resolution is in progress for.
+
+    Only a single ARP request is sent per next hop, no matter how
+    many packets are queued for it. Requests are repeated with
+    exponential backoff until either a reply comes in or
+    max_requests requests went unanswered, in which case
+    the queued packets are dropped.
+
+    The number of queued packets is bounded per next hop and
+    in total so that a burst of packets towards a dead host
+    can not use up unbounded memory.
+    '''
+
+    def __init__(self, request_send,
+                 max_per_dest= 8, max_total= 256,
+                 retry_interval= 1.0, max_requests= 3):
+
+        # Callback that broadcasts an ARP request for an IP
+        self.request_send= request_send
+
+        self.max_per_dest= max_per_dest
+        self.max_total= max_total
+        self.retry_interval= retry_interval
+        self.max_requests= max_requests
+
+        self.pending= dict()
+        self.total= 0
+        self.dropped= 0
+
+    def __len__(self):
+        return self.total
+
+    def __contains__(self, next_hop):
+        return next_hop in self.pending
+
+    def enqueue(self, next_hop, packet, now= None):
+        '''
+        Queue a packet until the HW address of next_hop is known.
+        Kicks off ARP resolution if it is not in progress yet.
+
+        Returns False if the packet had to be dropped.
+        '''
+
+        if self.total >= self.max_total:
+            self.dropped+= 1
+
+            return False
+
+        entry= self.pending.get(next_hop)
+
+        if entry is None:
+            now= time.time() if now is None else now
+
+            entry= PendingResolution(next_hop, now, self.retry_interval)
+            self.pending[next_hop]= entry
+
+            self.request_send(next_hop)
+
+        elif len(entry.packets) >= self.max_per_dest:
+            # Keep the most recent packets, the old ones
+            # are likely to be retransmitted anyways.
+            entry.packets.popleft()
+            self.total-= 1
+            self.dropped+= 1
+
+        entry.packets.append(packet)
+        self.total+= 1
+
+        return True
+
+    def resolved(self, next_hop):
+        '''
+        Stop resolution for next_hop and return the packets
+        that were queued for it.
+        '''
+
+        entry= self.pending.pop(next_hop, None)
+
+        if entry is None:
+            return list()
+
+        self.total-= len(entry.packets)
+
+        return list(entry.packets)
+
+    def expire(self, now= None):
+        '''
+        Re-send ARP requests that went unanswered and drop
+        the packets for next hops that did not answer at all.
+
+        Should be called periodically.
+        Returns the list of next hops that were given up on.
+        '''
+
+        now= time.time() if now is None else now
+        failed= list()
+
+        for entry in list(self.pending.values()):
+            if entry.retry_at > now:
+                continue
+
+            if entry.requests_sent >= self.max_requests:
+                del self.pending[entry.next_hop]
+
+                self.total-= len(entry.packets)
+                self.dropped+= len(entry.packets)
+
+                failed.append(entry.next_hop)
+
+                continue
+
+            entry.requests_sent+= 1
+            entry.retry_interval*= 2
+            entry.retry_at= now + entry.retry_interval
+
+            self.request_send(entry.next_hop)
+
+        return failed
@@ -12,144 +12,319 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
+import time
+
 from pox.core import core as Core
+from pox.lib.recoco import Timer
 from pox.lib.packet.ethernet import ethernet as Ethernet
 from pox.lib.packet.arp import arp as Arp
+from pox.lib.packet.tcp import tcp as Tcp
+from pox.lib.packet.udp import udp as Udp
 
 import pox.openflow.libopenflow_01 as of
 import pox.lib.addresses as addresses
 
+from arp_queue import ArpQueue
+from neighbours import NeighbourCache
+from routing_table import NextHop, Route, RoutingTable
+
 log = Core.getLogger()
 
+# Interval in seconds at which unanswered ARP requests are
+# checked for retransmission or timeout
+ARP_TICK= 0.25
+
+# Interval in seconds at which gateways that stopped answering
+# are asked whether they are back
+NEXT_HOP_RETRY= 5.0
+
+# Default settings for the flow rules installed by the router.
+#  mode: 'exact' installs one rule per packet header tuple,
+#        'aggregate' one rule per destination host or route prefix.
+FLOW_DEFAULTS= {
+    'mode': 'exact',
+    'idle_timeout': 0,
+    'hard_timeout': 0,
+    'priority': of.OFP_DEFAULT_PRIORITY,
+}
+
+def flow_key(match):
+    'Identify a flow rule installed by the router by its match'
+
+    return (
+        match.in_port, match.dl_src, match.dl_dst,
+        match.get_nw_src(), match.get_nw_dst(),
+        match.nw_proto, match.tp_src, match.tp_dst
+    )
+
+def flow_ports(ippkg):
+    'Return the (source, destination) TCP/UDP ports of an IP packet'
+
+    if isinstance(ippkg.payload, (Tcp, Udp)):
+        return (ippkg.payload.srcport, ippkg.payload.dstport)
+
+    return (0, 0)
+
+def flow_hash(ippkg):
+    'Hash the 5-tuple of the flow an IP packet belongs to'
+
+    (port_src, port_dst)= flow_ports(ippkg)
+
+    return hash((
+        ippkg.srcip, ippkg.dstip, ippkg.protocol, port_src, port_dst
+    )) & 0x7fffffff
+
 class RouterPort(object):
-    def __init__(self, backplane, my_ip, my_netmask, my_mac, my_ofport):
+    def __init__(self, backplane, my_ip, my_netmask, my_mac, my_ofport,
+                 options= dict()):
         self.backbone= backplane
         self.my_ip= addresses.IPAddr(my_ip)
         self.my_netmask= addresses.IPAddr(my_netmask)
         self.my_mac= addresses.EthAddr(my_mac)
         self.my_ofport= my_ofport
+        self.my_prefix_len= addresses.netmask_to_cidr(self.my_netmask)
 
-        # A list of packets that could not yet be delivered
-        # due to ARP resolution being in progress.
-        self.packet_queue= list()
+        # Packets that could not yet be delivered due to
+        # ARP resolution being in progress, by next hop.
+        self.arp_queue= ArpQueue(
+            self.arp_request_send, **options.get('arp', dict())
+        )
 
         # IP->MAC mappings learned using ARP
-        self.neigh_by_ip= dict()
+        self.neighbours= NeighbourCache(
+            self._arp_probe_send, self._neighbour_removed,
+            **options.get('neighbours', dict())
+        )
 
-    def match_ip(self, ip):
-        'Check if an IP is in a subnet corvered by this port'
+        self.flow_options= dict(FLOW_DEFAULTS)
+        self.flow_options.update(options.get('flows', dict()))
 
-        my= self.my_ip.toUnsigned()
-        other= ip.toUnsigned()
-        netmask= self.my_netmask.toUnsigned()
+    def connected_route(self):
+        'Build the route for the subnet directly attached to this port'
 
-        return ((my & netmask) == (other & netmask))
+        return Route(self.my_ip, self.my_prefix_len, [NextHop(self)])
 
     def _packet_send(self, packet):
         'Send an ethernet packet on this router port'
 
         self.backbone.packet_send(packet, self.my_ofport)
 
-    def rule_build(self, event):
-        '''
-        Install a flow rule that automates the forwarding
-        done in order for the packet in event to reach
-        its destination.
-
-        Returns False if no such automation can be installed yet.
-        '''
+    def _match_exact(self, event):
+        'Build a match for exactly the header tuple of the packet in event'
 
         eth_fwd= event.parsed
         ippkg_fwd= eth_fwd.payload
 
-        ip_src= ippkg_fwd.srcip
-        ip_dst= ippkg_fwd.dstip
+        match= of.ofp_match(
+            in_port= event.port,
+            dl_src= eth_fwd.src, dl_dst= eth_fwd.dst,
+            dl_type= Ethernet.IP_TYPE,
+            nw_src= ippkg_fwd.srcip, nw_dst= ippkg_fwd.dstip
+        )
 
-        if ip_dst in self.neigh_by_ip:
-            other_mac_src= eth_fwd.src
-            other_mac_dst= eth_fwd.dst
-            other_ofport= event.port
+        return (match, self.flow_options['priority'])
 
-            my_mac_src= self.my_mac
-            my_mac_dst= self.neigh_by_ip[ip_dst]
-            my_ofport= self.my_ofport
+    def _match_flow(self, event):
+        '''
+        Build a match for the 5-tuple of the flow the packet in
+        event belongs to. Used for multipath routes where every
+        flow may take a different next hop.
+        '''
 
-            match= of.ofp_match(
-                in_port= other_ofport,
-                dl_src= other_mac_src, dl_dst= other_mac_dst,
-                dl_type= Ethernet.IP_TYPE,
-                nw_src= ip_src, nw_dst= ip_dst
-            )
+        ippkg_fwd= event.parsed.payload
+        (port_src, port_dst)= flow_ports(ippkg_fwd)
+
+        match= of.ofp_match(
+            dl_type= Ethernet.IP_TYPE,
+            nw_src= ippkg_fwd.srcip, nw_dst= ippkg_fwd.dstip,
+            nw_proto= ippkg_fwd.protocol
+        )
 
-            actions= list()
-            actions.append(of.ofp_action_dl_addr.set_src(my_mac_src))
-            actions.append(of.ofp_action_dl_addr.set_dst(my_mac_dst))
-            actions.append(of.ofp_action_output(port=my_ofport))
+        if isinstance(ippkg_fwd.payload, (Tcp, Udp)):
+            match.tp_src= port_src
+            match.tp_dst= port_dst
 
-            self.backbone.flow_mod(match, actions)
+        return (match, self.flow_options['priority'] + 32)
 
-            return True
+    def _match_aggregate(self, event, route):
+        '''
+        Build a match for all packets that take the same route
+        to the same next hop as the packet in event.
+
+        Routes via gateways are matched as a whole, unless more
+        specific routes are nested inside them. Directly connected
+        destinations are matched per host.
+        The priority grows with the prefix length so that the switch
+        performs longest prefix matching just like the routing table.
+        '''
+
+        ip_dst= event.parsed.payload.dstip
+
+        if route.is_connected or self.backbone.routes.has_more_specific(route):
+            (nw_dst, prefix_len)= (ip_dst, 32)
 
         else:
-            return False
+            (nw_dst, prefix_len)= (route.network, route.prefix_len)
+
+        match= of.ofp_match(dl_type= Ethernet.IP_TYPE)
+        match.set_nw_dst(nw_dst, prefix_len)
+
+        priority= self.flow_options['priority'] + prefix_len
 
-    def packet_forward(self, event):
+        return (match, priority)
+
+    def _actions(self, next_hop_mac):
+        'Build the actions that mangle and output a packet for a next hop'
+
+        actions= list()
+        actions.append(of.ofp_action_dl_addr.set_src(self.my_mac))
+        actions.append(of.ofp_action_dl_addr.set_dst(next_hop_mac))
+        actions.append(of.ofp_action_output(port=self.my_ofport))
+
+        return actions
+
+    def rule_build(self, event, route, next_hop):
         '''
-        Manually mangle a packet and forward it to its destination.
-        Kick off an ARP request and enqueue the packet if the
-        destination HW address is not known yet.
+        Install a flow rule that automates the forwarding
+        done in order for the packet in event to reach
+        its destination via the neighbour next_hop.
 
-        Returns true if the packet will be output on this port.
+        If the switch buffered the packet it is told to apply
+        the new rule to it.
+        Returns True if that is the case and the packet does not
+        have to be forwarded manually.
         '''
 
-        eth_fwd= event.parsed
-        ip_fwd= eth_fwd.payload
-        addr_dst= ip_fwd.dstip
+        next_hop_mac= self.neighbours.lookup(next_hop)
 
-        if not self.match_ip(ip_fwd.dstip):
+        if next_hop_mac is None:
             return False
 
-        if addr_dst in self.neigh_by_ip:
+        if route.is_multipath:
+            (match, priority)= self._match_flow(event)
+
+        elif self.flow_options['mode'] == 'aggregate':
+            (match, priority)= self._match_aggregate(event, route)
+
+        else:
+            (match, priority)= self._match_exact(event)
+
+        return self.backbone.flow_install(
+            (self.my_ofport, next_hop), match, self._actions(next_hop_mac), priority,
+            self.flow_options['idle_timeout'], self.flow_options['hard_timeout'],
+            event.ofp.buffer_id
+        )
+
+    def packet_forward(self, event, next_hop):
+        '''
+        Manually mangle a packet and forward it to the neighbour
+        next_hop on its way to its destination.
+        Kick off an ARP request and enqueue the packet if the
+        next hop HW address is not known yet.
+        '''
+
+        next_hop_mac= self.neighbours.lookup(next_hop)
+
+        if next_hop_mac is not None and event.ofp.buffer_id is not None:
+            # The HW address of the peer is known and the switch
+            # still holds the packet:
+            #  Let the switch perform the forwarding
+
+            self.backbone.packet_release(event.ofp, self._actions(next_hop_mac))
+
+        elif next_hop_mac is not None:
             # The HW address of the peer is known:
             #  Perform the forwarding
 
+            eth_fwd= event.parsed
             eth_fwd.src= self.my_mac
-            eth_fwd.dst= self.neigh_by_ip[addr_dst]
+            eth_fwd.dst= next_hop_mac
 
             self._packet_send(eth_fwd)
 
         else:
             # The HW address of the peer is not known:
-            #  Kick of an ARP request and store the packet in
-            #  a queue to be processed when the address is known.
+            #  Store the packet in a queue to be processed when
+            #  the address is known. The queue takes care of
+            #  kicking off the ARP request if required.
 
-            arp_out= Arp(
-                hwsrc= self.my_mac, hwdst= addresses.EthAddr("ff:ff:ff:ff:ff:ff"),
-                opcode= Arp.REQUEST,
-                protosrc= self.my_ip, protodst= ip_fwd.dstip
-            )
+            if not self.arp_queue.enqueue(next_hop, event):
+                log.debug('ARP queue full, dropping packet to {}'.format(next_hop))
 
-            eth_out= Ethernet(
-                dst= addresses.EthAddr("ff:ff:ff:ff:ff:ff"), src= self.my_mac,
-                type= Ethernet.ARP_TYPE, next= arp_out
-            )
+    def arp_request_send(self, next_hop):
+        'Broadcast an ARP request for the HW address of next_hop'
 
-            self._packet_send(eth_out)
-            self.packet_queue.append(event)
+        arp_out= Arp(
+            hwsrc= self.my_mac, hwdst= addresses.EthAddr("ff:ff:ff:ff:ff:ff"),
+            opcode= Arp.REQUEST,
+            protosrc= self.my_ip, protodst= next_hop
+        )
 
-        return True
+        eth_out= Ethernet(
+            dst= addresses.EthAddr("ff:ff:ff:ff:ff:ff"), src= self.my_mac,
+            type= Ethernet.ARP_TYPE, next= arp_out
+        )
 
-    def _learn_neighbour(self, neigh_ip, neigh_mac):
-        'Add an IP->MAC mapping and send out enqueued packets'
+        self._packet_send(eth_out)
 
-        if neigh_ip not in self.neigh_by_ip:
-            self.neigh_by_ip[neigh_ip]= neigh_mac
+    def _arp_probe_send(self, neigh_ip, neigh_mac):
+        'Ask a known neighbour to confirm its HW address using unicast ARP'
 
-            packet_queue_old= self.packet_queue
-            self.packet_queue= list()
+        arp_out= Arp(
+            hwsrc= self.my_mac, hwdst= neigh_mac,
+            opcode= Arp.REQUEST,
+            protosrc= self.my_ip, protodst= neigh_ip
+        )
 
-            for packet in packet_queue_old:
-                self.packet_forward(packet)
+        eth_out= Ethernet(
+            dst= neigh_mac, src= self.my_mac,
+            type= Ethernet.ARP_TYPE, next= arp_out
+        )
+
+        self._packet_send(eth_out)
+
+    def expire(self):
+        '''
+        Retry or give up on unanswered ARP requests and
+        advance the neighbour states
+        '''
+
+        for next_hop in self.arp_queue.expire():
+            log.debug('No ARP reply from {}, dropping queued packets'.format(next_hop))
+
+            self.backbone.next_hop_failed(self.my_ofport, next_hop)
+
+        self.neighbours.expire()
+
+    def _neighbour_removed(self, neigh_ip, failed):
+        '''
+        Called when a neighbour is forgotten or changes its
+        HW address. The flow rules that rewrite packets to the
+        old HW address have to go.
+        '''
+
+        log.debug('Neighbour {} removed'.format(neigh_ip))
+
+        self.backbone.flows_remove((self.my_ofport, neigh_ip))
+
+        if failed:
+            self.backbone.next_hop_failed(self.my_ofport, neigh_ip)
+
+    def neighbour_idle(self, neigh_ip):
+        'Called when the last flow rule towards a neighbour was removed'
+
+        self.neighbours.idle(neigh_ip)
+
+    def _learn_neighbour(self, neigh_ip, neigh_mac):
+        'Add or refresh an IP->MAC mapping and send out packets enqueued for it'
+
+        self.neighbours.confirm(neigh_ip, neigh_mac)
+        self.backbone.next_hop_confirmed(self.my_ofport, neigh_ip)
+
+        for packet in self.arp_queue.resolved(neigh_ip):
+            self.packet_forward(packet, neigh_ip)
 
     def _on_arp_recv(self, event):
         'Handle incoming ARP packets'
@@ -177,6 +352,11 @@ class RouterPort(object):
 
             self._packet_send(eth_out)
 
+            # Requests from known neighbours confirm their
+            # mappings just as well as replies do.
+            if arp_in.protosrc in self.neighbours:
+                self._learn_neighbour(arp_in.protosrc, arp_in.hwsrc)
+
         elif arp_in.opcode == Arp.REPLY:
             # Handle responses to my requests
 
@@ -197,8 +377,7 @@ class RouterPort(object):
         if (eth_in.dst != self.my_mac):
             return
 
-        self.backbone.rule_build(event)
-        self.backbone.packet_forward(event)
+        self.backbone.ip_forward(event)
 
     def on_packet_recv(self, event):
         '''
@@ -220,25 +399,181 @@ class RouterPort(object):
 
 
 class RouterBackplane(object):
-    def __init__(self, connection):
+    def __init__(self, connection, config):
         self.connection= connection
 
         # Tell Pox to use methods in this class as callbacks
         # (At the moment only _handle_PacketIn).
         connection.addListeners(self)
 
-        self.ports= {
-            1 : RouterPort(self, '10.0.1.1', '255.255.255.0', '00:00:00:00:11:01', 1),
-            2 : RouterPort(self, '10.0.2.1', '255.255.255.0', '00:00:00:00:11:02', 2),
-            3 : RouterPort(self, '10.0.3.1', '255.255.255.0', '00:00:00:00:11:03', 3),
-        }
+        self.ports= dict()
 
-    def flow_mod(self, match, actions):
+        for port_cfg in config['ports']:
+            port= RouterPort(
+                self,
+                port_cfg['ip'], port_cfg['netmask'],
+                port_cfg['mac'], port_cfg['ofport'],
+                config
+            )
+
+            self.ports[port.my_ofport]= port
+
+        self.routes= RoutingTable()
+
+        # Next hops of static routes, by (ofport, gateway IP)
+        self.next_hops= dict()
+
+        # Flow rules installed on the switch, by flow_key() and
+        # by the (ofport, next hop IP) neighbour they forward to.
+        self.flows= dict()
+        self.flows_by_neigh= dict()
+
+        # The subnets attached to the router ports have to
+        # be known first as they are used to find the egress
+        # ports of the static routes.
+        for port in self.ports.values():
+            self.routes.add(port.connected_route())
+
+        for route_cfg in config.get('routes', list()):
+            gateways= list(route_cfg.get('gateways', list()))
+
+            if 'gateway' in route_cfg:
+                gateways.append(route_cfg['gateway'])
+
+            self.route_add(route_cfg['prefix'], gateways)
+
+        for route in self.routes.routes():
+            log.debug('Route {}'.format(route))
+
+        self.arp_timer= Timer(ARP_TICK, self._on_arp_tick, recurring= True)
+
+    def _on_arp_tick(self):
+        '''
+        Periodically called to handle unanswered ARP requests,
+        old neighbours and gateways that stopped answering
+        '''
+
+        for port in self.ports.values():
+            port.expire()
+
+        now= time.time()
+
+        for hop in self.next_hops.values():
+            if not hop.alive and hop.retry_at <= now:
+                hop.retry_at= now + NEXT_HOP_RETRY
+                hop.port.arp_request_send(hop.gateway)
+
+    def route_add(self, prefix, gateways):
+        '''
+        Add a static route for a prefix in CIDR notation.
+
+        Traffic is spread across the list of gateways, which
+        have to be reachable via one of the directly connected
+        subnets.
+        '''
+
+        (network, prefix_len)= addresses.parse_cidr(prefix, infer= False)
+        next_hops= list()
+
+        for gateway in gateways:
+            gateway= addresses.IPAddr(gateway)
+            via= self.routes.lookup(gateway)
+
+            if via is None or not via.is_connected:
+                log.error('Gateway {} for {} is not directly connected'.format(
+                    gateway, prefix)
+                )
+
+                return False
+
+            port= via.next_hops[0].port
+            key= (port.my_ofport, gateway)
+
+            if key not in self.next_hops:
+                self.next_hops[key]= NextHop(port, gateway)
+
+            next_hops.append(self.next_hops[key])
+
+        if not next_hops:
+            log.error('No gateway given for {}'.format(prefix))
+
+            return False
+
+        self.routes.add(Route(network, prefix_len, next_hops))
+
+        return True
+
+    def next_hop_failed(self, ofport, ip):
+        '''
+        Take a gateway that did not answer ARP requests out of
+        the multipath routes using it
+        '''
+
+        hop= self.next_hops.get((ofport, ip))
+
+        if hop is not None and hop.alive:
+            log.info('Gateway {} on ofport {} is dead'.format(ip, ofport))
+
+            hop.alive= False
+            hop.retry_at= time.time() + NEXT_HOP_RETRY
+
+    def next_hop_confirmed(self, ofport, ip):
+        'Put a gateway that answered ARP requests back into use'
+
+        hop= self.next_hops.get((ofport, ip))
+
+        if hop is not None and not hop.alive:
+            log.info('Gateway {} on ofport {} is back'.format(ip, ofport))
+
+            hop.alive= True
+
+    def flow_mod(self, match, actions, **kw):
         'Inject a new flow modification rule into the forwarding device'
 
-        msg = of.ofp_flow_mod(match=match, actions=actions)
+        msg = of.ofp_flow_mod(match=match, actions=actions, **kw)
         self.connection.send(msg)
 
+    def flow_install(self, neigh, match, actions, priority,
+                     idle_timeout= 0, hard_timeout= 0, buffer_id= None):
+        '''
+        Install a flow rule that forwards packets to the
+        neighbour neigh unless it is already installed.
+
+        The switch is asked to report the removal of the rule
+        so it can be re-installed when needed again.
+
+        Returns True if the rule was installed and applied to
+        the packet buffered by the switch as buffer_id.
+        '''
+
+        key= flow_key(match)
+
+        if key in self.flows:
+            return False
+
+        self.flow_mod(
+            match, actions,
+            priority= priority,
+            idle_timeout= idle_timeout, hard_timeout= hard_timeout,
+            flags= of.OFPFF_SEND_FLOW_REM, buffer_id= buffer_id
+        )
+
+        self.flows[key]= neigh
+        self.flows_by_neigh.setdefault(neigh, dict())[key]= (match, priority)
+
+        return buffer_id is not None
+
+    def flows_remove(self, neigh):
+        'Remove all flow rules that forward packets to the neighbour neigh'
+
+        for (key, (match, priority)) in self.flows_by_neigh.pop(neigh, dict()).items():
+            del self.flows[key]
+
+            self.flow_mod(
+                match, list(),
+                command= of.OFPFC_DELETE_STRICT, priority= priority
+            )
+
     def packet_send(self, packet, ofport):
         '''
         Tell the forwarding device to output an ethernet
@@ -249,38 +584,49 @@ class RouterBackplane(object):
         msg= of.ofp_packet_out(data=packet, action=action)
         self.connection.send(msg)
 
-    def packet_forward(self, event):
+    def packet_release(self, packet_in, actions):
         '''
-        Take an ethernet frame and ask all of the router
-        ports to forward it to its destination.
-
-        Only the port responsible for the respective
-        destination subnet should actually do anything here.
+        Tell the forwarding device to apply actions to a packet
+        it buffered instead of sending the whole packet back
         '''
 
-        success= any(
-            port.packet_forward(event)
-            for (ofid, port) in self.ports.items()
+        msg= of.ofp_packet_out(
+            buffer_id= packet_in.buffer_id, in_port= packet_in.in_port,
+            actions= actions
         )
+        self.connection.send(msg)
 
-        return success
-
-    def rule_build(self, event):
+    def ip_forward(self, event):
         '''
-        Take an ethernet frame and ask all of the router
-        ports to create a flow rule that automates the required
-        packet forwarding.
+        Look up the route for the IP packet in event and ask the
+        egress router port to create a flow rule that automates
+        the required forwarding and to forward the packet itself.
 
-        Only the port responsible for the respective
-        destination subnet should actually do anything here.
+        Returns False if there is no route to the destination.
         '''
 
-        success= any(
-            port.rule_build(event)
-            for (ofid, port) in self.ports.items()
-        )
+        ippkg= event.parsed.payload
+        route= self.routes.lookup(ippkg.dstip)
+
+        if route is None:
+            log.debug('No route to {}'.format(ippkg.dstip))
+
+            return False
+
+        if route.is_multipath:
+            hop= route.select(flow_hash(ippkg))
 
-        return success
+        else:
+            hop= route.select()
+
+        next_hop= hop.ip(ippkg.dstip)
+
+        # If the switch buffered the packet the new flow rule takes
+        # care of it, otherwise it has to be forwarded manually.
+        if not hop.port.rule_build(event, route, next_hop):
+            hop.port.packet_forward(event, next_hop)
+
+        return True
 
     def on_packet_recv(self, event):
         'Called upon reception of a valid openflow packet'
@@ -290,6 +636,29 @@ class RouterBackplane(object):
         port= self.ports[event.port]
         port.on_packet_recv(event)
 
+    def _handle_ConnectionDown (self, event):
+        'The callback called by Pox when the switch disconnects'
+
+        self.arp_timer.cancel()
+
+    def _handle_FlowRemoved (self, event):
+        '''
+        The callback called by Pox when a flow rule timed out
+        or was deleted
+        '''
+
+        key= flow_key(event.ofp.match)
+        neigh= self.flows.pop(key, None)
+
+        if neigh is not None:
+            self.flows_by_neigh[neigh].pop(key, None)
+
+            if not self.flows_by_neigh[neigh]:
+                del self.flows_by_neigh[neigh]
+
+                (ofport, neigh_ip)= neigh
+                self.ports[ofport].neighbour_idle(neigh_ip)
+
     def _handle_PacketIn (self, event):
         '''
         The callback called by Pox upon reception of
@@ -306,14 +675,22 @@ class RouterBackplane(object):
         # in order to not look like idiots.
         self.on_packet_recv(event)
 
-def launch ():
-    'Setup function called by Pox'
+def launch (config= os.path.join(os.path.dirname(__file__), 'router.json')):
+    '''
+    Setup function called by Pox
+
+    The router ports and static routes are read from
+    the JSON file passed in using --config=<file>.
+    '''
+
+    with open(config) as fd:
+        router_config= json.load(fd)
 
     def start_router (event):
         log.debug("Controlling %s" % (event.connection,))
 
         # Run a RouterBackplane instance for every incoming
         # openflow connection
-        RouterBackplane(event.connection)
+        RouterBackplane(event.connection, router_config)
 
     Core.openflow.addListenerByName("ConnectionUp", start_router)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import heapq
+import time
+
+REACHABLE= 'reachable'
+STALE= 'stale'
+PROBE= 'probe'
+
+class Neighbour(object):
+    __slots__= (
+        'ip', 'mac', 'state', 'in_use',
+        'deadline', 'timer_at', 'probes_sent'
+    )
+
+    def __init__(self, ip, mac):
+        self.ip= ip
+        self.mac= mac
+        self.state= REACHABLE
+        self.in_use= False
+        self.deadline= 0
+        self.timer_at= None
+        self.probes_sent= 0
+
+class NeighbourCache(object):
+    '''
+    IP->MAC mappings of the hosts attached to a router port.
+
+    Entries go through the following states:
+
+     reachable: The mapping was confirmed less than reachable_time
+                seconds ago.
+     stale:     The mapping was not confirmed in a while and nothing
+                was forwarded to it either. Stale entries are still
+                used but forgotten after stale_time seconds.
+     probe:     The mapping is in use but was not confirmed in a
+                while. Up to max_probes unicast ARP requests are sent
+                to the known MAC before the entry is forgotten.
+
+    The cache holds at most max_entries entries, when it is full
+    the least recently used entry is evicted.
+    '''
+
+    def __init__(self, probe_send, on_remove,
+                 reachable_time= 30, stale_time= 300,
+                 probe_interval= 1.0, max_probes= 3,
+                 max_entries= 1024):
+
+        # Callback that sends a unicast ARP request to (ip, mac)
+        self.probe_send= probe_send
+
+        # Callback called with the IP of entries that are
+        # forgotten or whose MAC changed and whether that is
+        # because the neighbour stopped answering.
+        self.on_remove= on_remove
+
+        self.reachable_time= reachable_time
+        self.stale_time= stale_time
+        self.probe_interval= probe_interval
+        self.max_probes= max_probes
+        self.max_entries= max_entries
+
+        # Entries in least recently used first order
+        self.entries= collections.OrderedDict()
+
+        # Heap of (time, ip) tuples. There is at most one live
+        # timer per entry, firing at or before its deadline.
+        self.timers= list()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, ip):
+        return ip in self.entries
+
+    def _touch(self, entry):
+        'Mark an entry as most recently used'
+
+        del self.entries[entry.ip]
+        self.entries[entry.ip]= entry
+
+    def _schedule(self, entry, state, timeout, now):
+        entry.state= state
+        entry.deadline= now + timeout
+
+        # Deadlines that are pushed back are handled when the
+        # pending timer fires, which keeps the heap small
+        # when entries are refreshed frequently.
+        if entry.timer_at is None or entry.timer_at > entry.deadline:
+            entry.timer_at= entry.deadline
+
+            heapq.heappush(self.timers, (entry.timer_at, entry.ip))
+
+    def _remove(self, entry, failed= False):
+        del self.entries[entry.ip]
+
+        self.on_remove(entry.ip, failed)
+
+    def lookup(self, ip, now= None):
+        '''
+        Return the MAC for ip or None if it is not known.
+
+        Lookups are used to tell the entries that traffic is
+        forwarded to apart from the ones that are not used anymore.
+        '''
+
+        entry= self.entries.get(ip)
+
+        if entry is None:
+            return None
+
+        entry.in_use= True
+        self._touch(entry)
+
+        if entry.state == STALE:
+            now= time.time() if now is None else now
+
+            self._probe_start(entry, now)
+
+        return entry.mac
+
+    def confirm(self, ip, mac, now= None):
+        '''
+        Add or refresh the mapping ip->mac after hearing from
+        the neighbour.
+
+        Flows that were set up for a previous MAC of the
+        neighbour are removed using the on_remove callback.
+        '''
+
+        now= time.time() if now is None else now
+        entry= self.entries.get(ip)
+
+        if entry is None:
+            if len(self.entries) >= self.max_entries:
+                self._remove(next(iter(self.entries.values())))
+
+            entry= self.entries[ip]= Neighbour(ip, mac)
+
+        else:
+            self._touch(entry)
+
+            if entry.mac != mac:
+                self.on_remove(ip, False)
+                entry.mac= mac
+
+        entry.probes_sent= 0
+
+        self._schedule(entry, REACHABLE, self.reachable_time, now)
+
+    def idle(self, ip):
+        'Mark the neighbour as not being used for forwarding anymore'
+
+        entry= self.entries.get(ip)
+
+        if entry is not None:
+            entry.in_use= False
+
+    def _probe_start(self, entry, now):
+        entry.probes_sent= 1
+
+        self._schedule(entry, PROBE, self.probe_interval, now)
+        self.probe_send(entry.ip, entry.mac)
+
+    def _expire_entry(self, entry, now):
+        if entry.state == REACHABLE:
+            if entry.in_use:
+                # Re-confirm the mapping before it expires
+                # as traffic relies on it.
+                self._probe_start(entry, now)
+
+            else:
+                self._schedule(entry, STALE, self.stale_time, now)
+
+        elif entry.state == PROBE and entry.probes_sent < self.max_probes:
+            entry.probes_sent+= 1
+
+            self._schedule(entry, PROBE, self.probe_interval, now)
+            self.probe_send(entry.ip, entry.mac)
+
+        else:
+            self._remove(entry, entry.state == PROBE)
+
+    def expire(self, now= None):
+        '''
+        Advance the state of entries whose timers ran out.
+        Should be called periodically.
+        '''
+
+        now= time.time() if now is None else now
+
+        while self.timers and self.timers[0][0] <= now:
+            (timer_at, ip)= heapq.heappop(self.timers)
+            entry= self.entries.get(ip)
+
+            if entry is None or entry.timer_at != timer_at:
+                continue
+
+            entry.timer_at= None
+
+            if entry.deadline > now:
+                entry.timer_at= entry.deadline
+
+                heapq.heappush(self.timers, (entry.timer_at, entry.ip))
+
+            else:
+                self._expire_entry(entry, now)
@@ -25,12 +25,12 @@ does (mostly) work. :)
 
 Depends on openflow.discovery
 Works with openflow.spanning_tree
+Works with openflow.shard, hosts and paths then span all workers
 """
 
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 from pox.lib.revent import *
-from pox.lib.recoco import Timer
 from collections import defaultdict
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpid_to_str
@@ -50,9 +50,6 @@ mac_map = {}
 # [sw1][sw2] -> (distance, intermediate)
 path_map = defaultdict(lambda:defaultdict(lambda:(None,None)))
 
-# Waiting path.  (dpid,xid)->WaitingPath
-waiting_paths = {}
-
 # Time to not flood in seconds
 FLOOD_HOLDDOWN = 5
 
@@ -64,6 +61,25 @@ FLOW_HARD_TIMEOUT = 30
 PATH_SETUP_TIME = 4
 
 
+def _get_switch (dpid):
+  """
+  Get the Switch for a DPID, which may belong to another shard
+  """
+  sw = switches.get(dpid)
+  if sw is None:
+    sw = Switch()
+    sw.dpid = dpid
+    switches[dpid] = sw
+  return sw
+
+
+def _learn (mac, loc):
+  mac_map[mac] = loc # Learn position for ethaddr
+  log.debug("Learned %s at %s.%i", mac, loc[0], loc[1])
+  if core.hasComponent('openflow_shard'):
+    core.openflow_shard.announce_host(mac, loc[0].dpid, loc[1])
+
+
 def _calc_paths ():
   """
   Essentially Floyd-Warshall algorithm
@@ -167,33 +183,31 @@ class WaitingPath (object):
   """
   def __init__ (self, path, packet):
     """
-    xids is a sequence of (dpid,xid)
     first_switch is the DPID where the packet came from
     packet is something that can be sent in a packet_out
     """
-    self.expires_at = time.time() + PATH_SETUP_TIME
     self.path = path
     self.first_switch = path[0][0].dpid
-    self.xids = set()
+    self.waiting = 0
+    self.failed = False
     self.packet = packet
 
-    if len(waiting_paths) > 1000:
-      WaitingPath.expire_waiting_paths()
-
-  def add_xid (self, dpid, xid):
-    self.xids.add((dpid,xid))
-    waiting_paths[(dpid,xid)] = self
+  def add_barrier (self, transaction):
+    self.waiting += 1
+    transaction.add_callback(self.notify)
 
-  @property
-  def is_expired (self):
-    return time.time() >= self.expires_at
-
-  def notify (self, event):
+  def notify (self, transaction):
     """
-    Called when a barrier has been received
+    Called when a barrier has been received (or not)
     """
-    self.xids.discard((event.dpid,event.xid))
-    if len(self.xids) == 0:
+    if self.failed: return
+    if not transaction.ok:
+      self.failed = True
+      log.error("Path failed to install on %s (%s)", transaction.connection,
+                transaction.state)
+      return
+    self.waiting -= 1
+    if self.waiting == 0:
       # Done!
       if self.packet:
         log.debug("Sending delayed packet out %s"
@@ -205,19 +219,6 @@ class WaitingPath (object):
       core.l2_multi.raiseEvent(PathInstalled(self.path))
 
 
-  @staticmethod
-  def expire_waiting_paths ():
-    packets = set(waiting_paths.values())
-    killed = 0
-    for p in packets:
-      if p.is_expired:
-        killed += 1
-        for entry in p.xids:
-          waiting_paths.pop(entry, None)
-    if killed:
-      log.error("%i paths failed to install" % (killed,))
-
-
 class PathInstalled (Event):
   """
   Fired when a path is installed
@@ -246,15 +247,17 @@ class Switch (EventMixin):
     msg.hard_timeout = FLOW_HARD_TIMEOUT
     msg.actions.append(of.ofp_action_output(port = out_port))
     msg.buffer_id = buf
-    switch.connection.send(msg)
+    core.openflow.sendToDPID(switch.dpid, msg)
 
   def _install_path (self, p, match, packet_in=None):
     wp = WaitingPath(p, packet_in)
     for sw,in_port,out_port in p:
       self._install(sw, in_port, out_port, match)
-      msg = of.ofp_barrier_request()
-      sw.connection.send(msg)
-      wp.add_xid(sw.dpid,msg.xid)
+      if sw.connection is None:
+        # Switch of another shard, we'll just assume that will work
+        continue
+      wp.add_barrier(sw.connection.request(of.ofp_barrier_request(),
+                                           timeout = PATH_SETUP_TIME))
 
   def install_path (self, dst_sw, last_port, match, event):
     """
@@ -344,8 +347,7 @@ class Switch (EventMixin):
 
     if oldloc is None:
       if packet.src.is_multicast == False:
-        mac_map[packet.src] = loc # Learn position for ethaddr
-        log.debug("Learned %s at %s.%i", packet.src, loc[0], loc[1])
+        _learn(packet.src, loc)
     elif oldloc != loc:
       # ethaddr seen at different place!
       if core.openflow_discovery.is_edge_port(loc[0].dpid, loc[1]):
@@ -354,8 +356,7 @@ class Switch (EventMixin):
                   dpid_to_str(oldloc[0].dpid), oldloc[1],
                   dpid_to_str(   loc[0].dpid),    loc[1])
         if packet.src.is_multicast == False:
-          mac_map[packet.src] = loc # Learn position for ethaddr
-          log.debug("Learned %s at %s.%i", packet.src, loc[0], loc[1])
+          _learn(packet.src, loc)
       elif packet.dst.is_multicast == False:
         # New place is a switch-to-switch port!
         # Hopefully, this is a packet we're flooding because we didn't
@@ -425,6 +426,8 @@ class l2_multi (EventMixin):
     def startup ():
       core.openflow.addListeners(self, priority=0)
       core.openflow_discovery.addListeners(self)
+      if core.hasComponent('openflow_shard'):
+        core.openflow_shard.addListeners(self)
     core.call_when_ready(startup, ('openflow','openflow_discovery'))
 
   def _handle_LinkEvent (self, event):
@@ -432,8 +435,8 @@ class l2_multi (EventMixin):
       return Discovery.Link(link[2],link[3], link[0],link[1])
 
     l = event.link
-    sw1 = switches[l.dpid1]
-    sw2 = switches[l.dpid2]
+    sw1 = _get_switch(l.dpid1)
+    sw2 = _get_switch(l.dpid2)
 
     # Invalidate all flows and path info.
     # For link adds, this makes sure that if a new link leads to an
@@ -493,17 +496,14 @@ class l2_multi (EventMixin):
     else:
       sw.connect(event.connection)
 
-  def _handle_BarrierIn (self, event):
-    wp = waiting_paths.pop((event.dpid,event.xid), None)
-    if not wp:
-      #log.info("No waiting packet %s,%s", event.dpid, event.xid)
-      return
-    #log.debug("Notify waiting packet %s,%s", event.dpid, event.xid)
-    wp.notify(event)
+  def _handle_HostMove (self, event):
+    # Another shard saw the host, the path to it is worked out here
+    loc = (_get_switch(event.dpid), event.port)
+    if mac_map.get(event.mac) != loc:
+      mac_map[event.mac] = loc
+      log.debug("Learned %s at %s.%i from another shard", event.mac,
+                loc[0], loc[1])
 
 
 def launch ():
   core.registerNew(l2_multi)
-
-  timeout = min(max(PATH_SETUP_TIME, 5) * 2, 15)
-  Timer(timeout, WaitingPath.expire_waiting_paths, recurring=True)
@@ -20,6 +20,7 @@ each pair of L2 addresses.
 # These next two imports are common POX convention
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
+from pox.openflow.templates import FlowModTemplate
 
 
 # Even a simple usage of the logger is much nicer than print!
@@ -39,6 +40,11 @@ table = {}
 all_ports = of.OFPP_FLOOD
 
 
+# The flow_mods we install only differ in the addresses and the port,
+# so they are packed once and just patched for every pair.
+pair_flow = FlowModTemplate(fields = ('dl_src', 'dl_dst'), output = True)
+
+
 # Handle messages the switch has sent us because it has no
 # matching rule.
 def _handle_PacketIn (event):
@@ -59,20 +65,16 @@ def _handle_PacketIn (event):
   else:
     # Since we know the switch ports for both the source and dest
     # MACs, we can install rules for both directions.
-    msg = of.ofp_flow_mod()
-    msg.match.dl_dst = packet.src
-    msg.match.dl_src = packet.dst
-    msg.actions.append(of.ofp_action_output(port = event.port))
-    event.connection.send(msg)
-    
+    event.connection.send(pair_flow.pack(dl_src = packet.dst,
+                                         dl_dst = packet.src,
+                                         port = event.port))
+
     # This is the packet that just came in -- we want to
     # install the rule and also resend the packet.
-    msg = of.ofp_flow_mod()
-    msg.data = event.ofp # Forward the incoming packet
-    msg.match.dl_src = packet.src
-    msg.match.dl_dst = packet.dst
-    msg.actions.append(of.ofp_action_output(port = dst_port))
-    event.connection.send(msg)
+    event.connection.send(pair_flow.pack(dl_src = packet.src,
+                                         dl_dst = packet.dst,
+                                         port = dst_port,
+                                         data = event.ofp))
 
     log.debug("Installing %s <-> %s" % (packet.src, packet.dst))
 
@@ -163,6 +163,44 @@ class DefaultDict (collections.defaultdict):
     return v
 
 
+class Samples (object):
+  """
+  Keeps the count, sum and maximum of all values and the latest of them
+
+  Only the latest maxlen values are kept (all of them if maxlen is None),
+  so percentiles are over those, while the mean is over all values.
+  """
+  def __init__ (self, maxlen = 4096):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+    self.values = collections.deque(maxlen = maxlen)
+
+  def add (self, value):
+    self.count += 1
+    self.total += value
+    self.max = max(self.max, value)
+    self.values.append(value)
+
+  def percentile (self, p, last = None):
+    """
+    Returns the value p percent of the kept values are below
+
+    With last, only the last that many values are looked at.
+    """
+    values = self.values
+    if last is not None:
+      values = list(values)[-last:]
+    if not values:
+      return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+  @property
+  def mean (self):
+    return self.total / self.count if self.count else None
+
+
 def set_extend (l, index, item, emptyValue = None):
   """
   Sets l[index] = item, padding l if needed
@@ -29,6 +29,10 @@ difficult, really, but that hasn't stopped it from beind handled wrong
 wrong more than once).  In POX, the raw events are available, but you will
 generally just want to listen to the aggregate stats events which take
 care of this for you and are only fired when all data is available.
+Replies to huge requests (say, the flow stats of a switch with 100k flows)
+can instead be streamed: for the stats types in Connection.stream_stats,
+a StatsPartReceived is fired for every part as it arrives, and a
+StatsStreamComplete after the last one.
 
 NOTE: This module is usually automatically loaded by pox.py
 """
@@ -158,6 +162,45 @@ class PortStatsReceived (StatsReply):
 class QueueStatsReceived (StatsReply):
   pass
 
+class StatsPartReceived (StatsReply):
+  """
+  Fired for every part of a streamed stats reply
+
+  ofp is the ofp_stats_reply part, stats its body (e.g., a list of
+  ofp_flow_stats).  The parts of a reply are not kept around.
+  """
+  @property
+  def xid (self):
+    return self.ofp.xid
+
+  @property
+  def type (self):
+    return self.ofp.type
+
+  @property
+  def is_last_reply (self):
+    return self.ofp.is_last_reply
+
+class StatsStreamComplete (Event):
+  """
+  Fired after the last part of a streamed stats reply
+  xid (int) - xid of the request
+  type (int) - OFPST_xxx stats type
+  parts (int) - number of parts the reply came in
+  count (int) - number of entries in all of the parts together
+  """
+  def __init__ (self, connection, xid, type, parts, count):
+    Event.__init__(self)
+    self.connection = connection
+    self.xid = xid
+    self.type = type
+    self.parts = parts
+    self.count = count
+
+  @property
+  def dpid (self):
+    return self.connection.dpid
+
 class PacketIn (Event):
   """
   Fired in response to PacketIn events
@@ -170,10 +213,15 @@ class PacketIn (Event):
     self.connection = connection
     self.ofp = ofp
     self.port = ofp.in_port
-    self.data = ofp.data
     self._parsed = None
     self.dpid = connection.dpid
 
+  @property
+  def data (self):
+    # Not copied in __init__ so that packet-ins nobody looks at do not
+    # have to be unpacked
+    return self.ofp.data
+
   def parse (self):
     if self._parsed is None:
       self._parsed = ethernet(self.data)
@@ -186,6 +234,21 @@ class PacketIn (Event):
     """
     return self.parse()
 
+class PacketInShedding (Event):
+  """
+  Fired when packet-ins from a switch start or stop being shed
+  port (int) - the port that is shed, None if it is the whole switch
+  started (bool) - True if shedding started, False if it stopped
+  rate (float) - packet-ins per second the switch sent recently
+  """
+  def __init__ (self, connection, port, started, rate = None):
+    Event.__init__(self)
+    self.connection = connection
+    self.dpid = connection.dpid
+    self.port = port
+    self.started = started
+    self.rate = rate
+
 class ErrorIn (Event):
   def __init__ (self, connection, ofp):
     Event.__init__(self)
@@ -277,6 +340,25 @@ class OpenFlowConnectionArbiter (EventMixin):
       e.nexus = self._fallback
     return e.nexus
 
+  def fixed_nexus (self):
+    """
+    Returns the nexus every switch gets, or None if it is not known
+
+    It is only known before a switch's features are in if nobody picks
+    the nexus by switch, i.e., there are no ConnectionIn listeners.
+    """
+    if getattr(type(self).getNexus, '__func__', None) is not \
+        OpenFlowConnectionArbiter.getNexus.__func__:
+      return None
+    if getattr(self, '_eventMixin_handlers', {}).get(ConnectionIn):
+      return None
+    if self._default is not False:
+      return self._default
+    if self._fallback is not None:
+      return self._fallback
+    from pox.core import core
+    return getattr(core, 'openflow', None)
+
 
 class ConnectionDict (dict):
   def __iter__ (self):
@@ -310,6 +392,7 @@ class OpenFlowNexus (EventMixin):
     PortStatus,
     FlowRemoved,
     PacketIn,
+    PacketInShedding,
     BarrierIn,
     ErrorIn,
     RawStatsReply,
@@ -319,6 +402,8 @@ class OpenFlowNexus (EventMixin):
     TableStatsReceived,
     PortStatsReceived,
     QueueStatsReceived,
+    StatsPartReceived,
+    StatsStreamComplete,
     FlowRemoved,
   ])
 
@@ -328,6 +413,9 @@ class OpenFlowNexus (EventMixin):
   # Enable/Disable clearing of flows on switch connect
   clear_flows_on_connect = True
 
+  # Sends to switches of other controller processes, see openflow.shard
+  forwarder = None
+
   def __init__ (self):
     self._connections = ConnectionDict() # DPID -> Connection
 
@@ -352,6 +440,8 @@ class OpenFlowNexus (EventMixin):
     if dpid in self._connections:
       self._connections[dpid].send(data)
       return True
+    elif self.forwarder is not None and self.forwarder.send(dpid, data):
+      return True
     else:
       import logging
       log = logging.getLogger("openflow")
@@ -409,8 +409,11 @@ class Discovery (EventMixin):
       return EventHalt
 
     if originatorDPID not in core.openflow.connections:
-      log.info('Received LLDP packet from unknown switch')
-      return EventHalt
+      # With openflow.shard, the switch may belong to another worker
+      if not (core.hasComponent('openflow_shard') and
+              not core.openflow_shard.owns(originatorDPID)):
+        log.info('Received LLDP packet from unknown switch')
+        return EventHalt
 
     # Get port number from port TLV
     if lldph.tlvs[1].subtype != pkt.port_id.SUB_PORT:
@@ -101,12 +101,37 @@ def _read (data, offset, length):
   if (len(data)-offset) < length:
     raise UnderrunError("wanted %s bytes but only have %s"
                         % (length, len(data)-offset))
-  return (offset+length, data[offset:offset+length])
+  d = data[offset:offset+length]
+  if type(d) is memoryview:
+    # Connections unpack from a view of their receive buffer, which
+    # gets reused, so fields must not keep referencing it.
+    d = d.tobytes()
+  return (offset+length, d)
+
+_structs = {}
+
+def _struct (fmt):
+  """
+  Returns a precompiled struct.Struct for a format string
+  """
+  s = _structs.get(fmt)
+  if s is None:
+    s = _structs[fmt] = struct.Struct(fmt)
+  return s
 
 def _unpack (fmt, data, offset):
-  size = struct.calcsize(fmt)
+  s = _structs.get(fmt) or _struct(fmt)
+  size = s.size
+  if (len(data)-offset) < size: raise UnderrunError()
+  return (offset+size, s.unpack_from(data, offset))
+
+def _unpack_from (s, data, offset):
+  """
+  Like _unpack(), but with a precompiled struct.Struct
+  """
+  size = s.size
   if (len(data)-offset) < size: raise UnderrunError()
-  return (offset+size, struct.unpack_from(fmt, data, offset))
+  return (offset+size, s.unpack_from(data, offset))
 
 def _skip (data, offset, num):
   offset += num
@@ -134,6 +159,33 @@ def _readip (data, offset, networkOrder = True):
   (offset, d) = _read(data, offset, 4)
   return (offset, IPAddr(d, networkOrder = networkOrder))
 
+# Precompiled wire formats.  The fixed part of the most common messages,
+# including an embedded match, is packed and unpacked with one of these
+# in a single call.
+_MATCH_FORMAT = "LH6s6sHBxHBBxxLLHH"
+_EMPTY_ETH_RAW = EMPTY_ETH.toRaw()
+
+_header_struct = struct.Struct("!BBHL")
+_match_struct = struct.Struct("!" + _MATCH_FORMAT)
+_eth_struct = struct.Struct("!HL") # An EthAddr as two integers
+_packet_in_struct = struct.Struct("!BBHLLHHBx")
+_packet_out_struct = struct.Struct("!BBHLLHH")
+_flow_mod_struct = struct.Struct("!BBHL" + _MATCH_FORMAT + "QHHHHLHH")
+_flow_removed_struct = struct.Struct("!BBHL" + _MATCH_FORMAT
+                                     + "QHBxLLHxxQQ")
+_flow_stats_struct = struct.Struct("!HBx" + _MATCH_FORMAT + "LLHHH6xQQQ")
+_port_stats_struct = struct.Struct("!H6x12Q")
+
+_action_header_struct = struct.Struct("!HH")
+_action_output_struct = struct.Struct("!HHHH")
+_action_enqueue_struct = struct.Struct("!HHH6xL")
+_action_vlan_vid_struct = struct.Struct("!HHH2x")
+_action_byte_struct = struct.Struct("!HHB3x") # vlan_pcp, nw_tos
+_action_dl_addr_struct = struct.Struct("!HH6s6x")
+_action_nw_addr_struct = struct.Struct("!HH4s")
+_action_tp_port_struct = struct.Struct("!HHH2x")
+_action_pad_struct = struct.Struct("!HH4x") # strip_vlan
+
 # ----------------------------------------------------------------------
 
 
@@ -171,6 +223,7 @@ class ofp_base (object):
   attribute to your minimum length.
   """
   __metaclass__ = _ofp_meta
+  __slots__ = () # So that subclasses can do without a __dict__
 
   def _assert (self):
     r = self._validate()
@@ -198,6 +251,57 @@ class ofp_base (object):
     return (r, o)
 
 
+class _lazy_message (object):
+  """
+  Mixin for messages from ofp_header.unpack_lazy() that are not unpacked
+
+  Using any attribute that is not set yet, setting an attribute, or
+  comparing the message unpacks it and turns it into an instance of the
+  actual message class.
+  """
+  def _decode (self):
+    cls = self._unpacked_class
+    packed = self.__dict__.pop('_packed', None)
+    object.__setattr__(self, '__class__', cls)
+    if packed is not None:
+      cls.__init__(self)
+      self.unpack(packed)
+
+  def __getattr__ (self, name):
+    self._decode()
+    return getattr(self, name)
+
+  def __setattr__ (self, name, value):
+    self._decode()
+    setattr(self, name, value)
+
+  def __eq__ (self, other):
+    self._decode()
+    return self == other
+
+  def __len__ (self):
+    self._decode()
+    return len(self)
+
+_lazy_classes = {}
+
+def _lazy_class (cls):
+  """
+  Returns the lazy version of a message class
+  """
+  lazy = _lazy_classes.get(cls)
+  if lazy is None:
+    # The mixin's methods are copied rather than inherited so that the
+    # lazy class has the very same layout as cls, which __class__
+    # assignment requires now that ofp_base has __slots__.
+    d = dict((k,v) for k,v in vars(_lazy_message).iteritems()
+             if k not in ('__dict__', '__weakref__'))
+    d['_unpacked_class'] = cls
+    lazy = type("lazy_" + cls.__name__, (cls,), d)
+    _lazy_classes[cls] = lazy
+  return lazy
+
+
 # ----------------------------------------------------------------------
 # Class decorators
 # ----------------------------------------------------------------------
@@ -565,19 +669,56 @@ class ofp_header (ofp_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!BBHL", self.version, self.header_type,
-        len(self), self.xid)
-    return packed
+    return _header_struct.pack(self.version, self.header_type, len(self),
+                               self.xid)
 
   def unpack (self, raw, offset=0):
     offset,length = self._unpack_header(raw, offset)
     return offset,length
 
   def _unpack_header (self, raw, offset):
-    offset,(self.version, self.header_type, length, self.xid) = \
-        _unpack("!BBHL", raw, offset)
-    return offset,length
+    if (len(raw)-offset) < 8: raise UnderrunError()
+    (self.version, self.header_type, length, self._xid) = \
+        _header_struct.unpack_from(raw, offset)
+    return offset+8,length
+
+  @classmethod
+  def unpack_lazy (cls, raw, offset=0):
+    """
+    Unpacks the header now and the rest of the message on first use
+
+    The message is copied out of raw, so raw may be reused afterwards.
+    Until an attribute other than the header fields (and those set by
+    _unpack_lazy_fields()) is used, the object is an instance of a
+    subclass of cls.  Errors in the body are only raised then.
+
+    Returns newoffset,object like unpack_new().
+    """
+    if (len(raw)-offset) < 8: raise UnderrunError()
+    (version, header_type, length, xid) = \
+        _header_struct.unpack_from(raw, offset)
+    if length < 8: raise UnderrunError()
+    offset,packed = _read(raw, offset, length)
+
+    lazy = _lazy_classes.get(cls)
+    if lazy is None:
+      lazy = _lazy_class(cls)
+    o = object.__new__(lazy)
+    d = o.__dict__
+    d['version'] = version
+    d['header_type'] = header_type
+    d['_xid'] = xid
+    d['_packed'] = packed
+    o._unpack_lazy_fields(packed)
+    return offset,o
+
+  def _unpack_lazy_fields (self, packed):
+    """
+    Sets the fields of a lazily unpacked message that are cheap to get
+
+    Overide this.  Fields must be set through self.__dict__.
+    """
+    pass
 
   def __eq__ (self, other):
     if type(self) != type(other): return False
@@ -918,6 +1059,19 @@ class ofp_queue_prop_min_rate (ofp_base):
 
 ##2.3 Flow Match Structures
 class ofp_match (ofp_base):
+  """
+  A match, as used in flow_mods, flow_removeds, flow stats and so on
+
+  The fields are kept in slots, a field that is wildcarded reads as None
+  and setting a field to None wildcards it.  Matches become immutable
+  once they are hashed or lock() is called, and their hash is cached
+  from then on.
+  """
+  __slots__ = ('_locked', '_hash', '_key', '_wildcards', '_in_port',
+               '_dl_src', '_dl_dst', '_dl_vlan', '_dl_vlan_pcp', '_dl_type',
+               '_nw_tos', '_nw_proto', '_nw_src', '_nw_dst', '_tp_src',
+               '_tp_dst')
+
   adjust_wildcards = True # Set to true to "fix" outgoing wildcards
 
   @classmethod
@@ -990,12 +1144,47 @@ class ofp_match (ofp_base):
     return match
 
   def clone (self):
-    n = ofp_match()
-    for k,v in ofp_match_data.iteritems():
-      setattr(n, '_' + k, getattr(self, '_' + k))
-    n.wildcards = self.wildcards
+    """
+    Returns an unlocked copy of this match
+    """
+    n = ofp_match.__new__(ofp_match)
+    n._locked = False
+    n._hash = None
+    n._key = self._key
+    n._wildcards = self._wildcards
+    n._in_port = self._in_port
+    n._dl_src = self._dl_src
+    n._dl_dst = self._dl_dst
+    n._dl_vlan = self._dl_vlan
+    n._dl_vlan_pcp = self._dl_vlan_pcp
+    n._dl_type = self._dl_type
+    n._nw_tos = self._nw_tos
+    n._nw_proto = self._nw_proto
+    n._nw_src = self._nw_src
+    n._nw_dst = self._nw_dst
+    n._tp_src = self._tp_src
+    n._tp_dst = self._tp_dst
     return n
 
+  def __getstate__ (self):
+    # Needed to pickle with protocols below 2, since there's no __dict__
+    return tuple(getattr(self, k) for k in self.__slots__)
+
+  def __setstate__ (self, state):
+    self._key = None
+    for k,v in zip(self.__slots__, state):
+      setattr(self, k, v)
+
+  def lock (self):
+    """
+    Makes this match immutable
+
+    This also happens when a match is hashed, e.g., used as a dict key.
+    Returns the match itself.
+    """
+    self._locked = True
+    return self
+
   def flip (self, in_port = True):
     """
     Return version of this match with src and dst fields swapped
@@ -1015,55 +1204,88 @@ class ofp_match (ofp_base):
 
   def __init__ (self, **kw):
     self._locked = False
-
-    for k,v in ofp_match_data.iteritems():
-      setattr(self, '_' + k, v[0])
-
-    self.wildcards = self._normalize_wildcards(OFPFW_ALL)
+    self._hash = None
+    self._key = None
+
+    # The defaults from ofp_match_data
+    self._in_port = 0
+    self._dl_src = EMPTY_ETH
+    self._dl_dst = EMPTY_ETH
+    self._dl_vlan = 0
+    self._dl_vlan_pcp = 0
+    self._dl_type = 0
+    self._nw_tos = 0
+    self._nw_proto = 0
+    self._nw_src = 0
+    self._nw_dst = 0
+    self._tp_src = 0
+    self._tp_dst = 0
+
+    self._wildcards = self._normalize_wildcards(OFPFW_ALL)
 
     # This is basically initHelper(), but tweaked slightly since this
     # class does some magic of its own.
     for k,v in kw.iteritems():
-      if not hasattr(self, '_'+k):
+      if k not in ofp_match_data:
         raise TypeError(self.__class__.__name__ + " constructor got "
           + "unexpected keyword argument '" + k + "'")
       setattr(self, k, v)
 
+  @property
+  def wildcards (self):
+    return self._wildcards
+
+  @wildcards.setter
+  def wildcards (self, value):
+    if self._locked:
+      raise AttributeError('match object is locked')
+    self._key = None
+    self._wildcards = value
+
   def get_nw_dst (self):
-    if (self.wildcards & OFPFW_NW_DST_ALL) == OFPFW_NW_DST_ALL:
+    if (self._wildcards & OFPFW_NW_DST_ALL) == OFPFW_NW_DST_ALL:
       return (None, 0)
 
-    w = (self.wildcards & OFPFW_NW_DST_MASK) >> OFPFW_NW_DST_SHIFT
+    w = (self._wildcards & OFPFW_NW_DST_MASK) >> OFPFW_NW_DST_SHIFT
     return (self._nw_dst,32-w if w <= 32 else 0)
 
   def get_nw_src (self):
-    if (self.wildcards & OFPFW_NW_SRC_ALL) == OFPFW_NW_SRC_ALL:
+    if (self._wildcards & OFPFW_NW_SRC_ALL) == OFPFW_NW_SRC_ALL:
       return (None, 0)
 
-    w = (self.wildcards & OFPFW_NW_SRC_MASK) >> OFPFW_NW_SRC_SHIFT
+    w = (self._wildcards & OFPFW_NW_SRC_MASK) >> OFPFW_NW_SRC_SHIFT
     return (self._nw_src,32-w if w <= 32 else 0)
 
   def set_nw_dst (self, *args, **kw):
+    if self._locked:
+      raise AttributeError('match object is locked')
+    self._key = None
     a = self._make_addr(*args, **kw)
     if a is None:
       self._nw_dst = ofp_match_data['nw_dst'][0]
-      self.wildcards &= ~OFPFW_NW_DST_MASK
-      self.wildcards |= ofp_match_data['nw_dst'][1]
+      self._wildcards &= ~OFPFW_NW_DST_MASK
+      self._wildcards |= ofp_match_data['nw_dst'][1]
       return
     self._nw_dst = a[0]
-    self.wildcards &= ~OFPFW_NW_DST_MASK
-    self.wildcards |= ((32-a[1]) << OFPFW_NW_DST_SHIFT)
+    self._wildcards &= ~OFPFW_NW_DST_MASK
+    self._wildcards |= ((32-a[1]) << OFPFW_NW_DST_SHIFT)
 
   def set_nw_src (self, *args, **kw):
+    if self._locked:
+      raise AttributeError('match object is locked')
+    self._key = None
     a = self._make_addr(*args, **kw)
     if a is None:
       self._nw_src = ofp_match_data['nw_src'][0]
-      self.wildcards &= ~OFPFW_NW_SRC_MASK
-      self.wildcards |= ofp_match_data['nw_src'][1]
+      self._wildcards &= ~OFPFW_NW_SRC_MASK
+      self._wildcards |= ofp_match_data['nw_src'][1]
       return
     self._nw_src = a[0]
-    self.wildcards &= ~OFPFW_NW_SRC_MASK
-    self.wildcards |= ((32-a[1]) << OFPFW_NW_SRC_SHIFT)
+    self._wildcards &= ~OFPFW_NW_SRC_MASK
+    self._wildcards |= ((32-a[1]) << OFPFW_NW_SRC_SHIFT)
+
+  nw_dst = property(lambda self: self.get_nw_dst()[0], set_nw_dst)
+  nw_src = property(lambda self: self.get_nw_src()[0], set_nw_src)
 
   def _make_addr (self, ipOrIPAndBits, bits=None):
     if ipOrIPAndBits is None: return None
@@ -1094,44 +1316,6 @@ class ofp_match (ofp_base):
 
     return (ip, b)
 
-  def __setattr__ (self, name, value):
-    if name == '_locked':
-      super(ofp_match,self).__setattr__(name, value)
-      return
-
-    if self._locked:
-      raise AttributeError('match object is locked')
-
-    if name not in ofp_match_data:
-      self.__dict__[name] = value
-      return
-
-    if name == 'nw_dst' or name == 'nw_src':
-      # Special handling
-      getattr(self, 'set_' + name)(value)
-      return value
-
-    if value is None:
-      setattr(self, '_' + name, ofp_match_data[name][0])
-      self.wildcards |= ofp_match_data[name][1]
-    else:
-      setattr(self, '_' + name, value)
-      self.wildcards = self.wildcards & ~ofp_match_data[name][1]
-
-    return value
-
-  def __getattr__ (self, name):
-    if name in ofp_match_data:
-      if ( (self.wildcards & ofp_match_data[name][1])
-           == ofp_match_data[name][1] ):
-        # It's wildcarded -- always return None
-        return None
-      if name == 'nw_dst' or name == 'nw_src':
-        # Special handling
-        return getattr(self, 'get_' + name)()[0]
-      return self.__dict__['_' + name]
-    raise AttributeError("attribute not found: "+name)
-
   def _validate (self):
     # TODO
     return None
@@ -1139,19 +1323,20 @@ class ofp_match (ofp_base):
   def _prereq_warning (self):
     # Only checked when assertions are on
     if not _logger: return True
-    om = self.clone()
-    om.fix()
-
-    if om == self: return True
 
-    msg = "Fields ignored due to unspecified prerequisites: "
-    wcs = []
+    # The fields fix() would clear
+    if self.dl_type == 0x0800:
+      if self.nw_proto in (1,6,17): return True
+      fields = ('tp_src', 'tp_dst')
+    elif self.dl_type == 0x0806:
+      fields = ('nw_tos', 'tp_src', 'tp_dst')
+    else:
+      fields = ('nw_tos', 'nw_proto', 'nw_src', 'nw_dst', 'tp_src', 'tp_dst')
 
-    for name in ofp_match_data.keys():
-      if getattr(self,name) is None: continue
-      if getattr(om,name) is not None: continue
-      wcs.append(name)
+    wcs = [name for name in fields if getattr(self, name) is not None]
+    if not wcs: return True
 
+    msg = "Fields ignored due to unspecified prerequisites: "
     msg = msg + " ".join(wcs)
 
     _log(warn = msg)
@@ -1160,53 +1345,60 @@ class ofp_match (ofp_base):
     return True # Always; we don't actually want an assertion error
 
   def pack (self, flow_mod=False):
+    return _match_struct.pack(*self._wire_values(flow_mod))
+
+  def _wire_values (self, flow_mod=False):
+    """
+    Returns the fields of the wire format as a tuple for _match_struct
+
+    Wildcarded fields and fields that do not apply to the dl_type and
+    nw_proto are zero.
+    """
     assert self._assert()
 
-    packed = b""
+    wildcards = self._wildcards
     if self.adjust_wildcards and flow_mod:
-      wc = self._wire_wildcards(self.wildcards)
+      wc = self._wire_wildcards(wildcards)
       assert self._prereq_warning()
     else:
-      wc = self.wildcards
-    packed += struct.pack("!LH", wc, self.in_port or 0)
-    if self.dl_src is None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_src) is bytes:
-      packed += self.dl_src
-    else:
-      packed += self.dl_src.toRaw()
-    if self.dl_dst is None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_dst) is bytes:
-      packed += self.dl_dst
-    else:
-      packed += self.dl_dst.toRaw()
-
-    def check_ip(val):
-      return (val or 0) if self.dl_type == 0x0800 else 0
-    def check_ip_or_arp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           or self.dl_type == 0x0806 else 0
-    def check_tp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           and self.nw_proto in (1,6,17) else 0
-
-    packed += struct.pack("!HB", self.dl_vlan or 0, self.dl_vlan_pcp or 0)
-    packed += _PAD # Hardcode padding
-    packed += struct.pack("!HBB", self.dl_type or 0,
-        check_ip(self.nw_tos), check_ip_or_arp(self.nw_proto))
-    packed += _PAD2 # Hardcode padding
-    def fix (addr):
+      wc = wildcards
+
+    def ip (addr):
       if addr is None: return 0
       if type(addr) is int: return addr & 0xffFFffFF
       if type(addr) is long: return addr & 0xffFFffFF
       return addr.toUnsigned()
 
-    packed += struct.pack("!LLHH", check_ip_or_arp(fix(self.nw_src)),
-        check_ip_or_arp(fix(self.nw_dst)),
-        check_tp(self.tp_src), check_tp(self.tp_dst))
-
-    return packed
+    dl_src = None if wildcards & OFPFW_DL_SRC else self._dl_src
+    if dl_src is None: dl_src = _EMPTY_ETH_RAW
+    elif type(dl_src) is not bytes: dl_src = dl_src.toRaw()
+    dl_dst = None if wildcards & OFPFW_DL_DST else self._dl_dst
+    if dl_dst is None: dl_dst = _EMPTY_ETH_RAW
+    elif type(dl_dst) is not bytes: dl_dst = dl_dst.toRaw()
+
+    dl_type = 0 if wildcards & OFPFW_DL_TYPE else (self._dl_type or 0)
+    nw_tos = nw_proto = nw_src = nw_dst = tp_src = tp_dst = 0
+    if dl_type == 0x0800 or dl_type == 0x0806:
+      if not wildcards & OFPFW_NW_PROTO:
+        nw_proto = self._nw_proto or 0
+      if (wildcards & OFPFW_NW_SRC_ALL) != OFPFW_NW_SRC_ALL:
+        nw_src = ip(self._nw_src)
+      if (wildcards & OFPFW_NW_DST_ALL) != OFPFW_NW_DST_ALL:
+        nw_dst = ip(self._nw_dst)
+      if dl_type == 0x0800:
+        if not wildcards & OFPFW_NW_TOS:
+          nw_tos = self._nw_tos or 0
+        if nw_proto in (1,6,17):
+          if not wildcards & OFPFW_TP_SRC:
+            tp_src = self._tp_src or 0
+          if not wildcards & OFPFW_TP_DST:
+            tp_dst = self._tp_dst or 0
+
+    return (wc, 0 if wildcards & OFPFW_IN_PORT else (self._in_port or 0),
+            dl_src, dl_dst,
+            0 if wildcards & OFPFW_DL_VLAN else (self._dl_vlan or 0),
+            0 if wildcards & OFPFW_DL_VLAN_PCP else (self._dl_vlan_pcp or 0),
+            dl_type, nw_tos, nw_proto, nw_src, nw_dst, tp_src, tp_dst)
 
   def _normalize_wildcards (self, wildcards):
     """
@@ -1324,42 +1516,64 @@ class ofp_match (ofp_base):
     return not self.is_wildcarded
 
   def unpack (self, raw, offset=0, flow_mod=False):
-    _offset = offset
-    offset,(wildcards, self._in_port) = _unpack("!LH",raw, offset)
-    offset,self._dl_src = _readether(raw, offset)
-    offset,self._dl_dst = _readether(raw, offset)
-    offset,(self._dl_vlan, self._dl_vlan_pcp) = \
-        _unpack("!HB", raw, offset)
-    offset = _skip(raw, offset, 1)
-    offset,(self._dl_type, self._nw_tos, self._nw_proto) = \
-        _unpack("!HBB", raw, offset)
-    offset = _skip(raw, offset, 2)
-    offset,self._nw_src = _readip(raw, offset)
-    offset,self._nw_dst = _readip(raw, offset)
-    offset,(self._tp_src, self._tp_dst) = _unpack("!HH", raw, offset)
+    if (len(raw)-offset) < 40: raise UnderrunError()
+    self._set_wire_values(_match_struct.unpack_from(raw, offset), flow_mod)
+    return offset + 40
+
+  def _set_wire_values (self, values, flow_mod=False):
+    """
+    Sets the fields from a tuple unpacked with _match_struct
+    """
+    if self._locked:
+      raise AttributeError('match object is locked')
+    self._key = None
+    (wildcards, self._in_port, dl_src, dl_dst, self._dl_vlan,
+     self._dl_vlan_pcp, self._dl_type, self._nw_tos, self._nw_proto, nw_src,
+     nw_dst, self._tp_src, self._tp_dst) = values
+    self._dl_src = EthAddr(dl_src)
+    self._dl_dst = EthAddr(dl_dst)
+    self._nw_src = IPAddr(nw_src)
+    self._nw_dst = IPAddr(nw_dst)
 
     # Only unwire wildcards for flow_mod
-    self.wildcards = self._normalize_wildcards(
+    self._wildcards = self._normalize_wildcards(
         self._unwire_wildcards(wildcards) if flow_mod else wildcards)
 
-    assert offset - _offset == len(self)
-    return offset
-
   @staticmethod
   def __len__ ():
     return 40
 
+  def _values (self):
+    """
+    Returns the fields as a tuple, with None for wildcarded ones
+    """
+    w = self._wildcards
+    return (None if w & OFPFW_IN_PORT else self._in_port,
+            None if w & OFPFW_DL_SRC else self._dl_src,
+            None if w & OFPFW_DL_DST else self._dl_dst,
+            None if w & OFPFW_DL_VLAN else self._dl_vlan,
+            None if w & OFPFW_DL_VLAN_PCP else self._dl_vlan_pcp,
+            None if w & OFPFW_DL_TYPE else self._dl_type,
+            None if w & OFPFW_NW_TOS else self._nw_tos,
+            None if w & OFPFW_NW_PROTO else self._nw_proto,
+            None if (w & OFPFW_NW_SRC_ALL) == OFPFW_NW_SRC_ALL
+                 else self._nw_src,
+            None if (w & OFPFW_NW_DST_ALL) == OFPFW_NW_DST_ALL
+                 else self._nw_dst,
+            None if w & OFPFW_TP_SRC else self._tp_src,
+            None if w & OFPFW_TP_DST else self._tp_dst)
+
   def hash_code (self):
     """
     generate a hash value for this match
 
     This generates a hash code which might be useful, but without locking
-    the match object.
+    the match object.  Once the match is locked, the hash is cached.
     """
+    if self._hash is not None: return self._hash
 
-    h = self.wildcards
-    for f in ofp_match_data:
-      v = getattr(self, f)
+    h = self._wildcards
+    for v in self._values():
       if type(v) is int:
         h ^= v
       elif type(v) is long:
@@ -1367,12 +1581,79 @@ class ofp_match (ofp_base):
       else:
         h ^= hash(v)
 
-    return int(h & 0x7fFFffFF)
+    h = int(h & 0x7fFFffFF)
+    if self._locked:
+      self._hash = h
+    return h
 
   def __hash__ (self):
     self._locked = True
     return self.hash_code()
 
+  def _compile (self):
+    """
+    Returns the match compiled to (key, mask, nw_src_bits, nw_dst_bits)
+
+    key holds the values of all non-wildcarded fields plus a bit for each
+    of them that says it is not wildcarded, laid out as in _match_key_fields.
+    mask has all of those bits set which this match cares about, so that
+    this match encompasses another one if (key ^ other_key) & mask is
+    zero and other's nw_src/nw_dst wildcard bits do not exceed
+    nw_src_bits/nw_dst_bits.
+
+    key is None if a field holds something that does not fit, like an
+    EthAddr as a string with colons or an out of range port, and mask is None
+    if this match can not be compiled or an address has bits set outside
+    of its netmask.  Such matches are compared field by field.
+
+    The result is cached until the match is changed.
+    """
+    k = self._key
+    if k is not None: return k
+
+    w = self._wildcards
+    key = 0
+    mask = 0
+    for name,wildcard,shift,bits,present in _match_key_fields:
+      if w & wildcard: continue
+      v = getattr(self, '_' + name)
+      if bits == 48:
+        # Compared like EthAddr does: bytes are taken to be raw
+        if type(v) is EthAddr: v = v.toRaw()
+        elif type(v) is not bytes: v = EthAddr(v).toRaw()
+        if len(v) != 6:
+          key = mask = None
+          break
+        v = _eth_struct.unpack(v)
+        v = (v[0] << 32) | v[1]
+      elif type(v) is not int and type(v) is not long:
+        key = mask = None
+        break
+      elif v < 0 or v >> bits:
+        key = mask = None
+        break
+      key |= present | (v << shift)
+      mask |= present | (((1 << bits) - 1) << shift)
+
+    nw_bits = []
+    for name,wildcard,shift,present in _match_key_nw_fields:
+      a,b = getattr(self, 'get_' + name)()
+      if a is None:
+        nw_bits.append(63)
+        continue
+      nw_bits.append(32-b)
+      if key is None: continue
+      if type(a) is int or type(a) is long: a &= 0xffFFffFF
+      else: a = IPAddr(a).toUnsigned()
+      netmask = (0xffFFffFF << (32-b)) & 0xffFFffFF
+      if a & ~netmask: mask = None
+      key |= present | (a << shift)
+      if mask is not None: mask |= present | (netmask << shift)
+
+    k = (key, mask, nw_bits[0], nw_bits[1])
+    self._key = k
+    return k
+
   def matches_with_wildcards (self, other, consider_other_wildcards=True):
     """
     Test whether /this/ match completely encompasses the other match.
@@ -1384,6 +1665,36 @@ class ofp_match (ofp_base):
     """
     assert assert_type("other", other, ofp_match, none_ok=False)
 
+    key,mask,nw_src_bits,nw_dst_bits = self._compile()
+    other_key = other._compile()[0]
+    if mask is None or other_key is None:
+      return self._matches_fields(other, consider_other_wildcards)
+
+    if consider_other_wildcards:
+      # Check that other doesn't have more wildcards than we do -- it
+      # must be narrower (or equal) to us.
+      self_bits  = self._wildcards&~(OFPFW_NW_SRC_MASK|OFPFW_NW_DST_MASK)
+      other_bits = other._wildcards&~(OFPFW_NW_SRC_MASK|OFPFW_NW_DST_MASK)
+      if (self_bits | other_bits) != self_bits: return False
+
+    # Other must not wildcard any field we don't wildcard, and the values
+    # must be the same (or within our subnets)
+    if (key ^ other_key) & mask: return False
+
+    # Other's subnets must not be wider than ours (see the FIXME in
+    # _matches_fields())
+    w = other._wildcards
+    if (w & OFPFW_NW_SRC_MASK) >> OFPFW_NW_SRC_SHIFT > nw_src_bits:
+      return False
+    if (w & OFPFW_NW_DST_MASK) >> OFPFW_NW_DST_SHIFT > nw_dst_bits:
+      return False
+
+    return True
+
+  def _matches_fields (self, other, consider_other_wildcards=True):
+    """
+    matches_with_wildcards() for matches that can not be compiled
+    """
     # shortcut for equal matches
     if self == other: return True
 
@@ -1433,20 +1744,10 @@ class ofp_match (ofp_base):
 
   def __eq__ (self, other):
     if type(self) != type(other): return False
-    if self.wildcards != other.wildcards: return False
-    if self.in_port != other.in_port: return False
-    if self.dl_src != other.dl_src: return False
-    if self.dl_dst != other.dl_dst: return False
-    if self.dl_vlan != other.dl_vlan: return False
-    if self.dl_vlan_pcp != other.dl_vlan_pcp: return False
-    if self.dl_type != other.dl_type: return False
-    if self.nw_tos != other.nw_tos: return False
-    if self.nw_proto != other.nw_proto: return False
-    if self.nw_src != other.nw_src: return False
-    if self.nw_dst != other.nw_dst: return False
-    if self.tp_src != other.tp_src: return False
-    if self.tp_dst != other.tp_dst: return False
-    return True
+    if self._wildcards != other._wildcards: return False
+    if self._hash is not None and other._hash is not None:
+      if self._hash != other._hash: return False
+    return self._values() == other._values()
 
   def __str__ (self):
     return self.__class__.__name__ + "\n  " + self.show('  ').strip()
@@ -1484,7 +1785,7 @@ class ofp_match (ofp_base):
     outstr += show_wildcards(self.wildcards)
     outstr += ' (%s = %x)\n' % (binstr(self.wildcards), self.wildcards)
     def append (f, formatter=str):
-      v = self.__getattr__(f)
+      v = getattr(self, f)
       if v is None: return ''
       return prefix + f + ": " + formatter(v) + "\n"
     outstr += append('in_port')
@@ -1513,14 +1814,12 @@ class ofp_action_generic (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HH", self.type, len(self))
-    packed += self.data
-    return packed
+    return _action_header_struct.pack(self.type, len(self)) + self.data
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length) = _unpack("!HH", raw, offset)
+    offset,(self.type, length) = _unpack_from(_action_header_struct, raw,
+                                              offset)
     offset,self.data = _read(raw, offset, length-4)
     assert offset - _offset == len(self)
     return offset
@@ -1555,15 +1854,13 @@ class ofp_action_output (ofp_action_base):
 
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHHH", self.type, len(self), self.port,
-                          self.max_len)
-    return packed
+    return _action_output_struct.pack(self.type, len(self), self.port,
+                                      self.max_len)
 
   def unpack (self, raw, offset=0):
     _offset = offset
     offset,(self.type, length, self.port, self.max_len) = \
-        _unpack("!HHHH", raw, offset)
+        _unpack_from(_action_output_struct, raw, offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -1599,17 +1896,13 @@ class ofp_action_enqueue (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHH", self.type, len(self), self.port)
-    packed += _PAD6 # Pad
-    packed += struct.pack("!L", self.queue_id)
-    return packed
+    return _action_enqueue_struct.pack(self.type, len(self), self.port,
+                                       self.queue_id)
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length, self.port) = _unpack("!HHH", raw, offset)
-    offset = _skip(raw, offset, 6)
-    offset,(self.queue_id,) = _unpack("!L", raw, offset)
+    offset,(self.type, length, self.port, self.queue_id) = \
+        _unpack_from(_action_enqueue_struct, raw, offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -1640,13 +1933,12 @@ class ofp_action_strip_vlan (ofp_action_base):
     pass
 
   def pack (self):
-    packed = struct.pack("!HHi", self.type, len(self), 0)
-    return packed
+    return _action_pad_struct.pack(self.type, len(self))
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length) = _unpack("!HH", raw, offset)
-    offset = _skip(raw, offset, 4)
+    offset,(self.type, length) = _unpack_from(_action_pad_struct, raw,
+                                              offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -1677,16 +1969,12 @@ class ofp_action_vlan_vid (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHH", self.type, len(self), self.vlan_vid)
-    packed += _PAD2 # Pad
-    return packed
+    return _action_vlan_vid_struct.pack(self.type, len(self), self.vlan_vid)
 
   def unpack (self, raw, offset=0):
     _offset = offset
     offset,(self.type, length, self.vlan_vid) = \
-        _unpack("!HHH", raw, offset)
-    offset = _skip(raw, offset, 2)
+        _unpack_from(_action_vlan_vid_struct, raw, offset)
     #TODO: check length for this and other actions
     assert offset - _offset == len(self)
     return offset
@@ -1721,16 +2009,12 @@ class ofp_action_vlan_pcp (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHB", self.type, len(self), self.vlan_pcp)
-    packed += _PAD3 # Pad
-    return packed
+    return _action_byte_struct.pack(self.type, len(self), self.vlan_pcp)
 
   def unpack (self, raw, offset=0):
     _offset = offset
     offset,(self.type, length, self.vlan_pcp) = \
-        _unpack("!HHB", raw, offset)
-    offset = _skip(raw, offset, 3)
+        _unpack_from(_action_byte_struct, raw, offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -1785,20 +2069,16 @@ class ofp_action_dl_addr (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HH", self.type, len(self))
-    if isinstance(self.dl_addr, EthAddr):
-      packed += self.dl_addr.toRaw()
-    else:
-      packed += self.dl_addr
-    packed += _PAD6
-    return packed
+    dl_addr = self.dl_addr
+    if isinstance(dl_addr, EthAddr):
+      dl_addr = dl_addr.toRaw()
+    return _action_dl_addr_struct.pack(self.type, len(self), dl_addr)
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length) = _unpack("!HH", raw, offset)
-    offset,self.dl_addr = _readether(raw, offset)
-    offset = _skip(raw, offset, 6)
+    offset,(self.type, length, dl_addr) = \
+        _unpack_from(_action_dl_addr_struct, raw, offset)
+    self.dl_addr = EthAddr(dl_addr)
     assert offset - _offset == len(self)
     return offset
 
@@ -1845,15 +2125,14 @@ class ofp_action_nw_addr (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHl", self.type, len(self),
-                          self.nw_addr.toSigned())
-    return packed
+    return _action_nw_addr_struct.pack(self.type, len(self),
+                                       self.nw_addr.toRaw())
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length) = _unpack("!HH", raw, offset)
-    offset,self.nw_addr = _readip(raw, offset)
+    offset,(self.type, length, nw_addr) = \
+        _unpack_from(_action_nw_addr_struct, raw, offset)
+    self.nw_addr = IPAddr(nw_addr, networkOrder = True)
     assert offset - _offset == len(self)
     return offset
 
@@ -1884,15 +2163,12 @@ class ofp_action_nw_tos (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHB", self.type, len(self), self.nw_tos)
-    packed += _PAD3
-    return packed
+    return _action_byte_struct.pack(self.type, len(self), self.nw_tos)
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,(self.type, length, self.nw_tos) = _unpack("!HHB", raw, offset)
-    offset = _skip(raw, offset, 3)
+    offset,(self.type, length, self.nw_tos) = \
+        _unpack_from(_action_byte_struct, raw, offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -1935,16 +2211,12 @@ class ofp_action_tp_port (ofp_action_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HHH", self.type, len(self), self.tp_port)
-    packed += _PAD2
-    return packed
+    return _action_tp_port_struct.pack(self.type, len(self), self.tp_port)
 
   def unpack (self, raw, offset=0):
     _offset = offset
     offset,(self.type, length, self.tp_port) = \
-        _unpack("!HHH", raw, offset)
-    offset = _skip(raw, offset, 2)
+        _unpack_from(_action_tp_port_struct, raw, offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -2311,15 +2583,13 @@ class ofp_flow_mod (ofp_header):
       buffer_id = NO_BUFFER
 
     assert self._assert()
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += self.match.pack(flow_mod=True)
-    packed += struct.pack("!QHHHHLHH", self.cookie, self.command,
-                          self.idle_timeout, self.hard_timeout,
-                          self.priority, buffer_id, self.out_port,
-                          self.flags)
-    for i in self.actions:
-      packed += i.pack()
+    actions = b''.join([i.pack() for i in self.actions])
+    packed = _flow_mod_struct.pack(*((self.version, self.header_type,
+                                      72 + len(actions), self.xid)
+        + self.match._wire_values(flow_mod=True)
+        + (self.cookie, self.command, self.idle_timeout, self.hard_timeout,
+           self.priority, buffer_id, self.out_port, self.flags)))
+    packed += actions
 
     if po:
       packed += ofp_barrier_request().pack()
@@ -2327,14 +2597,13 @@ class ofp_flow_mod (ofp_header):
     return packed
 
   def unpack (self, raw, offset=0):
-    offset,length = self._unpack_header(raw, offset)
-    offset = self.match.unpack(raw, offset, flow_mod=True)
-    offset,(self.cookie, self.command, self.idle_timeout,
-            self.hard_timeout, self.priority, self._buffer_id,
-            self.out_port, self.flags) = \
-            _unpack("!QHHHHLHH", raw, offset)
-    offset,self.actions = _unpack_actions(raw,
-        length-(32 + len(self.match)), offset)
+    if (len(raw)-offset) < 72: raise UnderrunError()
+    values = _flow_mod_struct.unpack_from(raw, offset)
+    (self.version, self.header_type, length, self._xid) = values[:4]
+    self.match._set_wire_values(values[4:17], flow_mod=True)
+    (self.cookie, self.command, self.idle_timeout, self.hard_timeout,
+     self.priority, self._buffer_id, self.out_port, self.flags) = values[17:]
+    offset,self.actions = _unpack_actions(raw, length-72, offset+72)
     assert length == len(self)
     return offset,length
 
@@ -2719,14 +2988,13 @@ class ofp_stats_reply (ofp_header):
           self.body = t.reply()
           self.body.unpack(packed, 0, len(packed))
         else:
-          prev_len = len(packed)
           self.body = []
-          while len(packed):
+          off = 0
+          while off < len(packed):
             part = t.reply()
-            off = part.unpack(packed, 0, len(packed))
-            packed = packed[off:]
-            assert len(packed) != prev_len
-            prev_len = len(packed)
+            new_off = part.unpack(packed, off, len(packed) - off)
+            assert new_off > off
+            off = new_off
             self.body.append(part)
 
     assert length == len(self)
@@ -2961,33 +3229,24 @@ class ofp_flow_stats (ofp_stats_body_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HBB", len(self), self.table_id, 0)
-    packed += self.match.pack()
-    packed += struct.pack("!LLHHH", self.duration_sec,
-                          self.duration_nsec, self.priority,
-                          self.idle_timeout, self.hard_timeout)
-    packed += _PAD6 # Pad
-    packed += struct.pack("!QQQ", self.cookie, self.packet_count,
-                          self.byte_count)
-    for i in self.actions:
-      packed += i.pack()
-    return packed
+    actions = b''.join([i.pack() for i in self.actions])
+    packed = _flow_stats_struct.pack(*((88 + len(actions), self.table_id)
+        + self.match._wire_values()
+        + (self.duration_sec, self.duration_nsec, self.priority,
+           self.idle_timeout, self.hard_timeout, self.cookie,
+           self.packet_count, self.byte_count)))
+    return packed + actions
 
   def unpack (self, raw, offset, avail):
     _offset = offset
-    offset,(length, self.table_id, pad) = _unpack("!HBB", raw, offset)
-    assert pad == 0
-    offset = self.match.unpack(raw, offset)
-    offset,(self.duration_sec, self.duration_nsec, self.priority,
-            self.idle_timeout, self.hard_timeout) = \
-            _unpack("!LLHHH", raw, offset)
-    offset = _skip(raw, offset, 6)
-    offset,(self.cookie, self.packet_count, self.byte_count) = \
-        _unpack("!QQQ", raw, offset)
-    assert (offset - _offset) == 48 + len(self.match)
-    offset,self.actions = _unpack_actions(raw,
-        length - (48 + len(self.match)), offset)
+    if (len(raw)-offset) < 88: raise UnderrunError()
+    values = _flow_stats_struct.unpack_from(raw, offset)
+    (length, self.table_id) = values[:2]
+    self.match._set_wire_values(values[2:15])
+    (self.duration_sec, self.duration_nsec, self.priority,
+     self.idle_timeout, self.hard_timeout, self.cookie, self.packet_count,
+     self.byte_count) = values[15:]
+    offset,self.actions = _unpack_actions(raw, length - 88, offset + 88)
     assert offset - _offset == len(self)
     return offset
 
@@ -3260,28 +3519,21 @@ class ofp_port_stats (ofp_stats_body_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!H", self.port_no)
-    packed += _PAD6
-    packed += struct.pack("!QQQQQQQQQQQQ", self.rx_packets,
-                          self.tx_packets, self.rx_bytes, self.tx_bytes,
-                          self.rx_dropped, self.tx_dropped,
-                          self.rx_errors, self.tx_errors,
-                          self.rx_frame_err, self.rx_over_err,
-                          self.rx_crc_err, self.collisions)
-    return packed
+    return _port_stats_struct.pack(self.port_no, self.rx_packets,
+                                   self.tx_packets, self.rx_bytes,
+                                   self.tx_bytes, self.rx_dropped,
+                                   self.tx_dropped, self.rx_errors,
+                                   self.tx_errors, self.rx_frame_err,
+                                   self.rx_over_err, self.rx_crc_err,
+                                   self.collisions)
 
   def unpack (self, raw, offset, avail):
-    _offset = offset
-    offset,(self.port_no,) = _unpack("!H", raw, offset)
-    offset = _skip(raw, offset, 6)
-    offset,(self.rx_packets, self.tx_packets, self.rx_bytes,
-            self.tx_bytes, self.rx_dropped, self.tx_dropped,
-            self.rx_errors, self.tx_errors, self.rx_frame_err,
-            self.rx_over_err, self.rx_crc_err, self.collisions) = \
-            _unpack("!QQQQQQQQQQQQ", raw, offset)
-    assert offset - _offset == len(self)
-    return offset
+    if (len(raw)-offset) < 104: raise UnderrunError()
+    (self.port_no, self.rx_packets, self.tx_packets, self.rx_bytes,
+     self.tx_bytes, self.rx_dropped, self.tx_dropped, self.rx_errors,
+     self.tx_errors, self.rx_frame_err, self.rx_over_err, self.rx_crc_err,
+     self.collisions) = _port_stats_struct.unpack_from(raw, offset)
+    return offset + 104
 
   @staticmethod
   def __len__ ():
@@ -3587,24 +3839,20 @@ class ofp_packet_out (ofp_header):
   def pack (self):
     assert self._assert()
 
-    actions = b''.join((i.pack() for i in self.actions))
+    actions = b''.join([i.pack() for i in self.actions])
     actions_len = len(actions)
+    data = self._data
 
-    if self.data is not None:
-      return b''.join((ofp_header.pack(self),
-        struct.pack("!LHH", self._buffer_id, self.in_port, actions_len),
-        actions, self.data))
-    else:
-      return b''.join((ofp_header.pack(self),
-      struct.pack("!LHH", self._buffer_id, self.in_port, actions_len),
-      actions))
+    return b''.join((_packet_out_struct.pack(self.version,
+        self.header_type, 16 + actions_len + len(data), self.xid,
+        self._buffer_id, self.in_port, actions_len), actions, data))
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,length = self._unpack_header(raw, offset)
-    offset,(self._buffer_id, self.in_port, actions_len) = \
-        _unpack("!LHH", raw, offset)
-    offset,self.actions = _unpack_actions(raw, actions_len, offset)
+    if (len(raw)-offset) < 16: raise UnderrunError()
+    (self.version, self.header_type, length, self._xid, self._buffer_id,
+     self.in_port, actions_len) = _packet_out_struct.unpack_from(raw, offset)
+    offset,self.actions = _unpack_actions(raw, actions_len, offset+16)
 
     remaining = length - (offset - _offset)
     if remaining <= 0:
@@ -3772,24 +4020,30 @@ class ofp_packet_in (ofp_header):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += struct.pack("!LHHBB", self._buffer_id, self.total_len,
-                          self.in_port, self.reason, 0)
-    packed += self.data
     #TODO: Padding?  See __len__
-    return packed
+    return _packet_in_struct.pack(self.version, self.header_type,
+                                  len(self), self.xid, self._buffer_id,
+                                  self.total_len, self.in_port,
+                                  self.reason) + self._data
 
   @property
   def is_complete (self):
     if self.buffer_id is not None: return True
     return len(self.data) == self.total_len
 
+  def _unpack_lazy_fields (self, packed):
+    # Everything but the data, which is what handlers usually check first
+    if len(packed) < 18: raise UnderrunError()
+    d = self.__dict__
+    (version, header_type, length, xid, d['_buffer_id'], d['_total_len'],
+     d['in_port'], d['reason']) = _packet_in_struct.unpack_from(packed, 0)
+
   def unpack (self, raw, offset=0):
-    offset,length = self._unpack_header(raw, offset)
-    offset,(self._buffer_id, self._total_len, self.in_port, self.reason,
-            pad) = _unpack("!LHHBB", raw, offset)
-    offset,self.data = _read(raw, offset, length-18)
+    if (len(raw)-offset) < 18: raise UnderrunError()
+    (self.version, self.header_type, length, self._xid, self._buffer_id,
+     self._total_len, self.in_port, self.reason) = \
+        _packet_in_struct.unpack_from(raw, offset)
+    offset,self._data = _read(raw, offset+18, length-18)
     assert length == len(self)
     return offset,length
 
@@ -3845,30 +4099,31 @@ class ofp_flow_removed (ofp_header):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += self.match.pack()
-    packed += struct.pack("!QHB", self.cookie, self.priority, self.reason)
-    packed += _PAD
-    packed += struct.pack("!LLH", self.duration_sec, self.duration_nsec,
-                          self.idle_timeout)
-    packed += _PAD2
-    packed += struct.pack("!QQ", self.packet_count, self.byte_count)
-    return packed
+    return _flow_removed_struct.pack(*((self.version, self.header_type,
+                                        len(self), self.xid)
+        + self.match._wire_values()
+        + (self.cookie, self.priority, self.reason, self.duration_sec,
+           self.duration_nsec, self.idle_timeout, self.packet_count,
+           self.byte_count)))
+
+  def _unpack_lazy_fields (self, packed):
+    # Everything but the match
+    if len(packed) < 88: raise UnderrunError()
+    d = self.__dict__
+    (d['cookie'], d['priority'], d['reason'], d['duration_sec'],
+     d['duration_nsec'], d['idle_timeout'], d['packet_count'],
+     d['byte_count']) = _flow_removed_struct.unpack_from(packed, 0)[17:]
 
   def unpack (self, raw, offset=0):
-    offset,length = self._unpack_header(raw, offset)
-    offset = self.match.unpack(raw, offset)
-    offset,(self.cookie, self.priority, self.reason) = \
-        _unpack("!QHB", raw, offset)
-    offset = _skip(raw, offset, 1)
-    offset,(self.duration_sec, self.duration_nsec, self.idle_timeout) = \
-        _unpack("!LLH", raw, offset)
-    offset = _skip(raw, offset, 2)
-    offset,(self.packet_count, self.byte_count) = \
-        _unpack("!QQ", raw, offset)
+    if (len(raw)-offset) < 88: raise UnderrunError()
+    values = _flow_removed_struct.unpack_from(raw, offset)
+    (self.version, self.header_type, length, self._xid) = values[:4]
+    self.match._set_wire_values(values[4:17])
+    (self.cookie, self.priority, self.reason, self.duration_sec,
+     self.duration_nsec, self.idle_timeout, self.packet_count,
+     self.byte_count) = values[17:]
     assert length == len(self)
-    return offset,length
+    return offset+88,length
 
   @staticmethod
   def __len__ ():
@@ -4347,7 +4602,7 @@ def _unpack_actions (b, length, offset=0):
   actions = []
   end = length + offset
   while offset < end:
-    (t,l) = struct.unpack_from("!HH", b, offset)
+    (t,l) = _action_header_struct.unpack_from(b, offset)
     if (len(b) - offset) < l: raise UnderrunError
     a = _action_type_to_class.get(t)
     if a is None:
@@ -4355,7 +4610,7 @@ def _unpack_actions (b, length, offset=0):
       a = ofp_action_generic()
     else:
       a = a()
-    a.unpack(b[offset:offset+l])
+    a.unpack(b, offset)
     assert len(a) == l
     actions.append(a)
     offset += l
@@ -4452,3 +4707,60 @@ ofp_match_data = {
   'tp_src' : (0, OFPFW_TP_SRC),
   'tp_dst' : (0, OFPFW_TP_DST),
 }
+
+def _match_field_property (name):
+  """
+  Returns the property for a field of ofp_match
+
+  The field reads as None when it is wildcarded, and setting it to None
+  wildcards it.  nw_src and nw_dst have properties of their own.
+  """
+  default,wildcard = ofp_match_data[name]
+  attr = '_' + name
+  get = operator.attrgetter(attr)
+
+  def fget (self):
+    if self._wildcards & wildcard: return None
+    return get(self)
+
+  def fset (self, value):
+    if self._locked:
+      raise AttributeError('match object is locked')
+    self._key = None
+    if value is None:
+      setattr(self, attr, default)
+      self._wildcards |= wildcard
+    else:
+      setattr(self, attr, value)
+      self._wildcards &= ~wildcard
+
+  return property(fget, fset)
+
+for _name in ofp_match_data:
+  if _name not in ('nw_src', 'nw_dst'):
+    setattr(ofp_match, _name, _match_field_property(_name))
+del _name
+
+# Layout of the keys from ofp_match._compile().  The exact fields are
+# (name, wildcard, shift, bits, presence bit), nw_src and nw_dst are
+# (name, wildcard, shift, presence bit) and are masked by their netmask.
+_match_key_fields = []
+_match_key_nw_fields = []
+def _init_match_key_fields ():
+  shift = 0
+  exact = [('in_port', 16), ('dl_vlan', 16), ('dl_src', 48), ('dl_dst', 48),
+           ('dl_type', 16), ('nw_proto', 8), ('tp_src', 16), ('tp_dst', 16),
+           ('dl_vlan_pcp', 8), ('nw_tos', 8)]
+  nw = ['nw_src', 'nw_dst']
+  present = 1 << (sum(b for n,b in exact) + 32 * len(nw))
+  for name,bits in exact:
+    _match_key_fields.append((name, ofp_match_data[name][1], shift, bits,
+                              present))
+    shift += bits
+    present <<= 1
+  for name in nw:
+    _match_key_nw_fields.append((name, ofp_match_data[name][1], shift,
+                                 present))
+    shift += 32
+    present <<= 1
+_init_match_key_fields()
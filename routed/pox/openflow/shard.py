@@ -0,0 +1,807 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs the controller as several processes, sharded by DPID.
+
+POX handles all switches on a single thread, so one controller process
+can not use more than one core.  With openflow.shard the process that is
+started becomes a front process, which starts --workers copies of itself
+with the same commandline.  The front accepts the OpenFlow connections,
+reads the features reply of each switch to learn its DPID and hands the
+socket over to the worker the DPID hashes to.  Every worker runs its own
+core and openflow nexus and only ever sees the switches it was handed.
+
+Sockets are passed to the workers over a Unix socket.  The front also
+relays messages between the workers, which keeps their view of the
+topology the same:
+ - LinkEvents raised by openflow.discovery in one worker are raised in
+   all others, and the links are added to their adjacency.
+ - Hosts announced with core.openflow_shard.announce_host() are raised
+   as HostMove events on core.openflow_shard in the other workers.
+ - core.openflow.sendToDPID() to a switch of another worker is sent by
+   the worker the switch is connected to.
+Apps can exchange their own messages with publish() and BusMessage.
+
+The front loads the same components as the workers, but never has any
+switches.  openflow.shard should come first on the commandline, so that
+the other components find core.openflow_shard when they start.
+
+It supports the following commandline options:
+ --workers=X  Number of worker processes (default 2)
+ --port=X     Port to listen for OpenFlow connections on (default 6633)
+ --address=X  Address to listen on (default 0.0.0.0)
+ --backlog=X  Listen backlog (default 1024)
+ --path=X     Path of the Unix socket the workers connect to
+              (default: in a new private directory in /tmp)
+
+Bus frames are pickled, so only processes of the controller's user may
+be on the bus.  The socket is only accessible to that user, and the
+front and the workers check the user of the process at the other end.
+"""
+
+from pox.core import core
+import pox
+import pox.lib.util
+from pox.lib.addresses import EthAddr
+from pox.lib.revent import *
+from pox.lib.recoco import Task, Select
+from pox.openflow.of_01 import OpenFlow_01_Task, OpenFlow_01_EpollTask
+from pox.openflow.of_01 import handshake_messages, handshake_config
+import pox.openflow.libopenflow_01 as of
+from _multiprocessing import sendfd, recvfd
+from collections import deque
+from errno import EAGAIN
+import cPickle
+import os
+import select
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+log = core.getLogger()
+
+# Tells a process started by the front which worker it is
+_ENV = 'POX_SHARD_WORKER'
+
+# Sent by workers when connecting to the front: channel type, worker index
+_intro = struct.Struct('!cI')
+_HANDOFF = b'H'
+_BUS = b'B'
+
+# Follows every socket handed to a worker: DPID, xid of the barrier that
+# ends the handshake, length of the data the front already read
+_handoff = struct.Struct('!QII')
+
+# Bus frames: length of the payload, worker it is for
+_frame = struct.Struct('!II')
+_ALL = 0xffffffff
+
+# Credentials of the peer of a Unix socket: pid, uid, gid
+_SO_PEERCRED = getattr(socket, 'SO_PEERCRED', 17)
+_ucred = struct.Struct('3i')
+
+
+def shard_of (dpid, workers):
+  """
+  Returns the index of the worker that handles a switch
+  """
+  return zlib.crc32(struct.pack('!Q', dpid)) % workers
+
+
+def _peer_uid (sock):
+  """
+  Returns the uid of the process at the other end of a Unix socket
+  """
+  creds = sock.getsockopt(socket.SOL_SOCKET, _SO_PEERCRED, _ucred.size)
+  return _ucred.unpack(creds)[1]
+
+
+def _recv_exactly (sock, length):
+  data = b''
+  while len(data) < length:
+    chunk = sock.recv(length - len(data))
+    if not chunk:
+      raise socket.error("Connection closed")
+    data += chunk
+  return data
+
+
+class BusMessage (Event):
+  """
+  Fired for messages that another worker published
+  worker (int) - index of the worker that published it
+  """
+  def __init__ (self, worker, topic, args):
+    Event.__init__(self)
+    self.worker = worker
+    self.topic = topic
+    self.args = args
+
+
+class HostMove (Event):
+  """
+  Fired when another worker saw a host at one of its switches
+  """
+  def __init__ (self, mac, dpid, port):
+    Event.__init__(self)
+    self.mac = mac
+    self.dpid = dpid
+    self.port = port
+
+
+class _Channel (object):
+  """
+  A nonblocking stream socket that carries bus frames
+  """
+  def __init__ (self, sock):
+    sock.setblocking(0)
+    self.sock = sock
+    self.inbuf = b''
+    self.out = deque()
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send (self, frame):
+    """
+    Send a frame, returns False if the socket is gone
+    """
+    self.out.append(frame)
+    return self.flush()
+
+  def flush (self):
+    """
+    Send as much as the socket takes, returns False if the socket is gone
+    """
+    out = self.out
+    while out:
+      data = out[0]
+      try:
+        l = self.sock.send(data)
+      except socket.error as (errno, strerror):
+        if errno == EAGAIN:
+          return True
+        return False
+      if l < len(data):
+        out[0] = data[l:]
+        return True
+      out.popleft()
+    return True
+
+  def recv (self):
+    """
+    Returns the list of (destination, frame) that came in, or None if
+    the socket was closed
+    """
+    while True:
+      try:
+        data = self.sock.recv(65536)
+      except socket.error as (errno, strerror):
+        if errno == EAGAIN:
+          break
+        return None
+      if not data:
+        return None
+      self.inbuf += data
+
+    frames = []
+    inbuf = self.inbuf
+    offset = 0
+    while len(inbuf) - offset >= _frame.size:
+      length, dest = _frame.unpack_from(inbuf, offset)
+      end = offset + _frame.size + length
+      if len(inbuf) < end:
+        break
+      frames.append((dest, inbuf[offset:end]))
+      offset = end
+    self.inbuf = inbuf[offset:]
+    return frames
+
+
+class _HandoffChannel (object):
+  """
+  A nonblocking Unix socket that switches are handed to a worker through
+
+  Every switch is passed as its socket, followed by a _handoff header and
+  the data the front already read.  What the worker does not take right
+  away is queued, so a busy worker does not hold up the front.
+  """
+  def __init__ (self, sock):
+    sock.setblocking(0)
+    self.sock = sock
+    self.out = deque() # [switch socket or None once it was passed, data]
+
+  def fileno (self):
+    return self.sock.fileno()
+
+  def send (self, switch, data):
+    """
+    Hand off a switch, returns False if the socket is gone
+    """
+    self.out.append([switch, data])
+    return self.flush()
+
+  def flush (self):
+    """
+    Pass on as much as the socket takes, returns False if the socket is
+    gone, in which case the queued switches are dropped
+    """
+    out = self.out
+    while out:
+      entry = out[0]
+      try:
+        if entry[0] is not None:
+          sendfd(self.sock.fileno(), entry[0].fileno())
+          entry[0].close()
+          entry[0] = None
+        l = self.sock.send(entry[1])
+      except (OSError, socket.error) as e:
+        if e.errno == EAGAIN:
+          return True
+        for switch, data in out:
+          if switch is not None:
+            switch.close()
+        out.clear()
+        return False
+      if l < len(entry[1]):
+        entry[1] = entry[1][l:]
+        return True
+      out.popleft()
+    return True
+
+
+class _Handshake (object):
+  """
+  A switch that the front waits for the features reply of
+  """
+  def __init__ (self, sock, barrier, deadline):
+    self.sock = sock
+    self.barrier = barrier
+    self.data = b''
+    self.deadline = deadline
+
+  def read (self):
+    """
+    Returns (dpid, data for the worker) once the features reply is in,
+    None until then and False if the switch should be dropped
+    """
+    try:
+      data = self.sock.recv(4096)
+    except socket.error as (errno, strerror):
+      return None if errno == EAGAIN else False
+    if not data:
+      return False
+    self.data += data
+
+    # Everything but the hellos is passed on to the worker
+    kept = []
+    data = self.data
+    offset = 0
+    while len(data) - offset >= 8:
+      ofp_type = ord(data[offset+1])
+      length = struct.unpack_from('!H', data, offset + 2)[0]
+      if length < 8:
+        return False
+      if len(data) - offset < length:
+        break
+      if ofp_type == of.OFPT_FEATURES_REPLY:
+        if length < 16:
+          return False
+        dpid = struct.unpack_from('!Q', data, offset + 8)[0]
+        kept.append(data[offset:])
+        return dpid, b''.join(kept)
+      if ofp_type != of.OFPT_HELLO:
+        kept.append(data[offset:offset + length])
+      offset += length
+    return None
+
+
+class ShardFront (OpenFlow_01_Task):
+  """
+  Accepts switches and hands them to the worker processes
+  """
+  # Seconds a switch has to send its features reply
+  handshake_timeout = 30
+
+  def __init__ (self, workers, path = None, port = 6633, address = '0.0.0.0',
+                backlog = 1024):
+    OpenFlow_01_Task.__init__(self, port = port, address = address,
+                              backlog = backlog)
+    self.workers = workers
+
+    # The directory that was made for the socket, if any
+    self._dir = None
+    if path is None:
+      self._dir = tempfile.mkdtemp(prefix = 'pox-shard-')
+      path = os.path.join(self._dir, 'bus')
+    self.path = path
+    self.processes = []
+
+    self.handoff = [None] * workers # Worker index -> _HandoffChannel
+    self._handoff_fds = {} # fd -> worker index, while handoffs are queued
+    self.bus = [None] * workers # Worker index -> _Channel
+    self._bus_fds = {} # fd -> worker index
+
+    # Switches are held back until all workers are connected
+    self.waiting = []
+
+    self._poller = None
+    self._unknown = {} # fd -> Unix socket of a worker that did not say hi
+    self._handshakes = {} # fd -> _Handshake
+
+    core.addListener(pox.core.DownEvent, self._handle_DownEvent)
+
+  def _handle_DownEvent (self, event):
+    for p in self.processes:
+      try:
+        p.terminate()
+      except OSError:
+        pass
+    try:
+      os.unlink(self.path)
+      if self._dir is not None:
+        os.rmdir(self._dir)
+    except OSError:
+      pass
+
+  @property
+  def ready (self):
+    return None not in self.handoff and None not in self.bus
+
+  def _spawn (self):
+    for index in range(self.workers):
+      env = dict(os.environ)
+      env[_ENV] = "%i,%i,%s" % (index, self.workers, self.path)
+      p = subprocess.Popen([sys.executable] + sys.argv, env = env,
+                           close_fds = True)
+      log.debug("Started worker %i as pid %i", index, p.pid)
+      self.processes.append(p)
+
+  def _accept_switch (self, listener, now):
+    while True:
+      try:
+        sock = listener.accept()[0]
+      except socket.error as (errno, strerror):
+        if errno != EAGAIN:
+          log.error("Error %i while accepting connection: %s",
+                    errno, strerror)
+        return
+      sock.setblocking(0)
+      # The whole handshake is sent, the worker just waits for the
+      # barrier reply
+      data, barrier = handshake_messages()
+      try:
+        sock.send(data)
+      except socket.error:
+        sock.close()
+        continue
+      fd = sock.fileno()
+      self._handshakes[fd] = _Handshake(sock, barrier,
+                                        now + self.handshake_timeout)
+      self._poller.register(fd, select.EPOLLIN)
+
+  def _drop_switch (self, fd):
+    h = self._handshakes.pop(fd)
+    self._poller.unregister(fd)
+    h.sock.close()
+
+  def _read_switch (self, fd):
+    h = self._handshakes[fd]
+    r = h.read()
+    if r is None:
+      return
+    if r is False:
+      self._drop_switch(fd)
+      return
+    del self._handshakes[fd]
+    self._poller.unregister(fd)
+    dpid, data = r
+    if self.ready:
+      self._hand_off(h.sock, dpid, h.barrier, data)
+    else:
+      self.waiting.append((h.sock, dpid, h.barrier, data))
+
+  def _hand_off (self, sock, dpid, barrier, data):
+    index = shard_of(dpid, self.workers)
+    log.debug("Handing %s to worker %i", pox.lib.util.dpidToStr(dpid), index)
+    channel = self.handoff[index]
+    if not channel.send(sock, _handoff.pack(dpid, barrier, len(data)) + data):
+      log.error("Could not hand %s to worker %i",
+                pox.lib.util.dpidToStr(dpid), index)
+    self._watch_handoff(index)
+
+  def _flush_handoff (self, fd):
+    index = self._handoff_fds[fd]
+    if not self.handoff[index].flush():
+      log.error("Could not hand switches to worker %i", index)
+    self._watch_handoff(index)
+
+  def _watch_handoff (self, index):
+    """
+    Waits for the handoff channel to become writable while it has a queue
+    """
+    channel = self.handoff[index]
+    fd = channel.fileno()
+    if channel.out and fd not in self._handoff_fds:
+      self._poller.register(fd, select.EPOLLOUT)
+      self._handoff_fds[fd] = index
+    elif not channel.out and fd in self._handoff_fds:
+      self._poller.unregister(fd)
+      del self._handoff_fds[fd]
+
+  def _accept_worker (self, server):
+    while True:
+      try:
+        sock = server.accept()[0]
+      except socket.error as (errno, strerror):
+        if errno != EAGAIN:
+          log.error("Error %i while accepting worker: %s", errno, strerror)
+        return
+      try:
+        uid = _peer_uid(sock)
+      except socket.error:
+        uid = None
+      if uid != os.getuid():
+        log.warning("Refused bus connection from uid %s", uid)
+        sock.close()
+        continue
+      self._unknown[sock.fileno()] = sock
+      self._poller.register(sock.fileno(), select.EPOLLIN)
+
+  def _introduce_worker (self, fd):
+    sock = self._unknown.pop(fd)
+    self._poller.unregister(fd)
+    try:
+      sock.settimeout(5)
+      kind, index = _intro.unpack(_recv_exactly(sock, _intro.size))
+    except (socket.error, struct.error):
+      sock.close()
+      return
+    if index >= self.workers:
+      sock.close()
+      return
+
+    if kind == _HANDOFF:
+      self.handoff[index] = _HandoffChannel(sock)
+    else:
+      channel = _Channel(sock)
+      self.bus[index] = channel
+      self._bus_fds[fd] = index
+      self._poller.register(fd, select.EPOLLIN)
+    log.debug("Worker %i connected its %s channel", index,
+              "handoff" if kind == _HANDOFF else "bus")
+
+    if self.ready:
+      log.info("All %i workers are up", self.workers)
+      for switch in self.waiting:
+        self._hand_off(*switch)
+      self.waiting = []
+
+  def _relay (self, fd, events):
+    index = self._bus_fds[fd]
+    channel = self.bus[index]
+    if events & select.EPOLLOUT:
+      channel.flush()
+    frames = channel.recv() if events & ~select.EPOLLOUT else []
+    if frames is None:
+      log.error("Lost worker %i", index)
+      core.quit()
+      return
+
+    for dest, frame in frames:
+      if dest == _ALL:
+        targets = [c for c in self.bus if c is not channel]
+      elif dest < self.workers:
+        targets = [self.bus[dest]]
+      else:
+        continue
+      for target in targets:
+        if target is not None:
+          target.send(frame)
+
+    for i, c in enumerate(self.bus):
+      if c is not None:
+        self._poller.modify(c.fileno(), select.EPOLLIN |
+                            (select.EPOLLOUT if c.out else 0))
+
+  def run (self):
+    listener = self._listen()
+    if listener is None:
+      return
+    listener.setblocking(0)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      server.bind(self.path)
+    except socket.error as (errno, strerror):
+      log.error("Error %i while binding %s: %s", errno, self.path, strerror)
+      return
+    # Nobody can connect before listen(), so this leaves no gap
+    os.chmod(self.path, 0600)
+    server.listen(self.workers * 2)
+    server.setblocking(0)
+
+    self._spawn()
+
+    self._poller = select.epoll()
+    self._poller.register(listener.fileno(), select.EPOLLIN)
+    self._poller.register(server.fileno(), select.EPOLLIN)
+
+    next_expire = time.time() + self.handshake_timeout
+    try:
+      while core.running:
+        yield Select([self._poller], [], [], 5)
+
+        now = time.time()
+        for fd, events in self._poller.poll(0, 1024):
+          if fd == listener.fileno():
+            self._accept_switch(listener, now)
+          elif fd == server.fileno():
+            self._accept_worker(server)
+          elif fd in self._handshakes:
+            self._read_switch(fd)
+          elif fd in self._unknown:
+            self._introduce_worker(fd)
+          elif fd in self._bus_fds:
+            self._relay(fd, events)
+          elif fd in self._handoff_fds:
+            self._flush_handoff(fd)
+
+        if now >= next_expire:
+          next_expire = now + self.handshake_timeout
+          for fd, h in self._handshakes.items():
+            if h.deadline <= now:
+              self._drop_switch(fd)
+    finally:
+      self._poller.close()
+      server.close()
+      listener.close()
+
+
+class ShardWorkerTask (OpenFlow_01_EpollTask):
+  """
+  OpenFlow listener of a worker
+
+  Instead of accepting switches itself it receives them from the front.
+  """
+  def __init__ (self, shard):
+    OpenFlow_01_EpollTask.__init__(self)
+    self.shard = shard
+
+  def _listen (self):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(self.shard.path)
+      if _peer_uid(sock) != os.getuid():
+        log.error("The front at %s runs as another user", self.shard.path)
+        return None
+      sock.sendall(_intro.pack(_HANDOFF, self.shard.index))
+    except socket.error as e:
+      log.error("Could not connect to the front: %s", e)
+      return None
+    return sock
+
+  def _accept (self):
+    listener = self._listener
+    for _ in xrange(self.MAX_READS):
+      try:
+        fd = recvfd(listener.fileno())
+      except OSError as e:
+        if e.errno == EAGAIN:
+          return
+        log.error("Error while receiving a switch: %s", e)
+        core.quit()
+        return
+      except RuntimeError:
+        log.error("Lost the front process")
+        core.quit()
+        return
+
+      # The rest of the handoff is sent right after the socket
+      listener.settimeout(5)
+      try:
+        dpid, barrier, length = _handoff.unpack(_recv_exactly(listener,
+                                                              _handoff.size))
+        data = _recv_exactly(listener, length)
+      except socket.error as e:
+        log.error("Lost the front process: %s", e)
+        os.close(fd)
+        core.quit()
+        return
+      finally:
+        listener.setblocking(0)
+
+      sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+      os.close(fd)
+
+      con = self._new_connection(sock, hello = False)
+      # The front sent the handshake with the same settings we have
+      con.features_requested = True
+      con.handshake_barrier = barrier
+      con.handshake_config = handshake_config()
+      fd = con.fileno()
+      self._connections[fd] = con
+      self._poller.register(fd, select.EPOLLIN | select.EPOLLOUT |
+                                select.EPOLLET)
+      try:
+        if con.feed(data) is False:
+          self._close(fd, con)
+      except Exception:
+        log.exception("Exception handling %s", con)
+        self._close(fd, con)
+    self._unfinished.add(listener.fileno())
+
+
+class ShardWorker (Task, EventMixin):
+  """
+  The part of a worker that talks to the other workers
+
+  Registered as core.openflow_shard in the workers.
+  """
+  _eventMixin_events = set([
+    BusMessage,
+    HostMove,
+  ])
+
+  def __init__ (self, index, workers, path):
+    Task.__init__(self)
+    self.index = index
+    self.workers = workers
+    self.path = path
+
+    # Links that were discovered by other workers
+    self._remote_links = set()
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    if _peer_uid(sock) != os.getuid():
+      raise RuntimeError("The front at %s runs as another user" % (path,))
+    sock.sendall(_intro.pack(_BUS, index))
+    self.bus = _Channel(sock)
+    self._waker = pox.lib.util.makePinger()
+
+    core.register('of_01', ShardWorkerTask(self))
+    core.addListener(pox.core.GoingUpEvent, self._handle_GoingUpEvent)
+
+  def _handle_GoingUpEvent (self, event):
+    core.openflow.forwarder = self
+    if core.hasComponent('openflow_discovery'):
+      core.openflow_discovery.addListenerByName('LinkEvent',
+                                                self._handle_LinkEvent)
+    self.start()
+
+  def _publish (self, dest, topic, args):
+    payload = cPickle.dumps((self.index, topic, args), 2)
+    self.bus.send(_frame.pack(len(payload), dest) + payload)
+    if self.bus.out:
+      self._waker.ping()
+
+  def publish (self, topic, *args):
+    """
+    Raise a BusMessage in all other workers
+
+    args have to be picklable.
+    """
+    self._publish(_ALL, topic, args)
+
+  def owns (self, dpid):
+    """
+    Returns whether a switch is handled by this worker
+    """
+    return shard_of(dpid, self.workers) == self.index
+
+  def send (self, dpid, data):
+    """
+    Send data to a switch of another worker
+
+    Returns False if the switch belongs to this worker.
+    """
+    index = shard_of(dpid, self.workers)
+    if index == self.index:
+      return False
+    if type(data) is bytearray:
+      data = bytes(data)
+    elif type(data) is not bytes:
+      data = data.pack()
+    self._publish(index, 'send', (dpid, data))
+    return True
+
+  def announce_host (self, mac, dpid, port):
+    """
+    Tell the other workers that a host was seen at dpid.port
+    """
+    self.publish('host', mac.toRaw(), dpid, port)
+
+  def _handle_LinkEvent (self, event):
+    link = event.link
+    if link in self._remote_links:
+      if event.removed:
+        self._remote_links.discard(link)
+      return
+    self.publish('link', event.added, tuple(link))
+
+  def _remote_link (self, added, link):
+    from pox.openflow.discovery import Discovery, LinkEvent
+    discovery = core.openflow_discovery
+    link = Discovery.Link(*link)
+    if added:
+      if link in discovery.adjacency:
+        return
+      self._remote_links.add(link)
+      # Links of other workers do not time out here, their worker
+      # tells us when they are gone.
+      discovery.adjacency[link] = float('inf')
+      discovery.raiseEventNoErrors(LinkEvent, True, link)
+    elif link in self._remote_links:
+      discovery._delete_links([link])
+
+  def _handle_frame (self, frame):
+    worker, topic, args = cPickle.loads(frame[_frame.size:])
+    if topic == 'send':
+      core.openflow.sendToDPID(*args)
+    elif topic == 'link':
+      if core.hasComponent('openflow_discovery'):
+        self._remote_link(*args)
+    elif topic == 'host':
+      mac, dpid, port = args
+      self.raiseEventNoErrors(HostMove, EthAddr(mac), dpid, port)
+    else:
+      self.raiseEventNoErrors(BusMessage, worker, topic, args)
+
+  def run (self):
+    bus = self.bus
+    while core.running:
+      writers = [bus] if bus.out else []
+      rlist, wlist, elist = yield Select([bus, self._waker], writers, [], 5)
+
+      if self._waker in rlist:
+        self._waker.pongAll()
+      if wlist and not bus.flush():
+        frames = None
+      elif bus in rlist:
+        frames = bus.recv()
+      else:
+        frames = []
+
+      if frames is None:
+        log.error("Lost the front process")
+        core.quit()
+        return
+      for dest, frame in frames:
+        try:
+          self._handle_frame(frame)
+        except Exception:
+          log.exception("Exception handling bus message")
+
+
+def launch (workers = 2, port = 6633, address = '0.0.0.0', path = None,
+            backlog = 1024):
+  if core.hasComponent('of_01'):
+    raise RuntimeError("openflow.shard has to be loaded before openflow.of_01")
+
+  worker = os.environ.get(_ENV)
+  if worker is None:
+    core.register('of_01', ShardFront(int(workers), path, port = int(port),
+                                      address = address,
+                                      backlog = int(backlog)))
+  else:
+    index, workers, path = worker.split(',', 2)
+    core.register('openflow_shard', ShardWorker(int(index), int(workers), path))
+    log.info("Running as worker %s of %s", index, workers)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Prepacked flow_mod templates
+
+Apps that install the same kind of flow over and over again only differ
+in a few match fields, the buffer and maybe the output port from one
+flow_mod to the next.  A FlowModTemplate packs such a flow_mod once and
+then just patches those into a copy of the packed bytes, e.g.:
+
+  template = FlowModTemplate(fields = ('dl_src', 'dl_dst'), output = True,
+                             idle_timeout = 10, hard_timeout = 30)
+  ...
+  event.connection.send(template.pack(dl_src = packet.src,
+                                      dl_dst = packet.dst,
+                                      port = port, data = event.ofp))
+"""
+
+import struct
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr, IPAddr
+
+# Offsets of the fields in a packed flow_mod
+_xid_offset = 4
+_buffer_id_offset = 64
+_actions_offset = 72
+
+_u8 = struct.Struct("!B")
+_u16 = struct.Struct("!H")
+_u32 = struct.Struct("!L")
+_eth = struct.Struct("!6s")
+_output_port = struct.Struct("!HH") # port and max_len
+
+def _eth_value (v):
+  if type(v) is EthAddr: return v.toRaw()
+  return EthAddr(v).toRaw()
+
+def _ip_value (v):
+  if type(v) is IPAddr: return v.toUnsigned()
+  if type(v) is int or type(v) is long: return v & 0xffFFffFF
+  return IPAddr(v).toUnsigned()
+
+# Match field -> (offset in the flow_mod, struct, conversion, dummy value)
+_match_fields = {
+  'in_port'     : (12, _u16, int, 1),
+  'dl_src'      : (14, _eth, _eth_value, of.EMPTY_ETH),
+  'dl_dst'      : (20, _eth, _eth_value, of.EMPTY_ETH),
+  'dl_vlan'     : (26, _u16, int, 0),
+  'dl_vlan_pcp' : (28, _u8, int, 0),
+  'dl_type'     : (30, _u16, int, 0),
+  'nw_tos'      : (32, _u8, int, 0),
+  'nw_proto'    : (33, _u8, int, 0),
+  'nw_src'      : (36, _u32, _ip_value, 0),
+  'nw_dst'      : (40, _u32, _ip_value, 0),
+  'tp_src'      : (44, _u16, int, 0),
+  'tp_dst'      : (46, _u16, int, 0),
+}
+
+
+class FlowModTemplate (object):
+  """
+  A flow_mod which is packed once and patched for every use
+
+  fields are the names of the match fields which are given to pack().
+  They are matched exactly, unless match already has a value for them.
+  This way, e.g., nw_dst can keep the prefix length it has in match.
+  Since the wire format is fixed when the template is made, the dl_type
+  and nw_proto that fields like nw_src or tp_dst need must be fixed in
+  match rather than being fields themselves.
+
+  If output is True, an output action is appended to the actions, and
+  its port is given to pack().
+
+  All other keyword arguments are set on the ofp_flow_mod the template
+  is packed from, e.g., match, actions, priority or idle_timeout.
+  """
+  def __init__ (self, fields = (), output = False, **kw):
+    fm = of.ofp_flow_mod(**kw)
+    if fm.data is not None or fm.buffer_id is not None:
+      raise ValueError("data and buffer_id are given to pack()")
+
+    match = fm.match.clone()
+    for name in fields:
+      if name not in _match_fields:
+        raise ValueError("Unknown match field: " + str(name))
+      if getattr(match, name) is None:
+        setattr(match, name, _match_fields[name][3])
+    fm.match = match
+
+    self._output_offset = None
+    if output:
+      fm.actions = list(fm.actions)
+      self._output_offset = (_actions_offset + 4
+                             + sum(len(a) for a in fm.actions))
+      fm.actions.append(of.ofp_action_output(port = of.OFPP_NONE))
+
+    # Fields the switch would ignore without the right dl_type/nw_proto
+    for name in fields:
+      if name == 'nw_tos' or name.startswith('tp_'):
+        dl_types = (0x0800,)
+      elif name.startswith('nw_'):
+        dl_types = (0x0800, 0x0806)
+      else:
+        continue
+      if 'dl_type' in fields or match.dl_type not in dl_types:
+        raise ValueError("Match field %s needs a fixed dl_type of %s"
+                         % (name, " or ".join("0x%04x" % t for t in dl_types)))
+      if name.startswith('tp_'):
+        if 'nw_proto' in fields or match.nw_proto not in (1, 6, 17):
+          raise ValueError("Match field %s needs a fixed nw_proto" % (name,))
+
+    self._packed = fm.pack()
+    self._fields = [(name,) + _match_fields[name][:3] for name in fields]
+
+  def pack (self, xid = None, buffer_id = None, port = None, data = None,
+            **fields):
+    """
+    Returns the flow_mod as a bytearray, with the given values patched in
+
+    All of the template's fields must be given as keyword arguments.
+    port is the port of the output action (if any).  data can be an
+    ofp_packet_in to apply the new flow to, just like with ofp_flow_mod.
+    """
+    if len(fields) != len(self._fields):
+      raise TypeError("Expected the fields " +
+                      ", ".join(f[0] for f in self._fields))
+
+    b = bytearray(self._packed)
+    if xid is None: xid = of.generate_xid()
+    _u32.pack_into(b, _xid_offset, xid)
+
+    for name,offset,s,convert in self._fields:
+      s.pack_into(b, offset, convert(fields[name]))
+
+    if self._output_offset is not None:
+      if port is None:
+        raise TypeError("The template's output port is missing")
+      _output_port.pack_into(b, self._output_offset, port,
+                             0xffFF if port == of.OFPP_CONTROLLER else 0)
+
+    po = None
+    if data is not None:
+      if not data.is_complete:
+        of._log(warn="flow_mod is trying to include incomplete data")
+      else:
+        buffer_id = data.buffer_id
+        if buffer_id is None:
+          po = of.ofp_packet_out(data = data, in_port = data.in_port)
+          po.actions.append(of.ofp_action_output(port = of.OFPP_TABLE))
+    if buffer_id is not None:
+      _u32.pack_into(b, _buffer_id_offset, buffer_id)
+
+    if po is not None:
+      b += of.ofp_barrier_request().pack()
+      b += po.pack()
+    return b
@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Requests to switches that wait for the reply
+
+Connection.request() sends a message and returns a Transaction, which
+is done once the switch replied, sent an error for it, the request timed
+out or the switch disconnected, e.g.:
+
+  def done (t):
+    if t.ok:
+      log.info("%s has %i flows", t.connection, len(t.stats))
+    else:
+      log.warn("Flow stats from %s failed: %s", t.connection, t.state)
+
+  sr = of.ofp_stats_request(body = of.ofp_flow_stats_request())
+  event.connection.request(sr).add_callback(done)
+
+Messages the switch does not reply to (like flow_mods) are followed by a
+barrier with the same xid, so the transaction is done when the switch
+has processed them.
+
+Every Connection keeps its outstanding transactions in a table by xid,
+so replies find theirs without asking everyone who is waiting for one.
+The timeouts of all transactions are kept in one heap.  Their number and
+latency are kept track of in metrics, e.g. metrics.times.percentile(99).
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.util import Samples
+import heapq
+import itertools
+import threading
+import time
+
+log = core.getLogger()
+
+# Requests the switch replies to by itself
+_request_types = frozenset([
+  of.OFPT_ECHO_REQUEST,
+  of.OFPT_FEATURES_REQUEST,
+  of.OFPT_GET_CONFIG_REQUEST,
+  of.OFPT_STATS_REQUEST,
+  of.OFPT_BARRIER_REQUEST,
+  of.OFPT_QUEUE_GET_CONFIG_REQUEST,
+])
+
+# Transaction states
+PENDING = 'pending'
+REPLY = 'reply'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+DISCONNECTED = 'disconnected'
+CANCELLED = 'cancelled'
+
+
+class Transaction (object):
+  """
+  A request that is waiting for its reply
+
+  When it is done, state is one of REPLY, ERROR, TIMEOUT, DISCONNECTED
+  or CANCELLED.  reply is the reply message.  For stats requests it is
+  the list of stats reply parts, like the ofp of FlowStatsReceived, and
+  the bodies of the parts are in stats.  error is the ofp_error the
+  switch sent.
+  """
+  def __init__ (self, table, request, xid, timeout):
+    self.table = table
+    self.connection = table.connection
+    self.request = request
+    self.xid = xid
+    self.state = PENDING
+    self.reply = None
+    self.error = None
+    self.start_time = time.time()
+    self.end_time = None
+    self.deadline = self.start_time + timeout
+
+    self._parts = None # Stats reply parts received so far, if stats
+    self._callbacks = []
+    self._event = None # For wait()
+
+  @property
+  def done (self):
+    return self.state is not PENDING
+
+  @property
+  def ok (self):
+    return self.state is REPLY
+
+  @property
+  def latency (self):
+    """
+    Seconds from sending the request to it being done
+    """
+    if self.end_time is None: return None
+    return self.end_time - self.start_time
+
+  @property
+  def stats (self):
+    """
+    The body of a stats reply, with the entries of all parts in one list
+    """
+    if type(self.reply) is not list: return None
+    body = self.reply[-1].body
+    if type(body) is not list: return body
+    if len(self.reply) == 1: return body
+    stats = []
+    for part in self.reply:
+      stats.extend(part.body)
+    return stats
+
+  def add_callback (self, callback):
+    """
+    Calls callback(transaction) when the transaction is done
+
+    If it is already done, the callback is called right away.  Callbacks
+    are called in the cooperative thread.
+    """
+    if self.state is PENDING:
+      self._callbacks.append(callback)
+    else:
+      callback(self)
+    return self
+
+  def wait (self, timeout = None):
+    """
+    Blocks until the transaction is done, returns whether it is
+
+    Only for threads other than the cooperative one, which would never
+    get to the reply.
+    """
+    if self.state is PENDING:
+      if self._event is None:
+        event = threading.Event()
+        self._event = event
+        # The transaction may have been done in the meantime
+        if self.state is not PENDING: return True
+      self._event.wait(timeout)
+    return self.state is not PENDING
+
+  def cancel (self):
+    """
+    Stops waiting for the reply
+    """
+    self.table._finish(self, CANCELLED)
+
+  def __repr__ (self):
+    return "<Transaction %s xid=%s %s>" % (self.connection, self.xid,
+                                           self.state)
+
+
+class TransactionTable (object):
+  """
+  The outstanding transactions of a Connection by xid
+  """
+  def __init__ (self, connection):
+    self.connection = connection
+    self.pending = {}
+
+  def __len__ (self):
+    return len(self.pending)
+
+  def request (self, msg, timeout):
+    """
+    Sends msg and returns its Transaction
+
+    msg may also be a list of messages, which are all sent with the same
+    xid and are done together.
+    """
+    if isinstance(msg, of.ofp_header):
+      msgs = [msg]
+    else:
+      msgs = list(msg)
+    xid = msgs[0].xid
+    if xid in self.pending:
+      raise RuntimeError("A request with xid %s is already outstanding"
+                         % (xid,))
+
+    t = Transaction(self, msg, xid, timeout)
+    for m in msgs[1:]:
+      m.xid = xid
+    if msgs[-1].header_type == of.OFPT_STATS_REQUEST:
+      t._parts = []
+    elif msgs[-1].header_type not in _request_types:
+      msgs.append(of.ofp_barrier_request(xid = xid))
+
+    self.pending[xid] = t
+    metrics.outstanding += 1
+    if self.connection.disconnected:
+      self._finish(t, DISCONNECTED)
+      return t
+    timeouts.add(t)
+    for m in msgs:
+      self.connection.send(m)
+    return t
+
+  def reply (self, msg):
+    """
+    Called by the Connection for replies
+    """
+    t = self.pending.get(msg.xid)
+    if t is None: return
+    if msg.header_type == of.OFPT_STATS_REPLY:
+      if t._parts is None: return # Not a stats request
+      if msg.type not in self.connection.stream_stats:
+        t._parts.append(msg)
+      if not msg.is_last_reply: return
+      if not t._parts:
+        # The parts were streamed, only the last one is kept
+        t._parts.append(msg)
+      t.reply = t._parts
+      t._parts = None
+    else:
+      t.reply = msg
+    self._finish(t, REPLY)
+
+  def error (self, msg):
+    """
+    Called by the Connection for errors
+    """
+    t = self.pending.get(msg.xid)
+    if t is None: return
+    t.error = msg
+    self._finish(t, ERROR)
+
+  def disconnected (self):
+    """
+    Called by the Connection when the switch is gone
+    """
+    for t in self.pending.values():
+      self._finish(t, DISCONNECTED)
+
+  def _finish (self, t, state):
+    if t.state is not PENDING: return
+    del self.pending[t.xid]
+    t.state = state
+    t.end_time = time.time()
+    metrics.record(t)
+
+    callbacks = t._callbacks
+    t._callbacks = None
+    for callback in callbacks:
+      try:
+        callback(t)
+      except Exception:
+        log.exception("Exception in callback of %s", t)
+    if t._event is not None:
+      t._event.set()
+
+
+class _Timeouts (object):
+  """
+  The deadlines of all transactions in a heap
+
+  A single timer is set for the earliest deadline.  Transactions that
+  are done stay in the heap until their deadline or until there are a
+  lot of them.
+  """
+  def __init__ (self):
+    self._heap = []
+    self._seq = itertools.count() # Keeps equal deadlines in order
+    self._timer = None
+    self._wakeup = None
+
+  def add (self, t):
+    heapq.heappush(self._heap, (t.deadline, next(self._seq), t))
+    if len(self._heap) > 2 * metrics.outstanding + 1024:
+      self._heap = [e for e in self._heap if e[2].state is PENDING]
+      heapq.heapify(self._heap)
+    if self._wakeup is None or t.deadline < self._wakeup:
+      self._schedule(t.deadline)
+
+  def _schedule (self, deadline):
+    if self._timer is not None:
+      self._timer.cancel()
+    self._wakeup = deadline
+    self._timer = core.callDelayed(max(0, deadline - time.time()),
+                                   self._expire)
+
+  def _expire (self):
+    self._timer = None
+    self._wakeup = None
+    heap = self._heap
+    now = time.time()
+    while heap and heap[0][0] <= now:
+      t = heapq.heappop(heap)[2]
+      if t.state is PENDING:
+        t.table._finish(t, TIMEOUT)
+    while heap and heap[0][2].state is not PENDING:
+      heapq.heappop(heap)
+    if heap:
+      self._schedule(heap[0][0])
+
+timeouts = _Timeouts()
+
+
+class TransactionMetrics (object):
+  """
+  Keeps track of how many transactions there are and how long they take
+  """
+  samples = 4096 # Number of latencies kept
+
+  def __init__ (self):
+    self.outstanding = 0
+    self.count = 0
+    self.states = dict((s, 0) for s in (REPLY, ERROR, TIMEOUT,
+                                        DISCONNECTED, CANCELLED))
+    # Latencies of the transactions that were replied to
+    self.times = Samples(self.samples)
+
+  def record (self, t):
+    self.outstanding -= 1
+    self.count += 1
+    self.states[t.state] += 1
+    if t.state is REPLY or t.state is ERROR:
+      self.times.add(t.latency)
+
+metrics = TransactionMetrics()
@@ -59,28 +59,45 @@ class OFConRequest (object):
   Superclass for requests that send commands to a connection and
   wait for responses.
   """
+  timeout = 5
+
   def __init__ (self, con, *args, **kw):
     self._response = None
     self._sync = threading.Event()
-    self._aborted = False
-    self._listeners = None
     self._con = con
     #self._init(*args, **kw)
     core.callLater(self._do_init, args, kw)
 
   def _do_init (self, args, kw):
-    self._listeners = self._con.addListeners(self)
     self._init(*args, **kw)
 
   def _init (self, *args, **kw):
     #log.warn("UNIMPLEMENTED REQUEST INIT")
     pass
 
+  def _request (self, msg):
+    """
+    Sends msg, the reply is handed to _handle_reply()
+    """
+    t = self._con.request(msg, timeout = self.timeout)
+    t.add_callback(self._handle_transaction)
+
+  def _handle_transaction (self, t):
+    if t.ok:
+      self._handle_reply(t)
+    elif t.error is not None:
+      self._handle_error(t)
+    self._finish()
+
+  def _handle_reply (self, t):
+    pass
+
+  def _handle_error (self, t):
+    self._finish(make_error("OpenFlow Error", data=t.error.show()))
+
   def get_response (self):
-    if not self._sync.wait(5):
+    if not self._sync.wait(self.timeout + 1) or self._response is None:
       # Whoops; timeout!
-      self._aborted = True
-      self._finish()
       raise RuntimeError("Operation timed out")
     return self._response
 
@@ -88,7 +105,6 @@ class OFConRequest (object):
     if self._response is None:
       self._response = value
     self._sync.set()
-    self._con.removeListeners(self._listeners)
 
   def _result (self, key, value):
     self._finish({'result':{key:value,'dpid':dpidToStr(self._con.dpid)}})
@@ -98,18 +114,12 @@ class OFSwitchDescRequest (OFConRequest):
   def _init (self):
     sr = of.ofp_stats_request()
     sr.type = of.OFPST_DESC
-    self._con.send(sr)
-    self.xid = sr.xid
+    self._request(sr)
 
-  def _handle_SwitchDescReceived (self, event):
-    if event.ofp.xid != self.xid: return
-    r = switch_desc_to_dict(event.stats)
+  def _handle_reply (self, t):
+    r = switch_desc_to_dict(t.stats)
     self._result('switchdesc', r)
 
-  def _handle_ErrorIn (self, event):
-    if event.ofp.xid != self.xid: return
-    self._finish(make_error("OpenFlow Error", data=event.asString()))
-
 
 class OFFlowStatsRequest (OFConRequest):
   def _init (self, match=None, table_id=0xff, out_port=of.OFPP_NONE):
@@ -122,62 +132,34 @@ class OFFlowStatsRequest (OFConRequest):
     sr.body.match = match
     sr.body.table_id = table_id
     sr.body.out_port = out_port
-    self._con.send(sr)
-    self.xid = sr.xid
+    self._request(sr)
 
-  def _handle_FlowStatsReceived (self, event):
-    if event.ofp[0].xid != self.xid: return
-    stats = flow_stats_to_list(event.stats)
+  def _handle_reply (self, t):
+    stats = flow_stats_to_list(t.stats)
 
     self._result('flowstats', stats)
 
-  def _handle_ErrorIn (self, event):
-    if event.ofp.xid != self.xid: return
-    self._finish(make_error("OpenFlow Error", data=event.asString()))
-
 
 class OFSetTableRequest (OFConRequest):
 
-  def clear_table (self, xid = None):
+  def clear_table (self):
     fm = of.ofp_flow_mod()
-    fm.xid = xid
     fm.command = of.OFPFC_DELETE
-    self._con.send(fm)
-    bar = of.ofp_barrier_request()
-    bar.xid = xid
-    self._con.send(bar)
-    #TODO: Watch for errors on these
+    return fm
 
   def _init (self, flows = []):
-    self.done = False
-
-    xid = of.generate_xid()
-    self.xid = xid
-    self.clear_table(xid=xid)
+    # All of them share one xid and are followed by one barrier
+    msgs = [self.clear_table()]
+    for flow in flows:
+      msgs.append(dict_to_flow_mod(flow))
+    self._request(msgs)
 
-    self.count = 1 + len(flows)
+  def _handle_reply (self, t):
+    self._result('flowmod', True)
 
-    for flow in flows:
-      fm = dict_to_flow_mod(flow)
-      fm.xid = xid
-
-      self._con.send(fm)
-      self._con.send(of.ofp_barrier_request(xid=xid))
-
-  def _handle_BarrierIn (self, event):
-    if event.ofp.xid != self.xid: return
-    if self.done: return
-    self.count -= 1
-    if self.count <= 0:
-      self._result('flowmod', True)
-      self.done = True
-
-  def _handle_ErrorIn (self, event):
-    if event.ofp.xid != self.xid: return
-    if self.done: return
-    self.clear_table()
-    self.done = True
-    self._finish(make_error("OpenFlow Error", data=event.asString()))
+  def _handle_error (self, t):
+    self._con.send(self.clear_table())
+    OFConRequest._handle_error(self, t)
 
 
 class OFRequestHandler (JSONRPCHandler):
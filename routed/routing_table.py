@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pox.lib.addresses as addresses
+
+def _ip_to_int(ip):
+    'Convert an IPAddr or dotted quad string to a host order integer'
+
+    return addresses.IPAddr(ip).toUnsigned()
+
+def _prefix_mask(prefix_len):
+    'Return the netmask for a prefix length as a host order integer'
+
+    return (0xffffffff << (32 - prefix_len)) & 0xffffffff
+
+class NextHop(object):
+    '''
+    A router port and the gateway on it that packets are sent to.
+
+    Next hops of directly connected routes have no gateway,
+    packets are delivered directly to their destination IP.
+
+    Next hops are shared between all routes using the same gateway,
+    so that a gateway that stopped answering is taken out of all of
+    them at once.
+    '''
+
+    def __init__(self, port, gateway= None):
+        self.port= port
+        self.gateway= addresses.IPAddr(gateway) if gateway is not None else None
+        self.alive= True
+        self.retry_at= 0
+
+    def ip(self, ip_dst):
+        'Return the IP address that ip_dst has to be sent to'
+
+        return ip_dst if self.gateway is None else self.gateway
+
+    def __str__(self):
+        if self.gateway is None:
+            return 'directly connected on ofport {}'.format(self.port.my_ofport)
+
+        return 'via {} on ofport {}{}'.format(
+            self.gateway, self.port.my_ofport, '' if self.alive else ' (dead)'
+        )
+
+class Route(object):
+    '''
+    A single entry in the routing table.
+
+    Routes with more than one next hop spread the traffic across
+    them. The next hop is chosen by a hash of the flow a packet
+    belongs to, so that packets of a flow are not reordered.
+    Next hops that are not alive are skipped.
+    '''
+
+    def __init__(self, network, prefix_len, next_hops):
+        self.prefix_len= prefix_len
+        self.prefix= _ip_to_int(network) & _prefix_mask(prefix_len)
+        self.next_hops= list(next_hops)
+
+    @property
+    def network(self):
+        return addresses.IPAddr(self.prefix)
+
+    @property
+    def is_connected(self):
+        return self.next_hops[0].gateway is None
+
+    @property
+    def is_multipath(self):
+        return len(self.next_hops) > 1
+
+    def select(self, flow_hash= 0):
+        'Pick the next hop for the flow identified by flow_hash'
+
+        if not self.is_multipath:
+            return self.next_hops[0]
+
+        alive= [hop for hop in self.next_hops if hop.alive]
+
+        # If no next hop is known to be alive all of them are
+        # tried, which re-starts ARP resolution for them.
+        candidates= alive if alive else self.next_hops
+
+        return candidates[flow_hash % len(candidates)]
+
+    def __str__(self):
+        return '{}/{} {}'.format(
+            self.network, self.prefix_len,
+            ', '.join(str(hop) for hop in self.next_hops)
+        )
+
+class _TrieNode(object):
+    __slots__= ('children', 'route')
+
+    def __init__(self):
+        self.children= [None, None]
+        self.route= None
+
+class RoutingTable(object):
+    '''
+    A binary trie of routes keyed on their integer prefixes.
+
+    Every level of the trie consumes one bit of the address,
+    starting with the most significant one, so a lookup costs
+    at most 32 steps no matter how many routes are installed.
+    '''
+
+    def __init__(self):
+        self.root= _TrieNode()
+        self.count= 0
+
+    def __len__(self):
+        return self.count
+
+    def _walk(self, prefix, prefix_len, create= False):
+        'Find (or create) the node that stores routes for a prefix'
+
+        node= self.root
+
+        for depth in range(prefix_len):
+            bit= (prefix >> (31 - depth)) & 1
+            child= node.children[bit]
+
+            if child is None:
+                if not create:
+                    return None
+
+                child= node.children[bit]= _TrieNode()
+
+            node= child
+
+        return node
+
+    def add(self, route):
+        '''
+        Insert a route into the table.
+
+        A route for the same prefix is replaced and returned.
+        '''
+
+        node= self._walk(route.prefix, route.prefix_len, create= True)
+        old= node.route
+        node.route= route
+
+        if old is None:
+            self.count+= 1
+
+        return old
+
+    def remove(self, network, prefix_len):
+        'Remove and return the route for a prefix or None if there is none'
+
+        node= self._walk(_ip_to_int(network) & _prefix_mask(prefix_len), prefix_len)
+
+        if node is None or node.route is None:
+            return None
+
+        old= node.route
+        node.route= None
+        self.count-= 1
+
+        return old
+
+    def lookup(self, ip):
+        'Return the longest prefix route that matches ip or None'
+
+        addr= _ip_to_int(ip)
+        node= self.root
+        best= node.route
+
+        for shift in range(31, -1, -1):
+            node= node.children[(addr >> shift) & 1]
+
+            if node is None:
+                break
+
+            if node.route is not None:
+                best= node.route
+
+        return best
+
+    def has_more_specific(self, route):
+        'Check if there are routes for prefixes nested inside of route'
+
+        node= self._walk(route.prefix, route.prefix_len)
+
+        if node is None:
+            return False
+
+        nodes= [child for child in node.children if child is not None]
+
+        while nodes:
+            node= nodes.pop()
+
+            if node.route is not None:
+                return True
+
+            nodes.extend(child for child in node.children if child is not None)
+
+        return False
+
+    def routes(self):
+        'Yield all routes in the table, shortest prefixes first'
+
+        level= [self.root]
+
+        while level:
+            for node in level:
+                if node.route is not None:
+                    yield node.route
+
+            level= [
+                child
+                for node in level
+                for child in node.children
+                if child is not None
+            ]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+from arp_queue import ArpQueue
+
+
+class ArpQueueTest (unittest.TestCase):
+  def setUp (self):
+    self.requests = []
+    self.queue = ArpQueue(self.requests.append, max_per_dest = 3,
+                          max_total = 5, retry_interval = 1.0,
+                          max_requests = 3)
+
+  def test_single_request (self):
+    """
+    Only the first packet for a next hop sends an ARP request
+    """
+    for i in range(3):
+      self.assertTrue(self.queue.enqueue('a', i, now = 0))
+    self.assertEqual(self.requests, ['a'])
+    self.assertEqual(self.queue.resolved('a'), [0, 1, 2])
+    self.assertEqual(len(self.queue), 0)
+    self.assertNotIn('a', self.queue)
+    self.assertEqual(self.queue.resolved('a'), [])
+
+  def test_bounds (self):
+    for i in range(5):
+      self.assertTrue(self.queue.enqueue('a', i, now = 0))
+    # The oldest packets for a next hop make way for new ones
+    self.assertEqual(len(self.queue), 3)
+    self.assertEqual(self.queue.dropped, 2)
+
+    self.assertTrue(self.queue.enqueue('b', 5, now = 0))
+    self.assertTrue(self.queue.enqueue('b', 6, now = 0))
+    # The total is full, new packets are dropped
+    self.assertFalse(self.queue.enqueue('c', 7, now = 0))
+    self.assertNotIn('c', self.queue)
+    self.assertEqual(self.queue.dropped, 3)
+    self.assertEqual(self.queue.resolved('a'), [2, 3, 4])
+    self.assertEqual(self.queue.resolved('b'), [5, 6])
+
+  def test_backoff (self):
+    """
+    Requests are repeated after 1, 2 and 4 seconds, then given up on
+    """
+    self.queue.enqueue('a', 0, now = 0)
+    self.assertEqual(self.queue.expire(now = 0.9), [])
+    self.assertEqual(self.requests, ['a'])
+    self.assertEqual(self.queue.expire(now = 1), [])
+    self.assertEqual(self.requests, ['a', 'a'])
+    self.assertEqual(self.queue.expire(now = 2.9), [])
+    self.assertEqual(self.queue.expire(now = 3), [])
+    self.assertEqual(self.requests, ['a', 'a', 'a'])
+    self.assertEqual(self.queue.expire(now = 6.9), [])
+    self.assertEqual(self.queue.expire(now = 7), ['a'])
+    self.assertEqual(self.requests, ['a', 'a', 'a'])
+    self.assertEqual(len(self.queue), 0)
+    self.assertEqual(self.queue.dropped, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
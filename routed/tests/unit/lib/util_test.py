@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.lib.util import Samples
+
+
+class SamplesTest (unittest.TestCase):
+  def test_bounded (self):
+    """
+    Percentiles are over the latest values, the mean over all of them
+    """
+    s = Samples(100)
+    for v in range(1000):
+      s.add(v)
+    self.assertEqual(len(s.values), 100)
+    self.assertEqual(s.count, 1000)
+    self.assertEqual(s.max, 999)
+    self.assertEqual(s.mean, 499.5)
+    self.assertEqual(s.percentile(0), 900)
+    self.assertEqual(s.percentile(50), 950)
+    self.assertEqual(s.percentile(100), 999)
+
+  def test_last (self):
+    s = Samples()
+    for v in (5, 1, 4, 2, 3):
+      s.add(v)
+    self.assertEqual(s.percentile(0, last = 3), 2)
+    self.assertEqual(s.percentile(100, last = 3), 4)
+
+  def test_empty (self):
+    s = Samples()
+    self.assertIsNone(s.percentile(50))
+    self.assertIsNone(s.mean)
+
+
+if __name__ == '__main__':
+  unittest.main()
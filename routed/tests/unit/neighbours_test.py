@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+import neighbours
+from neighbours import NeighbourCache
+
+
+class NeighbourCacheTest (unittest.TestCase):
+  def setUp (self):
+    self.probes = []
+    self.removed = []
+    self.cache = NeighbourCache(
+        lambda ip, mac: self.probes.append(ip),
+        lambda ip, failed: self.removed.append((ip, failed)),
+        reachable_time = 30, stale_time = 300, probe_interval = 1,
+        max_probes = 3, max_entries = 2)
+
+  def state (self, ip):
+    return self.cache.entries[ip].state
+
+  def test_unused_entry_ages_out (self):
+    self.cache.confirm('a', 'mac-a', now = 0)
+    self.cache.expire(now = 29)
+    self.assertEqual(self.state('a'), neighbours.REACHABLE)
+    self.cache.expire(now = 30)
+    self.assertEqual(self.state('a'), neighbours.STALE)
+    self.cache.expire(now = 330)
+    self.assertNotIn('a', self.cache)
+    self.assertEqual(self.removed, [('a', False)])
+    self.assertEqual(self.probes, [])
+
+  def test_used_entry_is_probed (self):
+    self.cache.confirm('a', 'mac-a', now = 0)
+    self.assertEqual(self.cache.lookup('a', now = 1), 'mac-a')
+    self.cache.expire(now = 30)
+    self.assertEqual(self.state('a'), neighbours.PROBE)
+    self.cache.expire(now = 31)
+    self.cache.expire(now = 32)
+    self.assertEqual(self.probes, ['a', 'a', 'a'])
+    self.cache.expire(now = 33)
+    self.assertNotIn('a', self.cache)
+    self.assertEqual(self.removed, [('a', True)])
+
+  def test_confirm_ends_probing (self):
+    self.cache.confirm('a', 'mac-a', now = 0)
+    self.cache.lookup('a', now = 1)
+    self.cache.expire(now = 30)
+    self.cache.confirm('a', 'mac-a', now = 30.5)
+    self.assertEqual(self.state('a'), neighbours.REACHABLE)
+    self.cache.expire(now = 40)
+    self.assertEqual(self.probes, ['a'])
+    self.assertEqual(self.removed, [])
+
+  def test_stale_lookup_probes (self):
+    self.cache.confirm('a', 'mac-a', now = 0)
+    self.cache.expire(now = 30)
+    self.assertEqual(self.cache.lookup('a', now = 31), 'mac-a')
+    self.assertEqual(self.state('a'), neighbours.PROBE)
+    self.assertEqual(self.probes, ['a'])
+
+  def test_mac_change (self):
+    self.cache.confirm('a', 'mac-a', now = 0)
+    self.cache.confirm('a', 'mac-b', now = 1)
+    self.assertEqual(self.cache.lookup('a', now = 1), 'mac-b')
+    self.assertEqual(self.removed, [('a', False)])
+
+  def test_lru_eviction (self):
+    self.cache.confirm('a', 'mac-a', now = 0)
+    self.cache.confirm('b', 'mac-b', now = 0)
+    self.cache.lookup('a', now = 1)
+    self.cache.confirm('c', 'mac-c', now = 2)
+    self.assertEqual(sorted(self.cache.entries), ['a', 'c'])
+    self.assertEqual(self.removed, [('b', False)])
+
+
+if __name__ == '__main__':
+  unittest.main()
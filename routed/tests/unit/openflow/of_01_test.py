@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.core import core
+import pox.openflow
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.of_01 import Connection, OpenFlow_01_EpollTask
+from pox.openflow.of_01 import handshake_messages
+
+
+class MockSocket (object):
+  def __init__ (self):
+    self.sent = []
+
+  def fileno (self):
+    return -1
+
+  def send (self, data):
+    self.sent.append(bytes(data))
+    return len(data)
+
+
+class UncoalescedConnection (Connection):
+  # Everything is sent right away, without the scheduler
+  coalesce_size = 0
+
+
+def message_types (data):
+  """
+  Returns the OFPT types of the messages in data
+  """
+  types = []
+  offset = 0
+  while offset < len(data):
+    types.append(ord(data[offset+1]))
+    offset += ord(data[offset+2]) << 8 | ord(data[offset+3])
+  return types
+
+
+class FeedTest (unittest.TestCase):
+  def setUp (self):
+    self.con = Connection(MockSocket(), hello = False)
+    self.replies = []
+    self.con.transactions.reply = self.replies.append
+
+  def test_straddling_chunks (self):
+    """
+    Messages split across chunks must not make buf grow
+    """
+    con = self.con
+    msg = of.ofp_echo_reply(xid = 1, body = b'x' * 1000).pack()
+    stream = msg * 2000 # About 2 MB
+    chunk = 4099 # Never ends on a message boundary until the end
+    for i in range(0, len(stream), chunk):
+      self.assertNotEqual(con.feed(stream[i:i+chunk]), False)
+      self.assertTrue(len(con.buf) <= 2 * (con.read_size + len(msg)))
+
+    self.assertEqual(len(self.replies), 2000)
+    self.assertEqual(con.buf_start, con.buf_end)
+
+  def test_large_chunk (self):
+    """
+    Chunks larger than read_size still fit
+    """
+    con = self.con
+    msg = of.ofp_echo_reply(xid = 1, body = b'x' * 1000).pack()
+    stream = msg * 100
+    con.feed(stream[:-10])
+    con.feed(stream[-10:])
+    self.assertEqual(len(self.replies), 100)
+
+
+class SendTest (unittest.TestCase):
+  def setUp (self):
+    self.con = Connection(MockSocket(), hello = False)
+
+  def test_bytearray_not_copied (self):
+    """
+    Templated flow_mods are queued as they are
+    """
+    con = self.con
+    fm = bytearray(of.ofp_flow_mod(xid = 1).pack())
+    con.send(fm)
+    self.assertIs(con.out[0], fm)
+    con.flush()
+    self.assertEqual(con.sock.sent, [bytes(fm)])
+
+  def test_mixed_buffers (self):
+    """
+    bytes, bytearrays and memoryviews go out together, in order
+    """
+    con = self.con
+    msgs = [of.ofp_barrier_request(xid = xid).pack() for xid in (1, 2, 3)]
+    con.send(msgs[0])
+    con.send(bytearray(msgs[1]))
+    con.send(memoryview(msgs[2]))
+    con.flush()
+    self.assertEqual(con.sock.sent, [b''.join(msgs)])
+
+
+class FloodSocket (MockSocket):
+  """
+  A switch that sends echo requests without end and takes no data
+  """
+  def __init__ (self):
+    MockSocket.__init__(self)
+    self.stream = of.ofp_echo_request(xid = 1).pack() * 4096
+    self.offset = 0
+    self.reads = 0
+
+  def recv_into (self, view, size):
+    self.reads += 1
+    data = self.stream[self.offset:self.offset+size]
+    self.offset = (self.offset + size) % 8
+    view[:len(data)] = data
+    return len(data)
+
+  def send (self, data):
+    return 0
+
+
+class EpollReadTest (unittest.TestCase):
+  def test_stop_reading_when_paused (self):
+    """
+    Reading stops as soon as the backlog goes over max_backlog
+    """
+    sock = FloodSocket()
+    con = UncoalescedConnection(sock, hello = False)
+    con.max_backlog = 1024
+    con.backlog_action = 'backpressure'
+    task = OpenFlow_01_EpollTask()
+    task._read(1, con)
+    self.assertTrue(con.read_paused)
+    self.assertFalse(con.drained)
+    self.assertEqual(sock.reads, 1)
+    self.assertNotIn(1, task._unfinished)
+
+
+class HandshakeTest (unittest.TestCase):
+  def setUp (self):
+    pox.openflow.launch()
+    self.nexus = None # Nexus for new switches, None for the default
+    self.listener = core.OpenFlowConnectionArbiter.addListenerByName(
+        "ConnectionIn", self._handle_ConnectionIn)
+
+  def tearDown (self):
+    core.OpenFlowConnectionArbiter.removeListener(self.listener)
+
+  def _handle_ConnectionIn (self, event):
+    event.nexus = self.nexus
+
+  def connect (self):
+    """
+    Runs a switch through the handshake and returns the types of the
+    messages it was sent
+    """
+    sock = MockSocket()
+    con = UncoalescedConnection(sock)
+    con.feed(of.ofp_hello().pack())
+    con.feed(of.ofp_features_reply(datapath_id = 1).pack())
+    return message_types(b''.join(sock.sent))
+
+  def test_default_arbiter_clears_in_handshake (self):
+    core.OpenFlowConnectionArbiter.removeListener(self.listener)
+    data, xid = handshake_messages()
+    self.assertIn(of.OFPT_FLOW_MOD, message_types(data))
+
+  def test_non_clearing_nexus (self):
+    """
+    A switch of a nexus that keeps flows must never see a flow delete
+    """
+    self.nexus = pox.openflow.OpenFlowNexus()
+    self.nexus.clear_flows_on_connect = False
+    self.assertNotIn(of.OFPT_FLOW_MOD, self.connect())
+
+  def test_clearing_nexus (self):
+    """
+    With a nexus picked by switch, the flows are cleared once it is known
+    """
+    self.nexus = pox.openflow.OpenFlowNexus()
+    types = self.connect()
+    self.assertEqual(types.count(of.OFPT_FLOW_MOD), 1)
+    self.assertTrue(types.index(of.OFPT_FLOW_MOD) >
+                    types.index(of.OFPT_BARRIER_REQUEST))
+
+
+if __name__ == '__main__':
+  unittest.main()
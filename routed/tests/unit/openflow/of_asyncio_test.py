@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+import pox.openflow
+import pox.openflow.libopenflow_01 as of
+import pox.openflow.of_asyncio as of_asyncio
+from pox.openflow.of_01 import Connection
+
+
+class UncoalescedConnection (Connection):
+  # Everything is sent right away, without the scheduler
+  coalesce_size = 0
+
+
+class MockTransport (object):
+  def __init__ (self):
+    self.calls = []
+
+  def set_write_buffer_limits (self, high, low):
+    self.calls.append(('limits', high, low))
+
+  def get_write_buffer_size (self):
+    return 0
+
+  def pause_reading (self):
+    self.calls.append(('pause_reading',))
+
+  def abort (self):
+    self.calls.append(('abort',))
+
+
+@unittest.skipIf(of_asyncio.asyncio is None, "needs asyncio or trollius")
+class BridgeTest (unittest.TestCase):
+  def setUp (self):
+    pox.openflow.launch()
+    self._connection = of_asyncio.Connection
+    of_asyncio.Connection = UncoalescedConnection
+    self.bridge = of_asyncio.AsyncioBridge(use_uvloop = False)
+    # run() is driven by the test, keep the scheduler out of it
+    self.bridge._read_scheduled = True
+    self.bridge._write_scheduled = True
+    self.task = self.bridge.run()
+    self.protocol = of_asyncio._Protocol(self.bridge)
+    self.protocol.transport = MockTransport()
+
+  def tearDown (self):
+    of_asyncio.Connection = self._connection
+    self.bridge.loop.close()
+
+  def receive (self, data):
+    self.bridge.received(self.protocol, data)
+    next(self.task)
+
+  def written (self):
+    """
+    Returns the data run() handed to the loop for the protocol
+    """
+    out = [bytes(d) for p,d in self.bridge._outgoing
+           if p is self.protocol and d is not None]
+    del self.bridge._outgoing[:]
+    return b''.join(out)
+
+  def test_feed_and_close (self):
+    self.receive(None)
+    con = self.protocol.con
+    self.assertIsInstance(con, Connection)
+    self.assertEqual(self.written()[1:2], chr(of.OFPT_HELLO))
+
+    self.receive(of.ofp_echo_request(xid = 7).pack())
+    reply = of.ofp_echo_reply()
+    reply.unpack(self.written())
+    self.assertEqual(reply.xid, 7)
+
+    self.receive(b'')
+    self.assertTrue(con.disconnected)
+    self.assertIn((self.protocol, None), self.bridge._outgoing)
+
+  def test_per_connection_backlog (self):
+    """
+    The limit and action of the Connection apply, not the defaults
+    """
+    self.receive(None)
+    con = self.protocol.con
+    con.max_backlog = 1024
+    con.backlog_action = 'backpressure'
+    self.receive(of.ofp_echo_request().pack())
+    self.assertEqual(self.protocol.max_backlog, 1024)
+
+    self.bridge.loop._run_once() # Runs what run() handed to the loop
+    self.assertIn(('limits', 1024, 512), self.protocol.transport.calls)
+    self.protocol.pause_writing()
+    self.assertIn(('pause_reading',), self.protocol.transport.calls)
+    self.assertNotIn(('abort',), self.protocol.transport.calls)
+
+
+if __name__ == '__main__':
+  unittest.main()
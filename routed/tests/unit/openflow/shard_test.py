@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import os.path
+import socket
+import select
+import threading
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.shard import _HandoffChannel, _handoff, _recv_exactly
+from pox.openflow.shard import recvfd
+
+
+class HandoffChannelTest (unittest.TestCase):
+  def setUp (self):
+    self.front, self.worker = socket.socketpair(socket.AF_UNIX,
+                                                socket.SOCK_STREAM)
+    self.front.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    self.channel = _HandoffChannel(self.front)
+    self.switches = []
+
+  def tearDown (self):
+    self.front.close()
+    self.worker.close()
+    for s in self.switches:
+      s.close()
+
+  def hand_off (self, dpid, data):
+    ours, theirs = socket.socketpair()
+    self.switches.append(ours)
+    frame = _handoff.pack(dpid, 0, len(data)) + data
+    self.assertTrue(self.channel.send(theirs, frame))
+
+  def receive (self):
+    """
+    Takes a switch like the worker does, returns its dpid and data
+    """
+    fd = recvfd(self.worker.fileno())
+    os.close(fd)
+    dpid, barrier, length = _handoff.unpack(_recv_exactly(self.worker,
+                                                          _handoff.size))
+    return dpid, _recv_exactly(self.worker, length)
+
+  def test_busy_worker (self):
+    """
+    Handoffs a worker does not take right away are queued, not waited for
+    """
+    data = b'x' * 100000
+    for dpid in range(1, 4):
+      self.hand_off(dpid, data) # Blocked before, nobody is reading
+    self.assertTrue(len(self.channel.out) > 1)
+
+    # The worker gets to it, the front flushes whenever it can
+    received = []
+    def worker ():
+      self.worker.settimeout(5)
+      for _ in range(3):
+        received.append(self.receive())
+    thread = threading.Thread(target = worker)
+    thread.start()
+    while self.channel.out:
+      self.assertTrue(self.channel.flush())
+      select.select([], [self.front], [], 1)
+    thread.join(5)
+
+    self.assertEqual([dpid for dpid,d in received], [1, 2, 3])
+    self.assertTrue(all(d == data for dpid,d in received))
+
+  def test_worker_gone (self):
+    self.worker.close()
+    self.assertFalse(self.channel.send(socket.socket(), b'x'))
+    self.assertFalse(self.channel.out)
+
+
+if __name__ == '__main__':
+  unittest.main()
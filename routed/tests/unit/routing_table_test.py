@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+from routing_table import NextHop, Route, RoutingTable
+
+
+class MockPort (object):
+  my_ofport = 1
+
+
+class RoutingTableTest (unittest.TestCase):
+  def setUp (self):
+    self.port = MockPort()
+    self.table = RoutingTable()
+    self.routes = {}
+    for network, prefix_len in (('0.0.0.0', 0), ('10.0.0.0', 8),
+                                ('10.1.0.0', 16), ('10.1.2.0', 24),
+                                ('10.1.2.3', 32)):
+      route = Route(network, prefix_len,
+                    [NextHop(self.port, '192.168.0.%i' % (prefix_len,))])
+      self.routes[prefix_len] = route
+      self.assertIsNone(self.table.add(route))
+
+  def test_longest_prefix (self):
+    lookup = self.table.lookup
+    self.assertIs(lookup('10.1.2.3'), self.routes[32])
+    self.assertIs(lookup('10.1.2.4'), self.routes[24])
+    self.assertIs(lookup('10.1.3.1'), self.routes[16])
+    self.assertIs(lookup('10.2.0.1'), self.routes[8])
+    self.assertIs(lookup('11.0.0.1'), self.routes[0])
+    self.assertEqual(len(self.table), 5)
+
+  def test_remove (self):
+    self.assertIs(self.table.remove('10.1.2.0', 24), self.routes[24])
+    self.assertIsNone(self.table.remove('10.1.2.0', 24))
+    self.assertIs(self.table.lookup('10.1.2.4'), self.routes[16])
+    self.assertIs(self.table.lookup('10.1.2.3'), self.routes[32])
+    self.assertEqual(len(self.table), 4)
+
+    self.table.remove('0.0.0.0', 0)
+    self.assertIsNone(self.table.lookup('11.0.0.1'))
+
+  def test_host_bits_ignored (self):
+    route = Route('10.1.2.99', 24, [NextHop(self.port)])
+    self.assertIs(self.table.add(route), self.routes[24])
+    self.assertEqual(str(route.network), '10.1.2.0')
+    self.assertIs(self.table.lookup('10.1.2.4'), route)
+    self.assertEqual(len(self.table), 5)
+
+  def test_more_specific (self):
+    self.assertTrue(self.table.has_more_specific(self.routes[16]))
+    self.assertFalse(self.table.has_more_specific(self.routes[32]))
+    self.assertEqual([r.prefix_len for r in self.table.routes()],
+                     [0, 8, 16, 24, 32])
+
+
+class RouteTest (unittest.TestCase):
+  def test_multipath_skips_dead_hops (self):
+    port = MockPort()
+    hops = [NextHop(port, '192.168.0.%i' % (i,)) for i in range(1, 4)]
+    route = Route('10.0.0.0', 8, hops)
+    self.assertEqual(set(route.select(h) for h in range(30)), set(hops))
+    self.assertIs(route.select(7), route.select(7))
+
+    hops[1].alive = False
+    self.assertNotIn(hops[1], [route.select(h) for h in range(30)])
+
+    # With no hop known to be alive, all of them are tried
+    for hop in hops:
+      hop.alive = False
+    self.assertEqual(set(route.select(h) for h in range(30)), set(hops))
+
+
+if __name__ == '__main__':
+  unittest.main()
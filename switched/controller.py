@@ -12,60 +12,244 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
+
 from pox.core import core as Core
+from pox.lib.packet.ethernet import ethernet as Ethernet
+from pox.lib.packet.arp import arp as Arp
 
 import pox.openflow.libopenflow_01 as of
 import pox.lib.addresses as addresses
 
+from flood_control import ArpProxy, FloodLimiter
+from mac_table import MacTable
+
 log = Core.getLogger()
 
+# Default settings for the flow rules installed by the switch.
+#  mode: 'pair' installs one rule per HW SRC->HW DST combination,
+#        'destination' one rule per HW DST.
+FLOW_DEFAULTS= {
+    'mode': 'pair',
+    'idle_timeout': 0,
+    'hard_timeout': 0,
+    'priority': of.OFP_DEFAULT_PRIORITY,
+}
+
 class Switch (object):
-    def __init__ (self, connection):
+    def __init__ (self, connection, config= dict()):
         self.connection= connection
 
         # Tell Pox to use methods in this class as callbacks
         # (At the moment only _handle_PacketIn).
         connection.addListeners(self)
 
+        self.flow_options= dict(FLOW_DEFAULTS)
+        self.flow_options.update(config.get('flows', dict()))
+
         # MAC->Port mappings learned by passive
         # network observations
-        self.mac_to_port= {}
+        self.mac_to_port= MacTable(
+            self.mac_forget, **config.get('mac_table', dict())
+        )
+
+        # Rate limits for flooded packets and the
+        # IP->MAC bindings ARP requests are answered from.
+        # Both are only enabled if they are configured.
+        self.flood_limit= None
+        self.arp_proxy= None
+
+        if 'flood' in config:
+            self.flood_limit= FloodLimiter(**config['flood'])
+
+        if 'arp_proxy' in config:
+            self.arp_proxy= ArpProxy(**config['arp_proxy'])
+
+    def flows_remove (self, mac, port):
+        '''
+        Remove all flow rules that output packets for mac on port.
+
+        A single non-strict delete covers the rules of both
+        flow modes as they all match on the HW DST.
+        '''
+
+        match= of.ofp_match(dl_dst=mac)
+        msg= of.ofp_flow_mod(
+            command=of.OFPFC_DELETE, match=match, out_port=port
+        )
+
+        self.connection.send(msg)
+
+    def mac_forget (self, mac, port):
+        'Called when a MAC->Port mapping is evicted or expires'
+
+        log.debug('Forget {} on port {}'.format(mac, port))
+
+        self.flows_remove(mac, port)
 
     def resend_packet (self, packet_in, out_port):
-        'Tell the forwarding device to output an ethernet packet on out_port'
+        '''
+        Tell the forwarding device to output an ethernet packet on out_port.
+
+        Pox only sends the buffer_id instead of the whole
+        packet if the forwarding device buffered it.
+        '''
 
         action= of.ofp_action_output(port=out_port)
         msg= of.ofp_packet_out(data=packet_in, action=action)
 
         self.connection.send(msg)
 
+    def source_block (self, mac, port, packet_in):
+        '''
+        Drop all packets from mac on port in the forwarding device
+        for a while, including the packet_in if it was buffered.
+        '''
+
+        log.info('Blocking {} on port {} for {}s'.format(
+            mac, port, self.flood_limit.block_time
+        ))
+
+        match= of.ofp_match(in_port=port, dl_src=mac)
+        msg= of.ofp_flow_mod(
+            match=match, buffer_id=packet_in.buffer_id,
+            hard_timeout=self.flood_limit.block_time,
+            priority=self.flow_options['priority'] + 1
+        )
+
+        self.connection.send(msg)
+
+    def flood (self, packet, event):
+        'Output a packet on any port if the flood limits allow it'
+
+        if self.flood_limit is not None:
+            (allowed, block)= self.flood_limit.allow(packet.src)
+
+            if block:
+                self.source_block(packet.src, event.port, event.ofp)
+
+            if not allowed:
+                # Suppressed packets that were buffered are not
+                # released, the forwarding device drops them
+                # on its own and the controller saves a message.
+                return
+
+        self.resend_packet(event.ofp, of.OFPP_ALL)
+
+    def arp_answer (self, packet, event):
+        '''
+        Answer an ARP request from the learned IP->MAC bindings.
+
+        Returns True if the request was answered.
+        '''
+
+        arp_in= packet.find('arp')
+
+        if self.arp_proxy is None or arp_in is None:
+            return False
+
+        if arp_in.opcode != Arp.REQUEST or arp_in.protodst == arp_in.protosrc:
+            # Gratuitous ARP is flooded so that everyone
+            # updates their caches.
+            return False
+
+        mac= self.arp_proxy.lookup(arp_in.protodst)
+
+        # Only answer for hosts that are still attached,
+        # requests for hosts that went away are flooded so
+        # that whoever took over the address can answer.
+        if mac is None or self.mac_to_port.lookup(mac) is None:
+            return False
+
+        arp_out= Arp(
+            hwsrc= mac, hwdst= arp_in.hwsrc,
+            opcode= Arp.REPLY,
+            protosrc= arp_in.protodst, protodst= arp_in.protosrc
+        )
+
+        eth_out= Ethernet(
+            dst= packet.src, src= mac,
+            type= Ethernet.ARP_TYPE, next= arp_out
+        )
+
+        action= of.ofp_action_output(port=of.OFPP_IN_PORT)
+        msg= of.ofp_packet_out(data=eth_out, action=action, in_port=event.port)
+        self.connection.send(msg)
+
+        if event.ofp.buffer_id is not None:
+            # Release the buffer without sending anything
+            msg= of.ofp_packet_out(data=event.ofp)
+            self.connection.send(msg)
+
+        return True
+
     def act_like_switch (self, packet, event):
         'Handle an input packet like a switch'
 
-        self.mac_to_port[packet.src]= event.port
+        if self.arp_proxy is not None:
+            arp_in= packet.find('arp')
+
+            # ARP probes announce no binding yet
+            if arp_in is not None and arp_in.protosrc != addresses.IP_ANY:
+                self.arp_proxy.learn(arp_in.protosrc, arp_in.hwsrc)
+
+        port_old= self.mac_to_port.learn(packet.src, event.port)
+
+        if port_old is not None:
+            # The host moved, the rules forwarding packets for it
+            # to the old port would blackhole its traffic.
+            log.debug('Move {} from port {} to {}'.format(
+                packet.src, port_old, event.port
+            ))
+
+            self.flows_remove(packet.src, port_old)
 
         log.debug('Forward {} - > {}'.format(packet.src, packet.dst))
 
-        if packet.dst in self.mac_to_port:
+        port_dst= self.mac_to_port.lookup(packet.dst)
+
+        if port_dst == event.port:
+            # The destination is on the port the packet came
+            # in on, it already saw the packet.
+
+            if event.ofp.buffer_id is not None:
+                # Release the buffer without sending anything
+                msg= of.ofp_packet_out(data=event.ofp)
+                self.connection.send(msg)
+
+        elif port_dst is not None:
             # The destination port is known:
-            #  - Add a rule for this HW SRC->HW DST combination.
-            #  - Manually send out the packet on the corresponding port.
+            #  - Add a rule for this HW DST (or HW SRC->HW DST
+            #    combination).
+            #  - Let the rule handle the packet if the switch buffered it,
+            #    otherwise manually send it out on the corresponding port.
 
-            port_dst= self.mac_to_port[packet.dst]
+            if self.flow_options['mode'] == 'destination':
+                match= of.ofp_match(dl_dst=packet.dst)
+            else:
+                match= of.ofp_match(dl_src=packet.src, dl_dst=packet.dst)
 
-            match= of.ofp_match(dl_src=packet.src, dl_dst=packet.dst)
             action= of.ofp_action_output(port=port_dst)
-            msg = of.ofp_flow_mod(match=match, action=action)
+            msg = of.ofp_flow_mod(
+                match=match, action=action, buffer_id=event.ofp.buffer_id,
+                idle_timeout=self.flow_options['idle_timeout'],
+                hard_timeout=self.flow_options['hard_timeout'],
+                priority=self.flow_options['priority']
+            )
 
             self.connection.send(msg)
 
-            self.resend_packet(event.ofp, port_dst)
+            if event.ofp.buffer_id is None:
+                self.resend_packet(event.ofp, port_dst)
 
         else:
             # The destination port is not known:
-            #  - Output the packet on any port
+            #  - Answer ARP requests for known hosts in their place
+            #  - Otherwise output the packet on any port
 
-            self.resend_packet(event.ofp, of.OFPP_ALL)
+            if not self.arp_answer(packet, event):
+                self.flood(packet, event)
 
     def _handle_PacketIn (self, event):
         '''
@@ -80,14 +264,22 @@ class Switch (object):
 
         self.act_like_switch(packet, event)
 
-def launch ():
-    'Setup function called by Pox'
+def launch (config= os.path.join(os.path.dirname(__file__), 'switch.json')):
+    '''
+    Setup function called by Pox
+
+    The flow, MAC table and flood control settings are read from
+    the JSON file passed in using --config=<file>.
+    '''
+
+    with open(config) as fd:
+        switch_config= json.load(fd)
 
     def start_switch (event):
         log.debug("Controlling %s" % (event.connection,))
 
         # Run a Swtich instance for every
         # incoming openflow connection
-        Switch(event.connection)
+        Switch(event.connection, switch_config)
 
     Core.openflow.addListenerByName("ConnectionUp", start_switch)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import time
+
+class TokenBucket(object):
+    '''
+    Allow on average rate events per second with bursts
+    of up to burst events.
+    '''
+
+    __slots__= ('rate', 'burst', 'tokens', 'last')
+
+    def __init__(self, rate, burst, now):
+        self.rate= rate
+        self.burst= burst
+        self.tokens= burst
+        self.last= now
+
+    def take(self, now):
+        'Consume a token, returns False if none is left'
+
+        self.tokens= min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last= now
+
+        if self.tokens < 1:
+            return False
+
+        self.tokens-= 1
+
+        return True
+
+class FloodLimiter(object):
+    '''
+    Rate limits for the packets a switch floods on behalf of
+    the controller.
+
+    There is one token bucket for the switch as a whole and one
+    for each source MAC. Sources that run out of tokens are
+    reported as offenders once every block_time seconds,
+    so that their traffic can be dropped in the switch.
+
+    Buckets are kept for at most max_sources source MACs,
+    when that limit is reached the least recently seen
+    source is forgotten.
+    '''
+
+    def __init__(self, switch_rate= 100, switch_burst= 200,
+                 source_rate= 10, source_burst= 20,
+                 block_time= 10, max_sources= 1024):
+
+        self.switch_rate= switch_rate
+        self.switch_burst= switch_burst
+        self.source_rate= source_rate
+        self.source_burst= source_burst
+        self.block_time= block_time
+        self.max_sources= max_sources
+
+        self.switch= TokenBucket(switch_rate, switch_burst, time.time())
+
+        # Buckets in least recently seen first order
+        self.sources= collections.OrderedDict()
+
+        # Source MAC -> time until which it is blocked
+        self.blocked= dict()
+
+        self.suppressed= 0
+
+    def _source_bucket(self, mac, now):
+        bucket= self.sources.pop(mac, None)
+
+        if bucket is None:
+            if len(self.sources) >= self.max_sources:
+                self.sources.popitem(last= False)
+
+            bucket= TokenBucket(self.source_rate, self.source_burst, now)
+
+        self.sources[mac]= bucket
+
+        return bucket
+
+    def allow(self, mac, now= None):
+        '''
+        Check if a packet from mac may be flooded.
+
+        Returns a (allowed, block) tuple, block is True if the
+        source just became an offender and should be blocked.
+        '''
+
+        now= time.time() if now is None else now
+
+        # The source bucket is checked first so that a single
+        # offender does not use up the tokens of the switch.
+        if not self._source_bucket(mac, now).take(now):
+            self.suppressed+= 1
+
+            if self.blocked.get(mac, 0) > now:
+                return (False, False)
+
+            self.blocked[mac]= now + self.block_time
+
+            # Forget blocks that ran out along the way to
+            # keep the dict from growing.
+            for (blocked_mac, until) in list(self.blocked.items()):
+                if until <= now:
+                    del self.blocked[blocked_mac]
+
+            return (False, True)
+
+        if not self.switch.take(now):
+            self.suppressed+= 1
+
+            return (False, False)
+
+        return (True, False)
+
+class ArpProxy(object):
+    '''
+    IP->MAC bindings learned from ARP packets passing
+    through the switch.
+
+    ARP requests for known bindings can be answered by the
+    controller instead of being flooded.
+    '''
+
+    def __init__(self, max_entries= 1024):
+        self.max_entries= max_entries
+
+        # Bindings in least recently seen first order
+        self.bindings= collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.bindings)
+
+    def learn(self, ip, mac):
+        'Record that ip is bound to mac'
+
+        if self.bindings.pop(ip, None) is None:
+            if len(self.bindings) >= self.max_entries:
+                self.bindings.popitem(last= False)
+
+        self.bindings[ip]= mac
+
+    def lookup(self, ip):
+        'Return the MAC bound to ip or None if it is not known'
+
+        return self.bindings.get(ip)
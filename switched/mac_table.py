@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import collections
+import time
+
+class MacTable(object):
+    '''
+    MAC->Port mappings learned by passive network observations.
+
+    The table holds at most max_entries mappings, when it is full
+    the least recently seen MAC is evicted. Mappings that were not
+    refreshed within max_age seconds are forgotten.
+    '''
+
+    def __init__(self, on_remove, max_entries= 1024, max_age= 300):
+
+        # Callback called with (mac, port) of mappings that
+        # are evicted or expire
+        self.on_remove= on_remove
+
+        self.max_entries= max_entries
+        self.max_age= max_age
+
+        # (port, last seen) tuples in least recently seen first order
+        self.entries= collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, mac):
+        return mac in self.entries
+
+    def learn(self, mac, port, now= None):
+        '''
+        Record that mac was seen on port.
+
+        Returns the port the MAC was previously seen on if it moved,
+        None otherwise.
+        '''
+
+        now= time.time() if now is None else now
+        old= self.entries.pop(mac, None)
+
+        if old is None and len(self.entries) >= self.max_entries:
+            (evicted, (evicted_port, _))= self.entries.popitem(last= False)
+
+            self.on_remove(evicted, evicted_port)
+
+        self.entries[mac]= (port, now)
+
+        if old is not None and old[0] != port:
+            return old[0]
+
+        return None
+
+    def lookup(self, mac, now= None):
+        'Return the port mac was seen on or None if it is not known'
+
+        self.expire(now)
+
+        entry= self.entries.get(mac)
+
+        return entry[0] if entry is not None else None
+
+    def expire(self, now= None):
+        'Forget the mappings that were not refreshed in a while'
+
+        now= time.time() if now is None else now
+
+        # Entries are ordered by the time they were last seen,
+        # so only the oldest ones have to be looked at.
+        while self.entries:
+            mac= next(iter(self.entries))
+            (port, seen)= self.entries[mac]
+
+            if seen + self.max_age > now:
+                break
+
+            del self.entries[mac]
+
+            self.on_remove(mac, port)
+
+    def ports(self):
+        'Yield (mac, port) tuples of all learned mappings'
+
+        for (mac, (port, _)) in self.entries.items():
+            yield (mac, port)
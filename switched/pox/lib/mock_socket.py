@@ -48,6 +48,16 @@ class MockSocket (object):
     """
     return self.receiving.recv(max_size)
 
+  def recv_into (self, buf, nbytes=0):
+    """
+    receive data on this socket into buf.
+
+    Returns the number of bytes received, see recv()
+    """
+    data = self.recv(nbytes or len(buf))
+    buf[0:len(data)] = data
+    return len(data)
+
   def set_on_ready_to_recv (self, on_ready):
     """
     set a handler function on_ready(socket, size) to be called when
@@ -25,6 +25,8 @@ class SocketWedge (object):
 
   def send (self, string, *args, **kw):
     r = self._socket.send(string, *args, **kw)
+    if isinstance(string, memoryview):
+      string = string.tobytes()
     self._send_out(string, r)
     return r
 
@@ -33,6 +35,12 @@ class SocketWedge (object):
     self._recv_out(r)
     return r
 
+  def recv_into (self, buf, nbytes = 0, *args, **kw):
+    r = self._socket.recv_into(buf, nbytes, *args, **kw)
+    self._recv_out(buf[:r].tobytes() if isinstance(buf, memoryview)
+                   else str(buf[:r]))
+    return r
+
   def __getattr__ (self, n):
     return getattr(self._socket, n)
 
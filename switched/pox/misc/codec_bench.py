@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Microbenchmark for packing and unpacking OpenFlow messages
+
+Packs and unpacks the message types a controller handles the most of and
+reports how many messages per second libopenflow_01 gets through.
+Messages are unpacked from a memoryview of a bytearray, just like
+Connections do with their receive buffer.  The lazy column is for
+unpack_lazy() on messages that are not looked at afterwards.
+
+Example:
+  ./pox.py misc.codec_bench --count=50000
+
+Options:
+  --count       Number of messages to pack and unpack per type
+                (default 20000)
+  --types       Comma separated list of types to run (default: all of
+                packet_in,packet_out,flow_mod,flow_removed,flow_stats,
+                port_stats)
+  --no_quit     Keep POX running after the benchmark
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.util import str_to_bool
+import timeit
+import gc
+
+log = core.getLogger()
+
+
+def _match ():
+  return of.ofp_match(in_port = 1, dl_src = EthAddr("02:00:00:00:00:01"),
+                      dl_dst = EthAddr("02:00:00:00:00:02"),
+                      dl_type = 0x800, nw_proto = 6,
+                      nw_src = IPAddr("10.0.1.2"), nw_dst = IPAddr("10.0.2.2"),
+                      tp_src = 40000, tp_dst = 80)
+
+def _actions ():
+  return [of.ofp_action_dl_addr.set_src(EthAddr("00:ff:00:00:00:02")),
+          of.ofp_action_dl_addr.set_dst(EthAddr("02:00:00:00:00:02")),
+          of.ofp_action_output(port = 2)]
+
+def packet_in ():
+  return of.ofp_packet_in(in_port = 1, buffer_id = 17, total_len = 1500,
+                          reason = of.OFPR_NO_MATCH, data = b'x' * 128)
+
+def packet_out ():
+  return of.ofp_packet_out(buffer_id = 17, in_port = 1, actions = _actions())
+
+def flow_mod ():
+  return of.ofp_flow_mod(match = _match(), idle_timeout = 10,
+                         hard_timeout = 30, buffer_id = 17,
+                         actions = _actions())
+
+def flow_removed ():
+  return of.ofp_flow_removed(match = _match(), cookie = 1, priority = 100,
+                             reason = of.OFPRR_IDLE_TIMEOUT,
+                             duration_sec = 10, idle_timeout = 10,
+                             packet_count = 1000, byte_count = 150000)
+
+def flow_stats ():
+  body = [of.ofp_flow_stats(match = _match(), priority = 100,
+                            duration_sec = 10, packet_count = 1000,
+                            byte_count = 150000, actions = _actions())
+          for i in range(10)]
+  return of.ofp_stats_reply(type = of.OFPST_FLOW, body = body)
+
+def port_stats ():
+  body = [of.ofp_port_stats(port_no = p, rx_packets = 1000, tx_packets = 1000,
+                            rx_bytes = 150000, tx_bytes = 150000)
+          for p in range(1, 11)]
+  return of.ofp_stats_reply(type = of.OFPST_PORT, body = body)
+
+_types = [packet_in, packet_out, flow_mod, flow_removed, flow_stats,
+          port_stats]
+
+
+def bench (make, count):
+  """
+  Returns (packs/s, unpacks/s, lazy unpacks/s) for the message made by
+  make()
+  """
+  msg = make()
+  raw = msg.pack()
+  cls = type(msg)
+
+  pack = msg.pack
+  gc.collect()
+  start = timeit.default_timer()
+  for i in xrange(count):
+    pack()
+  pack_time = timeit.default_timer() - start
+
+  view = memoryview(bytearray(raw))
+  unpack_new = cls.unpack_new
+  start = timeit.default_timer()
+  for i in xrange(count):
+    unpack_new(view)
+  unpack_time = timeit.default_timer() - start
+
+  unpack_lazy = cls.unpack_lazy
+  start = timeit.default_timer()
+  for i in xrange(count):
+    unpack_lazy(view)
+  lazy_time = timeit.default_timer() - start
+
+  assert unpack_new(view)[1] == msg
+  assert unpack_lazy(view)[1] == msg
+  return (count / pack_time, count / unpack_time, count / lazy_time)
+
+
+def launch (count = 20000, types = None, no_quit = False):
+  count = int(count)
+  if types:
+    names = types.split(",")
+    run_types = [t for t in _types if t.__name__ in names]
+  else:
+    run_types = _types
+
+  def run ():
+    try:
+      log.info("%-14s %12s %12s %12s", "type", "pack/s", "unpack/s",
+               "lazy/s")
+      for make in run_types:
+        (packs, unpacks, lazy) = bench(make, count)
+        log.info("%-14s %12.0f %12.0f %12.0f", make.__name__, packs, unpacks,
+                 lazy)
+    except Exception:
+      log.exception("Benchmark failed")
+    if not str_to_bool(no_quit):
+      core.quit()
+
+  def start (event):
+    core.callLater(run)
+
+  core.addListenerByName("UpEvent", start)
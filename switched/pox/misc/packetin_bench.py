@@ -0,0 +1,458 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Synthetic PacketIn load generator for benchmarking controller apps
+
+This runs the OpenFlow apps loaded alongside it against a simulated switch
+without booting Mininet.  The switch is connected to a regular of_01
+Connection through a pair of MockSockets, so the full path from reading
+and unpacking a packet_in to sending the resulting messages is measured.
+
+The switch has a number of simulated hosts attached which send IP traffic
+to each other, answer ARP requests that the controller outputs, and (with
+--routed) resolve the gateway of their subnet (10.0.<port>.1) before
+sending IP packets to it.  Hosts live at 10.0.<port>.<2..254>.
+
+By default the switch buffers packets and keeps a flow table, so flows
+installed by the controller absorb later packets just as on real switches.
+Flow entries never time out during a run.
+
+Example:
+  ./pox.py controller misc.packetin_bench --hosts=150 --packets=20000
+
+Options:
+  --hosts       Number of simulated hosts (default 60)
+  --ports       Number of switch ports the hosts are spread over (default 3)
+  --packets     Number of packets the hosts send (default 10000)
+  --flows       Number of concurrently active flows (default 200)
+  --tcp_ratio   Fraction of flows that are TCP instead of UDP (default 0.5)
+  --arp_ratio   Fraction of packets that are broadcast ARP requests
+                (default 0.05)
+  --churn       Probability that a packet is preceded by a host being
+                replaced by a new one with a new MAC (default 0.0)
+  --routed      Send IP packets to the subnet gateway instead of directly
+                to the destination host
+  --no_buffer   Do not buffer packets on the switch
+  --no_table    Do not keep a flow table, every packet is a packet_in
+  --seed        Random seed (default 0)
+  --no_quit     Keep POX running after the benchmark
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.openflow.of_01 import Connection
+from pox.openflow.flow_table import FlowTable, TableEntry
+from pox.openflow.util import make_type_to_unpacker_table
+from pox.lib.mock_socket import MockSocket
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.packet.ethernet import ethernet
+from pox.lib.packet.arp import arp
+from pox.lib.packet.ipv4 import ipv4
+from pox.lib.packet.tcp import tcp
+from pox.lib.packet.udp import udp
+from pox.lib.util import str_to_bool, Samples
+from collections import deque, OrderedDict
+import random
+import resource
+import timeit
+import gc
+
+log = core.getLogger()
+
+_unpackers = make_type_to_unpacker_table()
+
+BROADCAST = EthAddr("ff:ff:ff:ff:ff:ff")
+
+
+class SimHost (object):
+  """
+  A host attached to the simulated switch
+  """
+  def __init__ (self, port, ip, mac):
+    self.port = port
+    self.ip = ip
+    self.mac = mac
+    self.gateway_mac = None
+
+  @property
+  def gateway_ip (self):
+    return IPAddr("10.0.%i.1" % (self.port,))
+
+
+class MockSwitch (object):
+  """
+  The switch end of a MockSocket pair
+
+  Answers the handshake, keeps a flow table and packet buffers, and hands
+  packets output by the controller to the hosts.
+  """
+  def __init__ (self, sock, dpid, ports, buffered = True, table = True):
+    self.sock = sock
+    self.dpid = dpid
+    self.ports = ports
+    self.buffered = buffered
+    self.table = FlowTable() if table else None
+    self.buf = b''
+
+    # Like on real switches only the most recent packets are kept
+    self.buffers = OrderedDict()
+    self.n_buffers = 256
+    self._next_buffer_id = 1
+
+    # Called with (packet, port) for every packet output by the switch
+    self.on_output = None
+
+    self.message_counts = {}
+    self.bytes_received = 0
+
+  def send (self, msg):
+    self.sock.send(msg.pack())
+
+  def send_packet_in (self, in_port, packet):
+    data = packet.pack()
+    buffer_id = None
+    if self.buffered:
+      buffer_id = self._next_buffer_id
+      self._next_buffer_id += 1
+      self.buffers[buffer_id] = (in_port, data)
+      if len(self.buffers) > self.n_buffers:
+        self.buffers.popitem(last = False)
+    self.send(of.ofp_packet_in(in_port = in_port, data = data,
+                               buffer_id = buffer_id,
+                               reason = of.OFPR_NO_MATCH))
+
+  def poll (self):
+    """
+    Process everything the controller sent
+    """
+    d = self.sock.recv()
+    if not d: return
+    self.bytes_received += len(d)
+    self.buf += d
+
+    offset = 0
+    while len(self.buf) - offset >= 8:
+      ofp_type = ord(self.buf[offset+1])
+      msg_length = ord(self.buf[offset+2]) << 8 | ord(self.buf[offset+3])
+      if len(self.buf) - offset < msg_length: break
+      offset,msg = _unpackers[ofp_type](self.buf, offset)
+
+      name = of.ofp_type_map.get(ofp_type, str(ofp_type))
+      self.message_counts[name] = self.message_counts.get(name, 0) + 1
+
+      h = getattr(self, "_rx_" + name, None)
+      if h: h(msg)
+
+    self.buf = self.buf[offset:]
+
+  def _rx_OFPT_FEATURES_REQUEST (self, msg):
+    ports = [of.ofp_phy_port(port_no = p,
+                             hw_addr = EthAddr("00:ff:00:00:00:%02x" % (p,)),
+                             name = "eth%i" % (p,))
+             for p in range(1, self.ports + 1)]
+    self.send(of.ofp_features_reply(xid = msg.xid, datapath_id = self.dpid,
+                                    n_buffers = self.n_buffers, n_tables = 1,
+                                    ports = ports))
+
+  def _rx_OFPT_BARRIER_REQUEST (self, msg):
+    self.send(of.ofp_barrier_reply(xid = msg.xid))
+
+  def _rx_OFPT_ECHO_REQUEST (self, msg):
+    self.send(of.ofp_echo_reply(xid = msg.xid))
+
+  def _rx_OFPT_FLOW_MOD (self, msg):
+    if self.table is not None:
+      if msg.command == of.OFPFC_ADD:
+        self.table.add_entry(TableEntry.from_flow_mod(msg))
+      elif msg.command in (of.OFPFC_DELETE, of.OFPFC_DELETE_STRICT):
+        self.table.remove_matching_entries(msg.match, msg.priority,
+            strict = msg.command == of.OFPFC_DELETE_STRICT,
+            out_port = msg.out_port)
+    if msg.buffer_id is not None:
+      self._apply_actions(msg.actions, *self.buffers.pop(msg.buffer_id,
+                                                         (None, None)))
+
+  def _rx_OFPT_PACKET_OUT (self, msg):
+    if msg.buffer_id is not None:
+      (in_port, data) = self.buffers.pop(msg.buffer_id, (None, None))
+    else:
+      (in_port, data) = (msg.in_port, msg.data)
+    self._apply_actions(msg.actions, in_port, data)
+
+  def _apply_actions (self, actions, in_port, data):
+    """
+    Rewrite and output a packet according to a list of actions
+
+    Only MAC rewrites are applied, as that is all the hosts care about.
+    """
+    if not data: return
+    packet = ethernet(data)
+    for a in actions:
+      if a.type == of.OFPAT_SET_DL_SRC:
+        packet.src = a.dl_addr
+      elif a.type == of.OFPAT_SET_DL_DST:
+        packet.dst = a.dl_addr
+      elif a.type == of.OFPAT_OUTPUT and self.on_output:
+        self.on_output(packet, a.port)
+
+  def lookup (self, packet, in_port):
+    """
+    Returns True if the packet is handled by an entry in the flow table
+    """
+    if self.table is None: return False
+    return self.table.entry_for_packet(packet, in_port) is not None
+
+
+class PacketInBench (object):
+  """
+  Drives the simulated hosts and collects statistics
+  """
+  def __init__ (self, hosts, ports, packets, flows, tcp_ratio, arp_ratio,
+                churn, routed, buffered, table, seed):
+    self.n_hosts = hosts
+    self.n_ports = ports
+    self.n_packets = packets
+    self.n_flows = flows
+    self.tcp_ratio = tcp_ratio
+    self.arp_ratio = arp_ratio
+    self.churn = churn
+    self.routed = routed
+    self.buffered = buffered
+    self.use_table = table
+    self.random = random.Random(seed)
+
+    self._next_mac = 1
+    self.hosts = []
+    self.hosts_by_ip = {}
+    self.flows = []
+
+    # Packets the hosts send in response to the controller, these are
+    # sent before the next generated packet.
+    self.pending = deque()
+
+    self.offered = 0
+    self.table_hits = 0
+    self.packet_ins = 0
+    self.arp_packet_ins = 0
+    self.latencies = Samples(None)
+
+  def _new_mac (self):
+    mac = EthAddr("02:00:00:%02x:%02x:%02x" % ((self._next_mac >> 16) & 0xff,
+                                              (self._next_mac >> 8) & 0xff,
+                                              self._next_mac & 0xff))
+    self._next_mac += 1
+    return mac
+
+  def _make_hosts (self):
+    if self.n_hosts > self.n_ports * 253:
+      raise RuntimeError("At most 253 hosts per port are supported")
+    for slot in range(self.n_hosts):
+      port = slot % self.n_ports + 1
+      ip = IPAddr("10.0.%i.%i" % (port, slot // self.n_ports + 2))
+      host = SimHost(port, ip, self._new_mac())
+      self.hosts.append(host)
+      self.hosts_by_ip[ip] = host
+
+    for i in range(self.n_flows):
+      src = self.random.randrange(self.n_hosts)
+      dst = self.random.randrange(self.n_hosts - 1)
+      if dst >= src: dst += 1
+      proto = tcp if self.random.random() < self.tcp_ratio else udp
+      self.flows.append((src, dst, proto, self.random.randint(1024, 65535),
+                         self.random.choice([22, 80, 443, 5001])))
+
+  def _replace_host (self):
+    """
+    Churn: a host leaves and a new one with the same IP shows up
+    """
+    slot = self.random.randrange(self.n_hosts)
+    old = self.hosts[slot]
+    host = SimHost(old.port, old.ip, self._new_mac())
+    self.hosts[slot] = host
+    self.hosts_by_ip[host.ip] = host
+
+  def _arp_request (self, host, ip):
+    a = arp(opcode = arp.REQUEST, hwsrc = host.mac, hwdst = EthAddr(None),
+            protosrc = host.ip, protodst = ip)
+    return ethernet(src = host.mac, dst = BROADCAST,
+                    type = ethernet.ARP_TYPE, payload = a)
+
+  def _ip_packet (self, flow):
+    (src, dst, proto, sport, dport) = flow
+    src = self.hosts[src]
+    dst = self.hosts[dst]
+
+    if self.routed:
+      if src.gateway_mac is None:
+        # Resolve the gateway first
+        return (src.port, self._arp_request(src, src.gateway_ip))
+      dst_mac = src.gateway_mac
+    else:
+      dst_mac = dst.mac
+
+    l4 = proto(srcport = sport, dstport = dport)
+    if proto is tcp:
+      l4.off = 5
+      l4.flags = tcp.ACK_flag
+    l4.payload = b'x' * 64
+    ip = ipv4(srcip = src.ip, dstip = dst.ip,
+              protocol = ipv4.TCP_PROTOCOL if proto is tcp
+                         else ipv4.UDP_PROTOCOL,
+              payload = l4)
+    return (src.port, ethernet(src = src.mac, dst = dst_mac,
+                               type = ethernet.IP_TYPE, payload = ip))
+
+  def _generate (self):
+    if self.churn and self.random.random() < self.churn:
+      self._replace_host()
+
+    if self.random.random() < self.arp_ratio:
+      src = self.random.choice(self.hosts)
+      if self.routed:
+        target = src.gateway_ip
+      else:
+        target = self.random.choice(self.hosts).ip
+      return (src.port, self._arp_request(src, target))
+
+    return self._ip_packet(self.random.choice(self.flows))
+
+  def _on_output (self, packet, port):
+    """
+    Let the hosts react to packets the switch outputs
+    """
+    if packet.type != ethernet.ARP_TYPE: return
+    a = packet.payload
+    host = self.hosts_by_ip.get(a.protodst)
+    if host is None: return
+
+    if a.opcode == arp.REQUEST:
+      r = arp(opcode = arp.REPLY, hwsrc = host.mac, hwdst = a.hwsrc,
+              protosrc = host.ip, protodst = a.protosrc)
+      self.pending.append((host.port,
+                           ethernet(src = host.mac, dst = a.hwsrc,
+                                    type = ethernet.ARP_TYPE, payload = r)))
+    elif a.opcode == arp.REPLY and a.protosrc == host.gateway_ip:
+      host.gateway_mac = a.hwsrc
+
+  def _connect (self):
+    (ctl_sock, sw_sock) = MockSocket.pair()
+    self.switch = MockSwitch(sw_sock, 0x42, self.n_ports,
+                             buffered = self.buffered, table = self.use_table)
+    self.switch.on_output = self._on_output
+    self.switch.send(of.ofp_hello())
+    self.connection = Connection(ctl_sock)
+
+    for i in range(10):
+      self._exchange()
+      if self.connection.connect_time is not None: break
+    else:
+      raise RuntimeError("Handshake with simulated switch failed")
+
+  def _exchange (self):
+    """
+    Let the controller handle everything the switch sent and vice versa
+
+    Returns the time the controller spent.
+    """
+    t = 0
+    while self.connection.sock.ready_to_recv():
+      start = timeit.default_timer()
+      self.connection.read()
+      self.connection.flush()
+      t += timeit.default_timer() - start
+    self.switch.poll()
+    return t
+
+  def run (self):
+    self._make_hosts()
+    self._connect()
+
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    while self.offered < self.n_packets or self.pending:
+      if self.pending:
+        (port, packet) = self.pending.popleft()
+      else:
+        (port, packet) = self._generate()
+        self.offered += 1
+
+      if self.switch.lookup(packet, port):
+        self.table_hits += 1
+        continue
+
+      self.switch.send_packet_in(port, packet)
+      self.packet_ins += 1
+      if packet.type == ethernet.ARP_TYPE:
+        self.arp_packet_ins += 1
+      self.latencies.add(self._exchange())
+
+    gc.collect()
+    self.objects_growth = len(gc.get_objects()) - objects_before
+    self.rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                       - rss_before)
+
+    self.connection.disconnect("benchmark finished")
+
+  def report (self):
+    total = self.latencies.total
+    def percentile (p):
+      return self.latencies.percentile(p) or 0
+
+    counts = self.switch.message_counts
+
+    log.info("Packets offered:      %i (%i handled by flow table)",
+             self.offered, self.table_hits)
+    log.info("Packet-ins:           %i (%i ARP)",
+             self.packet_ins, self.arp_packet_ins)
+    log.info("Packet-ins/s:         %.0f",
+             self.packet_ins / total if total else 0)
+    log.info("Latency p50/p99:      %.3f / %.3f ms",
+             percentile(50) * 1000, percentile(99) * 1000)
+    log.info("Flow mods:            %i", counts.get('OFPT_FLOW_MOD', 0))
+    log.info("Packet outs:          %i", counts.get('OFPT_PACKET_OUT', 0))
+    log.info("Bytes to switch:      %i", self.switch.bytes_received)
+    if self.switch.table is not None:
+      log.info("Flow table size:      %i", len(self.switch.table))
+    log.info("Memory growth:        %i KiB max RSS, %i objects",
+             self.rss_growth, self.objects_growth)
+
+
+def launch (hosts = 60, ports = 3, packets = 10000, flows = 200,
+            tcp_ratio = 0.5, arp_ratio = 0.05, churn = 0.0, routed = False,
+            no_buffer = False, no_table = False, seed = 0, no_quit = False):
+  bench = PacketInBench(hosts = int(hosts), ports = int(ports),
+                        packets = int(packets), flows = int(flows),
+                        tcp_ratio = float(tcp_ratio),
+                        arp_ratio = float(arp_ratio), churn = float(churn),
+                        routed = str_to_bool(routed),
+                        buffered = not str_to_bool(no_buffer),
+                        table = not str_to_bool(no_table), seed = int(seed))
+
+  def run ():
+    try:
+      bench.run()
+      bench.report()
+    except Exception:
+      log.exception("Benchmark failed")
+    if not str_to_bool(no_quit):
+      core.quit()
+
+  def start (event):
+    core.callLater(run)
+
+  core.addListenerByName("UpEvent", start)
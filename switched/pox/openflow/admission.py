@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Admission control for packet-ins.
+
+Limits the rate at which packet-ins of a switch are handed to the rest
+of the controller, per switch and per switch port.  Packet-ins above the
+rate are shed, or with --mode=sample, one out of every --sample of them
+is let through.  The switch is told to free the buffers of the shed
+packet-ins that it buffered.  A PacketInShedding event is raised on
+core.openflow and on the connection when a switch or port starts being
+shed and when it is let through again, so that apps can install coarse
+drop or flood rules.
+
+Switches with more than --max_backlog bytes of unsent data are not read
+from until the backlog is down to half of that.
+
+It supports the following commandline options:
+ --switch_rate=X   Packet-ins per second per switch (default 1000)
+ --switch_burst=X  Burst size per switch (default 2 * switch_rate)
+ --port_rate=X     Packet-ins per second per port (default 200)
+ --port_burst=X    Burst size per port (default 2 * port_rate)
+ --mode=X          shed or sample (default shed)
+ --sample=X        Let every Xth packet-in above the rate through in
+                   sample mode (default 10)
+ --max_backlog=X   Stop reading from switches with more than X bytes
+                   of unsent data (default 1048576)
+"""
+
+from pox.core import core
+from pox.openflow import PacketInShedding
+import pox.openflow.libopenflow_01 as of
+from pox.lib.recoco import Timer
+import time
+
+log = core.getLogger()
+
+class TokenBucket (object):
+  """
+  Allows on average rate events per second, in bursts of up to burst
+  """
+  __slots__ = ('rate', 'burst', 'tokens', 'last')
+
+  def __init__ (self, rate, burst, now):
+    self.rate = rate
+    self.burst = burst
+    self.tokens = burst
+    self.last = now
+
+  def take (self, now):
+    """
+    Consume a token, returns False if there is none left
+    """
+    self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+    self.last = now
+    if self.tokens < 1:
+      return False
+    self.tokens -= 1
+    return True
+
+
+class PacketInAdmission (object):
+  """
+  Decides which packet-ins of a connection are handled
+
+  Connections consult their admission object (if they have one) before
+  raising PacketIn events.
+  """
+  # Seconds without shedding after which shedding counts as stopped
+  hold_time = 1.0
+
+  def __init__ (self, connection, switch_rate = 1000, switch_burst = None,
+                port_rate = 200, port_burst = None, mode = 'shed',
+                sample = 10):
+    now = time.time()
+    self.connection = connection
+    self.port_rate = port_rate
+    self.port_burst = port_burst or 2 * port_rate
+    self.mode = mode
+    self.sample = sample
+
+    self.switch = TokenBucket(switch_rate, switch_burst or 2 * switch_rate, now)
+    self.ports = {} # in_port -> TokenBucket
+
+    # What is being shed (port numbers and None for the whole switch)
+    # -> when it was last shed
+    self.shedding = {}
+
+    self.admitted = 0
+    self.shed = 0
+
+    # Incoming packet-ins per second, measured over about a second
+    self.rate = 0.0
+    self._rate_start = now
+    self._rate_count = 0
+
+  def _measure (self, now):
+    self._rate_count += 1
+    elapsed = now - self._rate_start
+    if elapsed >= 1:
+      self.rate = self._rate_count / elapsed
+      self._rate_start = now
+      self._rate_count = 0
+
+  def _raise (self, port, started):
+    con = self.connection
+    if started:
+      log.warning("%s: Shedding packet-ins from %s at %.0f/s", con,
+                  "the switch" if port is None else "port %s" % (port,),
+                  self.rate)
+    else:
+      log.info("%s: No longer shedding packet-ins from %s", con,
+               "the switch" if port is None else "port %s" % (port,))
+    e = con.ofnexus.raiseEventNoErrors(PacketInShedding, con, port, started,
+                                       self.rate)
+    if e is None or e.halt != True:
+      con.raiseEventNoErrors(PacketInShedding, con, port, started, self.rate)
+
+  def admit (self, ofp):
+    """
+    Returns whether a packet-in should be handled
+    """
+    now = time.time()
+    self._measure(now)
+
+    port = ofp.in_port
+    bucket = self.ports.get(port)
+    if bucket is None:
+      bucket = TokenBucket(self.port_rate, self.port_burst, now)
+      self.ports[port] = bucket
+
+    # The port is checked first, so that a single busy port does not
+    # use up the tokens of the whole switch.
+    if not bucket.take(now):
+      over = port
+    elif not self.switch.take(now):
+      over = None
+    else:
+      self.admitted += 1
+      if self.shedding:
+        for key in (port, None):
+          last = self.shedding.get(key)
+          if last is not None and now - last >= self.hold_time:
+            del self.shedding[key]
+            self._raise(key, False)
+      return True
+
+    if over not in self.shedding:
+      self.shedding[over] = now
+      self._raise(over, True)
+    else:
+      self.shedding[over] = now
+
+    self.shed += 1
+    if self.mode == 'sample' and self.shed % self.sample == 0:
+      return True
+    if ofp.buffer_id is not None:
+      # A packet-out without actions drops the packet right away, instead
+      # of keeping the switch's buffer busy until it times out
+      self.connection.send(of.ofp_packet_out(buffer_id = ofp.buffer_id,
+                                             in_port = ofp.in_port))
+    return False
+
+  def expire (self, now = None):
+    """
+    Stops shedding what was not shed for hold_time
+
+    admit() only notices that when another packet-in comes in, this
+    catches ports that went quiet.
+    """
+    if now is None: now = time.time()
+    for key, last in self.shedding.items():
+      if now - last >= self.hold_time:
+        del self.shedding[key]
+        self._raise(key, False)
+
+
+class Admission (object):
+  """
+  Sets up admission control for every switch that connects
+  """
+  def __init__ (self, max_backlog, **options):
+    self.max_backlog = max_backlog
+    self.options = options
+    core.openflow.addListeners(self)
+    Timer(PacketInAdmission.hold_time, self._expire, recurring = True)
+
+  def _expire (self):
+    now = time.time()
+    for con in core.openflow.connections:
+      if con.admission is not None and con.admission.shedding:
+        con.admission.expire(now)
+
+  def _handle_ConnectionUp (self, event):
+    con = event.connection
+    con.admission = PacketInAdmission(con, **self.options)
+    con.max_backlog = self.max_backlog
+    con.backlog_action = 'backpressure'
+
+
+def launch (switch_rate = 1000, switch_burst = None, port_rate = 200,
+            port_burst = None, mode = 'shed', sample = 10,
+            max_backlog = 1024 * 1024):
+  if mode not in ('shed', 'sample'):
+    raise RuntimeError("Unknown mode " + mode)
+
+  def start ():
+    core.registerNew(Admission, max_backlog = int(max_backlog),
+                     switch_rate = float(switch_rate),
+                     switch_burst = float(switch_burst or 0),
+                     port_rate = float(port_rate),
+                     port_burst = float(port_burst or 0),
+                     mode = mode, sample = int(sample))
+  core.call_when_ready(start, "openflow", __name__)
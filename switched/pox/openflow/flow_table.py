@@ -193,12 +193,81 @@ class FlowTableModification (Event):
     self.reason = reason
 
 
+class _Subtable (object):
+  """
+  The entries of a FlowTable whose matches compile to the same mask
+
+  Entries are hashed by their compiled match key, so a packet's entry is
+  found by masking the packet's key with the subtable's mask.
+  """
+  def __init__ (self, mask, nw_src_bits, nw_dst_bits):
+    self.mask = mask
+    self.nw_src_bits = nw_src_bits
+    self.nw_dst_bits = nw_dst_bits
+
+    # key -> list of (order, entry), highest order first
+    self.buckets = {}
+
+    # effective_priority -> number of entries, and the highest of them
+    self.priorities = {}
+    self.max_priority = -1
+
+  def add (self, key, order, entry):
+    bucket = self.buckets.setdefault(key, [])
+    _insert(bucket, (order, entry))
+    priority = order[0]
+    self.priorities[priority] = self.priorities.get(priority, 0) + 1
+    if priority > self.max_priority:
+      self.max_priority = priority
+      return True
+    return False
+
+  def remove (self, key, order, entry):
+    bucket = self.buckets[key]
+    bucket.remove((order, entry))
+    if not bucket:
+      del self.buckets[key]
+    priority = order[0]
+    count = self.priorities[priority] - 1
+    if count:
+      self.priorities[priority] = count
+      return False
+    del self.priorities[priority]
+    if priority != self.max_priority:
+      return False
+    self.max_priority = max(self.priorities) if self.priorities else -1
+    return True
+
+
+def _insert (entries, item):
+  """
+  Inserts (order, entry) into a list that is sorted by descending order
+  """
+  order = item[0]
+  low = 0
+  high = len(entries)
+  while low < high:
+    middle = (low + high) // 2
+    if order > entries[middle][0]:
+      high = middle
+    else:
+      low = middle + 1
+  entries.insert(low, item)
+
+
 class FlowTable (EventMixin):
   """
   General model of a flow table.
 
   Maintains an ordered list of flow entries, and finds matching entries for
   packets and other entries. Supports expiration of flows.
+
+  Packets are looked up with a tuple space search: entries are grouped into
+  subtables by the mask of their compiled match, and each subtable hashes
+  its entries by their match key.  A lookup probes the subtables in order
+  of their highest priority and stops once no subtable can beat what was
+  found.  Entries and their matches must not be changed while they are in
+  the table.
   """
   _eventMixin_events = set([FlowTableModification])
 
@@ -208,6 +277,22 @@ class FlowTable (EventMixin):
     # Table is a list of TableEntry sorted by descending effective_priority.
     self._table = []
 
+    # The order of an entry is (effective_priority, n) for the nth added
+    # entry, so it is highest for the entry that comes first in _table.
+    self._added = 0
+
+    # mask -> _Subtable, and the subtables by descending max_priority
+    self._subtables = {}
+    self._subtable_order = []
+    self._subtable_order_dirty = False
+
+    # (order, entry) for entries whose match can not be compiled, sorted
+    # by descending order
+    self._uncompiled = []
+
+    # entry -> [(order, key, mask)], in case an entry is in _table twice
+    self._positions = {}
+
   def _dirty (self):
     """
     Call when table changes
@@ -242,6 +327,7 @@ class FlowTable (EventMixin):
         low = middle + 1
     table.insert(low, entry)
 
+    self._classify(entry)
     self._dirty()
 
     self.raiseEvent(FlowTableModification(added=[entry]))
@@ -249,6 +335,7 @@ class FlowTable (EventMixin):
   def remove_entry (self, entry, reason=None):
     assert isinstance(entry, TableEntry)
     self._table.remove(entry)
+    self._unclassify(entry)
     self._dirty()
     self.raiseEvent(FlowTableModification(removed=[entry], reason=reason))
 
@@ -285,6 +372,7 @@ class FlowTable (EventMixin):
       entry = self._table[i]
       if entry in remove_flows:
         del self._table[i]
+        self._unclassify(entry)
         remove_flows.remove(entry)
         if not remove_flows: break
       else:
@@ -319,12 +407,82 @@ class FlowTable (EventMixin):
     """
     packet_match = ofp_match.from_packet(packet, in_port, spec_frags = True)
 
-    for entry in self._table:
-      if entry.match.matches_with_wildcards(packet_match,
-                                            consider_other_wildcards=False):
-        return entry
+    packet_key = packet_match._compile()[0]
+    if packet_key is None:
+      for entry in self._table:
+        if entry.match.matches_with_wildcards(packet_match,
+                                              consider_other_wildcards=False):
+          return entry
+      return None
+
+    # Wider address wildcards than an entry's never match (see
+    # ofp_match.matches_with_wildcards())
+    w = packet_match._wildcards
+    nw_src_bits = (w & OFPFW_NW_SRC_MASK) >> OFPFW_NW_SRC_SHIFT
+    nw_dst_bits = (w & OFPFW_NW_DST_MASK) >> OFPFW_NW_DST_SHIFT
+
+    if self._subtable_order_dirty:
+      self._subtable_order.sort(key=lambda s: s.max_priority, reverse=True)
+      self._subtable_order_dirty = False
+
+    best = None
+    for subtable in self._subtable_order:
+      if best is not None and subtable.max_priority < best[0][0]: break
+      if nw_src_bits > subtable.nw_src_bits: continue
+      if nw_dst_bits > subtable.nw_dst_bits: continue
+      bucket = subtable.buckets.get(packet_key & subtable.mask)
+      if bucket is not None:
+        if best is None or bucket[0][0] > best[0]:
+          best = bucket[0]
+
+    for item in self._uncompiled:
+      if best is not None and item[0] < best[0]: break
+      if item[1].match.matches_with_wildcards(packet_match,
+                                              consider_other_wildcards=False):
+        best = item
+        break
+
+    return best[1] if best is not None else None
 
-    return None
+  def _classify (self, entry):
+    """
+    Adds a newly added entry to its subtable
+    """
+    self._added += 1
+    order = (entry.effective_priority, self._added)
+    key,mask,nw_src_bits,nw_dst_bits = entry.match._compile()
+    if mask is None:
+      _insert(self._uncompiled, (order, entry))
+    else:
+      subtable = self._subtables.get(mask)
+      if subtable is None:
+        subtable = _Subtable(mask, nw_src_bits, nw_dst_bits)
+        self._subtables[mask] = subtable
+        self._subtable_order.append(subtable)
+      if subtable.add(key, order, entry):
+        self._subtable_order_dirty = True
+    self._positions.setdefault(entry, []).append((order, key, mask))
+
+  def _unclassify (self, entry):
+    """
+    Removes an entry that was removed from _table from its subtable
+    """
+    # When an entry is in _table twice, the first one is removed, which
+    # is the one added last
+    positions = self._positions[entry]
+    order,key,mask = positions.pop()
+    if not positions:
+      del self._positions[entry]
+    if mask is None:
+      self._uncompiled.remove((order, entry))
+      return
+    subtable = self._subtables[mask]
+    if subtable.remove(key, order, entry):
+      if subtable.max_priority < 0:
+        del self._subtables[mask]
+        self._subtable_order.remove(subtable)
+      else:
+        self._subtable_order_dirty = True
 
   def check_for_overlapping_entry (self, in_entry):
     """
@@ -28,6 +28,7 @@ import time
 from pox.lib.socketcapture import CaptureSocket
 import pox.openflow.debug
 from pox.openflow.util import make_type_to_unpacker_table
+from pox.openflow.transactions import TransactionTable
 from pox.openflow import *
 
 log = core.getLogger()
@@ -35,29 +36,20 @@ log = core.getLogger()
 import socket
 import select
 
+import pox.openflow.libopenflow_01 as of
+
 # List where the index is an OpenFlow message type (OFPT_xxx), and
 # the values are unpack functions that unpack the wire format of that
-# type into a message object.
-unpackers = make_type_to_unpacker_table()
-
-try:
-  PIPE_BUF = select.PIPE_BUF
-except:
-  try:
-    # Try to get it from where PyPy (sometimes) has it
-    import IN
-    PIPE_BUF = IN.PIPE_BUF
-  except:
-    # (Hopefully) reasonable default
-    PIPE_BUF = 512
+# type into a message object.  Packet-ins and flow removeds, which come
+# in large numbers, are only unpacked as far as handlers use them.
+unpackers = make_type_to_unpacker_table(
+    lazy_types = (of.OFPT_PACKET_IN, of.OFPT_FLOW_REMOVED))
 
-import pox.openflow.libopenflow_01 as of
-
-import threading
 import os
 import sys
 import exceptions
 from errno import EAGAIN, ECONNRESET, EADDRINUSE, EADDRNOTAVAIL
+from collections import deque
 
 
 import traceback
@@ -66,13 +58,17 @@ import traceback
 def handle_HELLO (con, msg): #S
   #con.msg("HELLO wire protocol " + hex(msg.version))
 
+  # The features request went out along with our hello
+  if con.features_requested: return
+
   # Send a features request
   msg = of.ofp_features_request()
   con.send(msg)
+  con.features_requested = True
 
 def handle_ECHO_REPLY (con, msg):
   #con.msg("Got echo reply")
-  pass
+  con.transactions.reply(msg)
 
 def handle_ECHO_REQUEST (con, msg): #S
   reply = msg
@@ -85,6 +81,46 @@ def handle_FLOW_REMOVED (con, msg): #A
   if e is None or e.halt != True:
     con.raiseEventNoErrors(FlowRemoved, con, msg)
 
+def _config_of (nexus):
+  return (nexus.miss_send_len, bool(nexus.clear_flows_on_connect))
+
+def _send_config (con, nexus):
+  if nexus.miss_send_len is not None:
+    con.send(of.ofp_set_config(miss_send_len = nexus.miss_send_len))
+  if nexus.clear_flows_on_connect:
+    con.send(of.ofp_flow_mod(match=of.ofp_match(),command=of.OFPFC_DELETE))
+
+def handshake_config ():
+  """
+  Returns the settings handshake_messages() sends, like _config_of()
+
+  The nexus a switch ends up with is only known once its features reply
+  is in, so the miss_send_len of core.openflow is used.  Flows are only
+  cleared if it is known that the switch's nexus wants that.
+  """
+  arbiter = core.OpenFlowConnectionArbiter
+  nexus = getattr(arbiter, 'fixed_nexus', lambda: None)()
+  clear = nexus is not None and bool(nexus.clear_flows_on_connect)
+  return (core.openflow.miss_send_len, clear)
+
+def handshake_messages ():
+  """
+  Returns everything it takes to bring a switch up and the barrier xid
+
+  The switch answers with its hello, the features reply and the barrier
+  reply without waiting for another round trip.  See handshake_config()
+  for the settings that are sent along.
+  """
+  miss_send_len, clear_flows = handshake_config()
+  msgs = [of.ofp_hello(), of.ofp_features_request()]
+  if miss_send_len is not None:
+    msgs.append(of.ofp_set_config(miss_send_len = miss_send_len))
+  if clear_flows:
+    msgs.append(of.ofp_flow_mod(match=of.ofp_match(),command=of.OFPFC_DELETE))
+  barrier = of.ofp_barrier_request()
+  msgs.append(barrier)
+  return b''.join(m.pack() for m in msgs), barrier.xid
+
 def handle_FEATURES_REPLY (con, msg):
   connecting = con.connect_time == None
   con.features = msg
@@ -97,6 +133,7 @@ def handle_FEATURES_REPLY (con, msg):
     e = con.ofnexus.raiseEventNoErrors(FeaturesReceived, con, msg)
     if e is None or e.halt != True:
       con.raiseEventNoErrors(FeaturesReceived, con, msg)
+    con.transactions.reply(msg)
     return
 
   nexus = core.OpenFlowConnectionArbiter.getNexus(con)
@@ -110,58 +147,37 @@ def handle_FEATURES_REPLY (con, msg):
   con.ofnexus._connect(con)
   #connections[con.dpid] = con
 
-  barrier = of.ofp_barrier_request()
-
-  listeners = []
-
-  def finish_connecting (event):
-    if event.xid != barrier.xid:
-      con.dpid = None
-      con.err("failed connect")
-      con.disconnect()
-    else:
-      con.info("connected")
-      con.connect_time = time.time()
-      e = con.ofnexus.raiseEventNoErrors(ConnectionUp, con, msg)
-      if e is None or e.halt != True:
-        con.raiseEventNoErrors(ConnectionUp, con, msg)
-      e = con.ofnexus.raiseEventNoErrors(FeaturesReceived, con, msg)
-      if e is None or e.halt != True:
-        con.raiseEventNoErrors(FeaturesReceived, con, msg)
-    con.removeListeners(listeners)
-  listeners.append(con.addListener(BarrierIn, finish_connecting))
-
-  def also_finish_connecting (event):
-    if event.xid != barrier.xid: return
-    if event.ofp.type != of.OFPET_BAD_REQUEST: return
-    if event.ofp.code != of.OFPBRC_BAD_TYPE: return
-    # Okay, so this is probably an HP switch that doesn't support barriers
-    # (ugh).  We'll just assume that things are okay.
-    finish_connecting(event)
-  listeners.append(con.addListener(ErrorIn, also_finish_connecting))
-
-  #TODO: Add a timeout for finish_connecting
-
-  if con.ofnexus.miss_send_len is not None:
-    con.send(of.ofp_set_config(miss_send_len =
-                                  con.ofnexus.miss_send_len))
-  if con.ofnexus.clear_flows_on_connect:
-    con.send(of.ofp_flow_mod(match=of.ofp_match(),command=of.OFPFC_DELETE))
-
-  con.send(barrier)
-
-  """
-  # Hack for old versions of cbench
-  class C (object):
-    xid = barrier.xid
-  finish_connecting(C())
-  """
+  if con.handshake_barrier is None:
+    # The handshake was not pipelined, so finish it now
+    _send_config(con, nexus)
+    barrier = of.ofp_barrier_request()
+    con.send(barrier)
+    con.handshake_barrier = barrier.xid
+  elif con.handshake_config != _config_of(nexus):
+    # The handshake went out with other settings than the nexus has, or
+    # without clearing the flows.  The switch gets them before anything
+    # an app sends after ConnectionUp.
+    _send_config(con, nexus)
+
+def _finish_connecting (con):
+  con.handshake_barrier = None
+  con.info("connected")
+  con.connect_time = time.time()
+  handshake_metrics.record(con.connect_time - con.accept_time)
+  msg = con.features
+  e = con.ofnexus.raiseEventNoErrors(ConnectionUp, con, msg)
+  if e is None or e.halt != True:
+    con.raiseEventNoErrors(ConnectionUp, con, msg)
+  e = con.ofnexus.raiseEventNoErrors(FeaturesReceived, con, msg)
+  if e is None or e.halt != True:
+    con.raiseEventNoErrors(FeaturesReceived, con, msg)
 
 def handle_STATS_REPLY (con, msg):
   e = con.ofnexus.raiseEventNoErrors(RawStatsReply, con, msg)
   if e is None or e.halt != True:
     con.raiseEventNoErrors(RawStatsReply, con, msg)
   con._incoming_stats_reply(msg)
+  con.transactions.reply(msg)
 
 def handle_PORT_STATUS (con, msg): #A
   if msg.reason == of.OFPPR_DELETE:
@@ -173,6 +189,8 @@ def handle_PORT_STATUS (con, msg): #A
     con.raiseEventNoErrors(PortStatus, con, msg)
 
 def handle_PACKET_IN (con, msg): #A
+  if con.admission is not None and not con.admission.admit(msg):
+    return
   e = con.ofnexus.raiseEventNoErrors(PacketIn, con, msg)
   if e is None or e.halt != True:
     con.raiseEventNoErrors(PacketIn, con, msg)
@@ -185,11 +203,25 @@ def handle_ERROR_MSG (con, msg): #A
   if err.should_log:
     log.error(str(con) + " OpenFlow Error:\n" +
               msg.show(str(con) + " Error: ").strip())
+  con.transactions.error(msg)
+  if (msg.xid == con.handshake_barrier and con.features is not None and
+      msg.type == of.OFPET_BAD_REQUEST and msg.code == of.OFPBRC_BAD_TYPE):
+    # Okay, so this is probably an HP switch that doesn't support barriers
+    # (ugh).  We'll just assume that things are okay.
+    _finish_connecting(con)
 
 def handle_BARRIER (con, msg):
   e = con.ofnexus.raiseEventNoErrors(BarrierIn, con, msg)
   if e is None or e.halt != True:
     con.raiseEventNoErrors(BarrierIn, con, msg)
+  con.transactions.reply(msg)
+  if con.connect_time is None and con.features is not None:
+    if msg.xid == con.handshake_barrier:
+      _finish_connecting(con)
+    else:
+      con.dpid = None
+      con.err("failed connect")
+      con.disconnect()
 
 # handlers for stats replies
 def handle_OFPST_DESC (con, parts):
@@ -240,6 +272,10 @@ def handle_OFPST_QUEUE (con, parts):
 def handle_VENDOR (con, msg):
   log.info("Vendor msg: " + str(msg))
 
+def handle_REPLY (con, msg):
+  # Replies nobody but requests wait for
+  con.transactions.reply(msg)
+
 
 # A list, where the index is an OFPT, and the value is a function to
 # call for that type
@@ -259,6 +295,8 @@ handlerMap = {
   of.OFPT_STATS_REPLY : handle_STATS_REPLY,
   of.OFPT_FLOW_REMOVED : handle_FLOW_REMOVED,
   of.OFPT_VENDOR : handle_VENDOR,
+  of.OFPT_GET_CONFIG_REPLY : handle_REPLY,
+  of.OFPT_QUEUE_GET_CONFIG_REPLY : handle_REPLY,
 }
 
 statsHandlerMap = {
@@ -270,113 +308,6 @@ statsHandlerMap = {
   of.OFPST_QUEUE : handle_OFPST_QUEUE,
 }
 
-# Deferred sending should be unusual, so don't worry too much about
-# efficiency
-class DeferredSender (threading.Thread):
-  """
-  Class that handles sending when a socket write didn't complete
-  """
-  def __init__ (self):
-    threading.Thread.__init__(self)
-    core.addListeners(self)
-    self._dataForConnection = {}
-    self._lock = threading.RLock()
-    self._waker = pox.lib.util.makePinger()
-    self.sending = False
-
-    self.start()
-
-  def _handle_GoingDownEvent (self, event):
-    self._waker.ping()
-
-  def _sliceup (self, data):
-    """
-    Takes an array of data bytes, and slices into elements of
-    PIPE_BUF bytes each
-    """
-    out = []
-    while len(data) > PIPE_BUF:
-      out.append(data[0:PIPE_BUF])
-      data = data[PIPE_BUF:]
-    if len(data) > 0:
-      out.append(data)
-    return out
-
-  def send (self, con, data):
-    with self._lock:
-      self.sending = True
-
-      data = self._sliceup(data)
-
-      if con not in self._dataForConnection:
-        self._dataForConnection[con] = data
-      else:
-        self._dataForConnection[con].extend(data)
-
-      self._waker.ping()
-
-  def kill (self, con):
-    with self._lock:
-      try:
-        del self._dataForConnection[con]
-      except:
-        pass
-
-      self._waker.ping()
-
-  def run (self):
-    while core.running:
-
-      with self._lock:
-        cons = self._dataForConnection.keys()
-
-      rlist, wlist, elist = select.select([self._waker], cons, cons, 5)
-      if not core.running: break
-
-      with self._lock:
-        if len(rlist) > 0:
-          self._waker.pongAll()
-
-        for con in elist:
-          try:
-            del self._dataForConnection[con]
-          except:
-            pass
-
-        for con in wlist:
-          try:
-            alldata = self._dataForConnection[con]
-            while len(alldata):
-              data = alldata[0]
-              try:
-                l = con.sock.send(data)
-                if l != len(data):
-                  alldata[0] = data[l:]
-                  break
-                del alldata[0]
-              except socket.error as (errno, strerror):
-                if errno != EAGAIN:
-                  con.msg("DeferredSender/Socket error: " + strerror)
-                  con.disconnect()
-                  del self._dataForConnection[con]
-                break
-              except:
-                con.msg("Unknown error doing deferred sending")
-                break
-            if len(alldata) == 0:
-              try:
-                del self._dataForConnection[con]
-                if len(self._dataForConnection) == 0:
-                  self.sending = False
-                  break
-              except:
-                pass
-          except:
-            try:
-              del self._dataForConnection[con]
-            except:
-              pass
-
 class DummyOFNexus (object):
   def raiseEventNoErrors (self, event, *args, **kw):
     log.warning("%s raised on dummy OpenFlow nexus" % event)
@@ -562,6 +493,10 @@ class PortCollection (object):
     r._ports = set(self.values())
 
 
+# Raw data Connection.send() queues as it is
+_buffer_types = (bytes, bytearray, memoryview)
+
+
 class Connection (EventMixin):
   """
   A Connection object represents a single TCP session with an
@@ -574,6 +509,7 @@ class Connection (EventMixin):
     PortStatus,
     FlowRemoved,
     PacketIn,
+    PacketInShedding,
     ErrorIn,
     BarrierIn,
     RawStatsReply,
@@ -583,12 +519,40 @@ class Connection (EventMixin):
     TableStatsReceived,
     PortStatsReceived,
     QueueStatsReceived,
+    StatsPartReceived,
+    StatsStreamComplete,
     FlowRemoved,
   ])
 
   # Globally unique identifier for the Connection instance
   ID = 0
 
+  # Number of bytes read from the socket at once
+  read_size = 16384
+
+  # Messages sent during a scheduler cycle are coalesced and sent at
+  # its end, or as soon as this many bytes are queued.  0 disables
+  # coalescing.
+  coalesce_size = 16384
+
+  # Data the socket does not take right away is kept in a backlog.
+  # When more than max_backlog bytes pile up the connection is
+  # disconnected or, with backlog_action 'backpressure', not read
+  # from until the backlog is down to half of that.
+  max_backlog = 4 * 1024 * 1024
+  backlog_action = 'disconnect'
+
+  # Decides which packet-ins are handled, see openflow.admission
+  admission = None
+
+  # OFPST types whose replies are not collected into one event but raised
+  # part by part as StatsPartReceived, followed by StatsStreamComplete.
+  # Set it on a single Connection to only stream that switch's replies.
+  stream_stats = frozenset()
+
+  # Seconds request() waits for a reply by default
+  request_timeout = 10
+
   def msg (self, m):
     #print str(self), m
     log.debug(str(self) + " " + str(m))
@@ -600,12 +564,44 @@ class Connection (EventMixin):
     #print str(self), m
     log.info(str(self) + " " + str(m))
 
-  def __init__ (self, sock):
-    self._previous_stats = []
+  def __init__ (self, sock, hello = True):
+    """
+    hello is False for sockets that were handed over with the handshake
+    already sent, see openflow.shard
+    """
+    # Parts of the stats replies that are not complete yet, by (xid, type).
+    # For streamed replies, it's just the number of parts and entries.
+    self._pending_stats = {}
+
+    # Requests waiting for their replies, see request()
+    self.transactions = TransactionTable(self)
 
     self.ofnexus = _dummyOFNexus
     self.sock = sock
-    self.buf = ''
+
+    # Received data that was not handled yet is kept in buf[buf_start:buf_end]
+    self.buf = bytearray(self.read_size)
+    self.buf_start = 0
+    self.buf_end = 0
+
+    # The largest amount of unhandled data that was ever buffered
+    self.buf_high_water = 0
+
+    # Packed messages waiting to be coalesced into a single send
+    self.out = []
+    self.out_len = 0
+    self.out_queued = False # Whether the flusher will get to us
+
+    # Data waiting for the socket to become writable.  The first chunk
+    # is sent from backlog_offset on.
+    self.backlog = deque()
+    self.backlog_offset = 0
+    self.backlog_bytes = 0
+    self.read_paused = False
+
+    # The task serving the socket, it is told when the socket has to
+    # be watched for becoming writable or readable again.
+    self.io_task = None
     Connection.ID += 1
     self.ID = Connection.ID
     # TODO: dpid and features don't belong here; they should be eventually
@@ -616,16 +612,34 @@ class Connection (EventMixin):
     self.disconnection_raised = False
     self.connect_time = None
     self.idle_time = time.time()
+    self.accept_time = self.idle_time
+
+    # Whether the last read() emptied the socket's receive buffer
+    self.drained = True
 
-    self.send(of.ofp_hello())
+    # The barrier that ends the handshake and the settings that were
+    # sent before it
+    self.features_requested = False
+    self.handshake_barrier = None
+    self.handshake_config = None
 
     self.original_ports = PortCollection()
     self.ports = PortCollection()
     self.ports._chain = self.original_ports
 
+    if hello:
+      self._start_handshake()
+
     #TODO: set a time that makes sure we actually establish a connection by
     #      some timeout
 
+  def _start_handshake (self):
+    data, xid = handshake_messages()
+    self.send(data)
+    self.features_requested = True
+    self.handshake_barrier = xid
+    self.handshake_config = handshake_config()
+
   @property
   def eth_addr (self):
     dpid = self.dpid
@@ -649,6 +663,9 @@ class Connection (EventMixin):
     """
     if self.disconnected:
       self.msg("already disconnected")
+    else:
+      # Get out what the switch was told before being disconnected
+      self.flush()
     self.info(msg)
     self.disconnected = True
     try:
@@ -660,12 +677,11 @@ class Connection (EventMixin):
         self.disconnection_raised = True
         self.ofnexus.raiseEventNoErrors(ConnectionDown, self)
         self.raiseEventNoErrors(ConnectionDown, self)
+    self.transactions.disconnected()
 
-    try:
-      #deferredSender.kill(self)
-      pass
-    except:
-      pass
+    self.backlog.clear()
+    self.backlog_offset = 0
+    self.backlog_bytes = 0
     try:
       self.sock.shutdown(socket.SHUT_RDWR)
     except:
@@ -680,35 +696,133 @@ class Connection (EventMixin):
     """
     Send data to the switch.
 
-    Data should probably either be raw bytes in OpenFlow wire format, or
-    an OpenFlow controller-to-switch message object from libopenflow.
+    Data should probably either be raw bytes in OpenFlow wire format
+    (e.g., from a FlowModTemplate in openflow.templates), or an OpenFlow
+    controller-to-switch message object from libopenflow.  Raw data may
+    also be a bytearray or memoryview, which is queued without a copy,
+    so it must not be changed afterwards.
+
+    The data is queued and sent along with everything else sent to the
+    switch during this scheduler cycle.  Use flush() to send it right
+    away.
     """
     if self.disconnected: return
-    if type(data) is not bytes:
+    if type(data) not in _buffer_types:
       # There's actually no reason the data has to be an instance of
       # ofp_header, but this check is likely to catch a lot of bugs,
       # so we check it anyway.
       assert isinstance(data, of.ofp_header)
       data = data.pack()
 
-    if deferredSender.sending:
-      log.debug("deferred sender is sending!")
-      deferredSender.send(self, data)
+    self.out.append(data)
+    self.out_len += len(data)
+
+    if self.out_len >= self.coalesce_size:
+      self.flush()
+    elif not self.out_queued:
+      self.out_queued = True
+      outputFlusher.add(self)
+
+  def request (self, msg, timeout = None):
+    """
+    Send a request and return its openflow.transactions.Transaction
+
+    The transaction is done when the switch replies to msg or sends an
+    error for it, when timeout (default request_timeout) seconds are up
+    or when the switch disconnects.  msg can also be a list of messages,
+    which are sent with the same xid.  Messages the switch does not
+    reply to are followed by a barrier.
+    """
+    if timeout is None: timeout = self.request_timeout
+    return self.transactions.request(msg, timeout)
+
+  def flush (self):
+    """
+    Send all queued data to the switch now
+    """
+    if not self.out: return
+    if len(self.out) == 1:
+      data = self.out[0]
+    elif all(type(d) is bytes for d in self.out):
+      data = b''.join(self.out)
+    else:
+      # bytes.join() only takes bytes, copy everything into one buffer
+      data = bytearray(self.out_len)
+      offset = 0
+      for d in self.out:
+        data[offset:offset+len(d)] = d
+        offset += len(d)
+    self.out = []
+    self.out_len = 0
+    if self.disconnected: return
+
+    if self.backlog:
+      # Keep the order, the backlog goes out first
+      self._backlog_add(data)
       return
     try:
       l = self.sock.send(data)
-      if l != len(data):
-        self.msg("Didn't send complete buffer.")
-        data = data[l:]
-        deferredSender.send(self, data)
     except socket.error as (errno, strerror):
-      if errno == EAGAIN:
-        self.msg("Out of send buffer space.  " +
-                 "Consider increasing SO_SNDBUF.")
-        deferredSender.send(self, data)
-      else:
+      if errno != EAGAIN:
+        self.msg("Socket error: " + strerror)
+        self.disconnect(defer_event=True)
+        return
+      l = 0
+    if l != len(data):
+      self.msg("Out of send buffer space, queueing %i bytes" % (len(data)-l,))
+      self.backlog_offset = l
+      self._backlog_add(data)
+
+  def _backlog_add (self, data):
+    if not self.backlog and self.io_task is not None:
+      self.io_task.want_write(self)
+    self.backlog.append(data)
+    self.backlog_bytes += len(data) - (self.backlog_offset
+                                       if len(self.backlog) == 1 else 0)
+
+    if self.backlog_bytes <= self.max_backlog:
+      return
+    if self.backlog_action == 'backpressure':
+      if not self.read_paused:
+        self.info("Send backlog of %i bytes, pausing reads"
+                  % (self.backlog_bytes,))
+        self.read_paused = True
+    else:
+      self.err("Send backlog of %i bytes, disconnecting"
+               % (self.backlog_bytes,))
+      self.disconnect(defer_event=True)
+
+  def drain (self):
+    """
+    Send as much of the backlog as the socket takes
+
+    Generally this is just called by the main OpenFlow loop below, once
+    the socket became writable.
+    """
+    backlog = self.backlog
+    while backlog:
+      data = backlog[0]
+      try:
+        l = self.sock.send(memoryview(data)[self.backlog_offset:])
+      except socket.error as (errno, strerror):
+        if errno == EAGAIN:
+          break
         self.msg("Socket error: " + strerror)
         self.disconnect(defer_event=True)
+        return
+      self.backlog_bytes -= l
+      self.backlog_offset += l
+      if self.backlog_offset < len(data):
+        break
+      backlog.popleft()
+      self.backlog_offset = 0
+
+    if self.read_paused and self.backlog_bytes <= self.max_backlog // 2:
+      self.info("Send backlog down to %i bytes, reading again"
+                % (self.backlog_bytes,))
+      self.read_paused = False
+      if self.io_task is not None:
+        self.io_task.want_read(self)
 
   def read (self):
     """
@@ -716,41 +830,83 @@ class Connection (EventMixin):
     main OpenFlow loop below.
 
     Note: This function will block if data is not available.
+
+    After returning, drained tells whether there may be more data
+    waiting on the socket, which matters for edge-triggered polling.
+
+    Data is received straight into buf and the messages are unpacked
+    from a memoryview of it, so the only copies made are the fields
+    the unpackers pull out of the messages, or the whole message for
+    the lazily unpacked types.
     """
+    self._reserve()
+
+    buf = self.buf
+    view = memoryview(buf)
     try:
-      d = self.sock.recv(2048)
+      l = self.sock.recv_into(view[self.buf_end:], self.read_size)
+    except socket.error as (errno, strerror):
+      if errno == EAGAIN:
+        self.drained = True
+        return True
+      return False
     except:
       return False
-    if len(d) == 0:
+    if l == 0:
       return False
-    self.buf += d
-    buf_len = len(self.buf)
+    self.drained = l < self.read_size
+
+    self.buf_end += l
+    return self._unpack()
+
+  def feed (self, data):
+    """
+    Handle data that was read from the switch by someone else
+
+    Returns False if the connection should be thrown away, like read().
+    """
+    self._reserve(len(data))
+    self.buf[self.buf_end:self.buf_end + len(data)] = data
+    self.buf_end += len(data)
+    return self._unpack()
+
+  def _unpack (self):
+    """
+    Handle the complete messages in buf
+    """
+    buf = self.buf
+    buf_len = self.buf_end
+    self.buf_high_water = max(self.buf_high_water, buf_len - self.buf_start)
 
+    # The unpackers check for underruns against the length of the data
+    # they are given, so they must not see the unused end of buf.
+    data = memoryview(buf)[:buf_len]
 
-    offset = 0
+    offset = self.buf_start
     while buf_len - offset >= 8: # 8 bytes is minimum OF message size
       # We pull the first four bytes of the OpenFlow header off by hand
-      # (using ord) to find the version/length/type so that we can
-      # correctly call libopenflow to unpack it.
+      # to find the version/length/type so that we can correctly call
+      # libopenflow to unpack it.
 
-      ofp_type = ord(self.buf[offset+1])
+      ofp_type = buf[offset+1]
 
-      if ord(self.buf[offset]) != of.OFP_VERSION:
+      if buf[offset] != of.OFP_VERSION:
         if ofp_type == of.OFPT_HELLO:
           # We let this through and hope the other side switches down.
           pass
         else:
           log.warning("Bad OpenFlow version (0x%02x) on connection %s"
-                      % (ord(self.buf[offset]), self))
+                      % (buf[offset], self))
           return False # Throw connection away
 
-      msg_length = ord(self.buf[offset+2]) << 8 | ord(self.buf[offset+3])
+      msg_length = buf[offset+2] << 8 | buf[offset+3]
 
       if buf_len - offset < msg_length: break
 
-      new_offset,msg = unpackers[ofp_type](self.buf, offset)
+      new_offset,msg = unpackers[ofp_type](data, offset)
       assert new_offset - offset == msg_length
       offset = new_offset
+      self.buf_start = offset
 
       try:
         h = handlers[ofp_type]
@@ -761,45 +917,87 @@ class Connection (EventMixin):
                       ("\n" + str(self) + " ").join(str(msg).split('\n')))
         continue
 
-    if offset != 0:
-      self.buf = self.buf[offset:]
+    if offset == buf_len:
+      self.buf_start = 0
+      self.buf_end = 0
 
     return True
 
+  def _reserve (self, size = None):
+    """
+    Make room for size (default read_size) more bytes at the end of buf
+
+    Unhandled data is moved to the front of buf, which only happens
+    when a message straddles the end of buf.  buf is only grown if
+    the unhandled data and size bytes do not fit.
+    """
+    if size is None: size = self.read_size
+    buf = self.buf
+    if len(buf) - self.buf_end >= size:
+      return
+
+    pending = self.buf_end - self.buf_start
+    if self.buf_start != 0:
+      buf[0:pending] = buf[self.buf_start:self.buf_end]
+      self.buf_start = 0
+      self.buf_end = pending
+
+    missing = pending + size - len(buf)
+    if missing > 0:
+      buf.extend(bytearray(max(missing, len(buf))))
+
   def _incoming_stats_reply (self, ofp):
-    # This assumes that you don't receive multiple stats replies
-    # to different requests out of order/interspersed.
+    # The parts are collected by xid and type, so replies to several
+    # requests may be interspersed.
+    key = (ofp.xid, ofp.type)
+    if ofp.type in self.stream_stats:
+      self._incoming_stats_part(key, ofp)
+      return
+
     if not ofp.is_last_reply:
       if ofp.type not in [of.OFPST_FLOW, of.OFPST_TABLE,
                                 of.OFPST_PORT, of.OFPST_QUEUE]:
         log.error("Don't know how to aggregate stats message of type " +
                   str(ofp.type))
-        self._previous_stats = []
+        self._pending_stats.pop(key, None)
         return
+      self._pending_stats.setdefault(key, []).append(ofp)
+      return
 
-    if len(self._previous_stats) != 0:
-      if ((ofp.xid == self._previous_stats[0].xid) and
-          (ofp.type == self._previous_stats[0].type)):
-        self._previous_stats.append(ofp)
-      else:
-        log.error("Was expecting continued stats of type %i with xid %i, " +
-                  "but got type %i with xid %i" %
-                  (self._previous_stats_reply.xid,
-                    self._previous_stats_reply.type,
-                    ofp.xid, ofp.type))
-        self._previous_stats = [ofp]
+    parts = self._pending_stats.pop(key, None)
+    if parts is None:
+      parts = [ofp]
     else:
-      self._previous_stats = [ofp]
+      parts.append(ofp)
+
+    handler = statsHandlerMap.get(ofp.type, None)
+    if handler is None:
+      log.warn("No handler for stats of type " + str(ofp.type))
+      return
+    handler(self, parts)
+
+  def _incoming_stats_part (self, key, ofp):
+    """
+    Raises StatsPartReceived for a part of a streamed stats reply
+    """
+    counts = self._pending_stats.get(key)
+    if counts is None:
+      counts = self._pending_stats[key] = [0, 0]
+    body = ofp.body
+    counts[0] += 1
+    counts[1] += len(body) if type(body) is list else 1
+
+    e = self.ofnexus.raiseEventNoErrors(StatsPartReceived, self, ofp, body)
+    if e is None or e.halt != True:
+      self.raiseEventNoErrors(StatsPartReceived, self, ofp, body)
 
     if ofp.is_last_reply:
-      handler = statsHandlerMap.get(self._previous_stats[0].type, None)
-      s = self._previous_stats
-      self._previous_stats = []
-      if handler is None:
-        log.warn("No handler for stats of type " +
-                 str(self._previous_stats[0].type))
-        return
-      handler(self, s)
+      del self._pending_stats[key]
+      e = self.ofnexus.raiseEventNoErrors(StatsStreamComplete, self,
+                                          ofp.xid, ofp.type, *counts)
+      if e is None or e.halt != True:
+        self.raiseEventNoErrors(StatsStreamComplete, self, ofp.xid,
+                                ofp.type, *counts)
 
   def __str__ (self):
     #return "[Con " + str(self.ID) + "/" + str(self.dpid) + "]"
@@ -827,14 +1025,92 @@ def wrap_socket (new_sock):
 
 from pox.lib.recoco.recoco import *
 
+class OutputFlusher (BaseTask):
+  """
+  Flushes the data connections queued during a scheduler cycle
+
+  The task is scheduled when the first connection queues data, so it
+  runs once the task that is currently running yields.
+  """
+  def __init__ (self):
+    BaseTask.__init__(self)
+    self._connections = []
+    self._scheduled = False
+
+  def add (self, con):
+    self._connections.append(con)
+    if not self._scheduled:
+      self._scheduled = True
+      core.scheduler.schedule(self)
+
+  def run (self):
+    while True:
+      self._scheduled = False
+      cons = self._connections
+      self._connections = []
+      for con in cons:
+        con.out_queued = False
+        try:
+          con.flush()
+        except:
+          log.exception("Exception flushing connection " + str(con))
+      yield False # Sleep until the next add()
+
+outputFlusher = OutputFlusher()
+
+class HandshakeMetrics (object):
+  """
+  Keeps track of how long switches take to get to ConnectionUp
+
+  Switches that connect less than a second apart count as a burst, like
+  after a controller restart.  A summary is logged when a burst is over.
+  """
+  samples = 4096 # Number of handshake times kept
+
+  def __init__ (self):
+    self.times = pox.lib.util.Samples(self.samples)
+
+    self._burst_start = None
+    self._burst_count = 0
+    self._last = 0
+
+  def record (self, seconds):
+    now = time.time()
+    self.times.add(seconds)
+
+    if self._burst_start is None:
+      self._burst_start = now - seconds
+      self._burst_count = 0
+      core.callDelayed(1, self._check_burst)
+    self._burst_count += 1
+    self._last = now
+
+  def _check_burst (self):
+    now = time.time()
+    if now - self._last < 1:
+      core.callDelayed(1, self._check_burst)
+      return
+    if self._burst_count > 1:
+      n = self._burst_count
+      log.info("%i switches up in %.2f s, time to ConnectionUp "
+               "p50/p99/max: %.3f / %.3f / %.3f s", n,
+               self._last - self._burst_start,
+               self.times.percentile(50, last = n),
+               self.times.percentile(99, last = n),
+               self.times.percentile(100, last = n))
+    self._burst_start = None
+
+handshake_metrics = HandshakeMetrics()
+
 class OpenFlow_01_Task (Task):
   """
   The main recoco thread for listening to openflow messages
   """
-  def __init__ (self, port = 6633, address = '0.0.0.0'):
+  def __init__ (self, port = 6633, address = '0.0.0.0', backlog = 1024):
     Task.__init__(self)
     self.port = int(port)
     self.address = address
+    self.backlog = backlog # Connections the kernel queues for accept()
     self.started = False
 
     core.addListener(pox.core.GoingUpEvent, self._handle_GoingUpEvent)
@@ -848,10 +1124,10 @@ class OpenFlow_01_Task (Task):
     self.started = True
     return super(OpenFlow_01_Task,self).start()
 
-  def run (self):
-    # List of open sockets/connections to select on
-    sockets = []
-
+  def _listen (self):
+    """
+    Create the listening socket, returns None if that fails
+    """
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     try:
@@ -865,23 +1141,68 @@ class OpenFlow_01_Task (Task):
         log.error(" You may have another controller running.")
         log.error(" Use openflow.of_01 --port=<port> to run POX on "
                   "another port.")
-      return
+      return None
 
-    listener.listen(16)
-    sockets.append(listener)
+    listener.listen(self.backlog)
 
     log.debug("Listening on %s:%s" %
               (self.address, self.port))
 
+    return listener
+
+  def _new_connection (self, new_sock, hello = True):
+    if pox.openflow.debug.pcap_traces:
+      new_sock = wrap_socket(new_sock)
+    new_sock.setblocking(0)
+    # Note that instantiating a Connection object fires a
+    # ConnectionUp event (after negotation has completed)
+    con = Connection(new_sock, hello)
+    con.io_task = self
+    return con
+
+  def want_write (self, con):
+    """
+    Called when con has a backlog to send
+    """
+    self._waker.ping()
+
+  def want_read (self, con):
+    """
+    Called when con is read from again after its reads were paused
+    """
+    self._waker.ping()
+
+  def run (self):
+    listener = self._listen()
+    if listener is None:
+      return
+
+    # Wakes us up to select on different sockets
+    self._waker = pox.lib.util.makePinger()
+
+    # List of open sockets/connections to select on
+    sockets = [listener]
+
     con = None
     while core.running:
       try:
         while True:
           con = None
-          rlist, wlist, elist = yield Select(sockets, [], sockets, 5)
+          readers = [s for s in sockets
+                     if s is listener or not s.read_paused]
+          readers.append(self._waker)
+          writers = [s for s in sockets if s is not listener and s.backlog]
+          rlist, wlist, elist = yield Select(readers, writers, sockets, 5)
           if len(rlist) == 0 and len(wlist) == 0 and len(elist) == 0:
             if not core.running: break
 
+          if self._waker in rlist:
+            self._waker.pongAll()
+            rlist.remove(self._waker)
+
+          for con in wlist:
+            con.drain()
+
           for con in elist:
             if con is listener:
               raise RuntimeError("Error on listener socket")
@@ -899,12 +1220,7 @@ class OpenFlow_01_Task (Task):
           for con in rlist:
             if con is listener:
               new_sock = listener.accept()[0]
-              if pox.openflow.debug.pcap_traces:
-                new_sock = wrap_socket(new_sock)
-              new_sock.setblocking(0)
-              # Note that instantiating a Connection object fires a
-              # ConnectionUp event (after negotation has completed)
-              newcon = Connection(new_sock)
+              newcon = self._new_connection(new_sock)
               sockets.append( newcon )
               #print str(newcon) + " connected"
             else:
@@ -941,6 +1257,143 @@ class OpenFlow_01_Task (Task):
     #pox.core.quit()
 
 
+class OpenFlow_01_EpollTask (OpenFlow_01_Task):
+  """
+  OpenFlow listener that keeps its sockets registered with epoll
+
+  Sockets are registered once when they are accepted, and only the
+  ones that became ready are looked at.  The SelectHub just waits on
+  the epoll fd itself, so the cost of a wakeup does not depend on the
+  number of connections and the FD_SETSIZE limit of select() does not
+  apply.
+
+  Sockets are registered edge-triggered, so they have to be read until
+  they run dry.  To keep a busy switch from starving the others, a
+  connection is read at most MAX_READS times per wakeup.  Connections
+  that may still have data are revisited on the next wakeup, since no
+  new edge will be signaled for them.
+  """
+  MAX_READS = 16
+  MAX_EVENTS = 1024
+
+  def __init__ (self, *args, **kw):
+    OpenFlow_01_Task.__init__(self, *args, **kw)
+    self._poller = None
+    self._listener = None
+    self._connections = {} # fd -> Connection
+    self._unfinished = set() # fds to revisit without waiting for an edge
+
+  def _accept (self):
+    for _ in xrange(self.MAX_READS):
+      try:
+        new_sock = self._listener.accept()[0]
+      except socket.error as (errno, strerror):
+        if errno != EAGAIN:
+          log.error("Error %i while accepting connection: %s",
+                    errno, strerror)
+        return
+      con = self._new_connection(new_sock)
+      fd = con.fileno()
+      self._connections[fd] = con
+      # With edge-triggering, watching for writability costs nothing
+      # until a send actually ran out of buffer space.
+      self._poller.register(fd, select.EPOLLIN | select.EPOLLOUT |
+                                select.EPOLLET)
+    self._unfinished.add(self._listener.fileno())
+
+  def _close (self, fd, con):
+    self._connections.pop(fd, None)
+    self._unfinished.discard(fd)
+    try:
+      self._poller.unregister(fd)
+    except:
+      pass
+    try:
+      con.close()
+    except:
+      pass
+
+  def want_write (self, con):
+    # The socket is watched edge-triggered for becoming writable anyways
+    pass
+
+  def want_read (self, con):
+    # The data that came in while paused did not cause a new edge
+    self._unfinished.add(con.fileno())
+
+  def _read (self, fd, con):
+    con.idle_time = time.time()
+    try:
+      for _ in xrange(self.MAX_READS):
+        if con.read() is False:
+          self._close(fd, con)
+          return
+        if con.drained:
+          return
+        if con.read_paused:
+          # Handling what was read pushed the backlog over the limit,
+          # want_read() brings us back once it went down.
+          return
+      self._unfinished.add(fd)
+    except exceptions.KeyboardInterrupt:
+      raise
+    except:
+      if sys.exc_info()[0] is socket.error and \
+         sys.exc_info()[1][0] == ECONNRESET:
+        con.info("Connection reset")
+      else:
+        log.exception("Exception reading connection " + str(con))
+      self._close(fd, con)
+
+  def run (self):
+    self._listener = self._listen()
+    if self._listener is None:
+      return
+    self._listener.setblocking(0)
+    listener_fd = self._listener.fileno()
+
+    self._poller = select.epoll()
+    self._poller.register(listener_fd, select.EPOLLIN | select.EPOLLET)
+
+    try:
+      while core.running:
+        if self._unfinished:
+          # Let the other tasks run before continuing
+          yield 0
+        else:
+          yield Select([self._poller], [], [], 5)
+
+        # Events that are not fetched stay queued in the epoll
+        # instance, which then stays readable.
+        ready = dict(self._poller.poll(0, self.MAX_EVENTS))
+        for fd in self._unfinished:
+          ready.setdefault(fd, select.EPOLLIN)
+        self._unfinished.clear()
+
+        for fd in ready:
+          if fd == listener_fd:
+            if ready[fd] & select.EPOLLERR:
+              log.error("Error on OpenFlow listener.  Aborting.")
+              return
+            self._accept()
+            continue
+          con = self._connections.get(fd)
+          if con is None:
+            continue
+          if ready[fd] & select.EPOLLOUT and con.backlog:
+            con.drain()
+          # Errors and hangups show up on the next read
+          if not con.read_paused or \
+             ready[fd] & (select.EPOLLERR | select.EPOLLHUP):
+            self._read(fd, con)
+    except exceptions.KeyboardInterrupt:
+      pass
+    finally:
+      self._poller.close()
+
+    log.debug("No longer listening for connections")
+
+
 def _set_handlers ():
   handlers.extend([None] * (1 + sorted(handlerMap.keys(),reverse=True)[0]))
   for h in handlerMap:
@@ -949,19 +1402,67 @@ def _set_handlers ():
 _set_handlers()
 
 
-# Used by the Connection class
-deferredSender = None
-
-def launch (port = 6633, address = "0.0.0.0"):
+def launch (port = 6633, address = "0.0.0.0", epoll = None,
+            read_size = None, coalesce_size = None, max_backlog = None,
+            backlog_action = None, backlog = 1024, stream_stats = None,
+            request_timeout = None):
+  """
+  Listen for OpenFlow connections
+
+  --epoll=<bool> selects the epoll based listener, it is used by default
+  where epoll is available.
+  --read_size=<bytes> sets the number of bytes read from a switch at once.
+  --coalesce_size=<bytes> sets the amount of queued data that is sent
+  without waiting for the end of the scheduler cycle, 0 sends every
+  message right away.
+  --max_backlog=<bytes> limits the data queued for a switch that does
+  not keep up, --backlog_action=disconnect|backpressure sets whether it
+  is disconnected or not read from when the limit is exceeded.
+  --backlog=<connections> sets how many connecting switches the kernel
+  queues until they are accepted.
+  --stream_stats=<types> is a comma separated list of stats types, e.g.
+  flow,port, whose replies are raised part by part as StatsPartReceived
+  instead of all at once.
+  --request_timeout=<seconds> sets how long Connection.request() waits
+  for a reply by default.
+  """
   if core.hasComponent('of_01'):
     return None
 
-  global deferredSender
-  deferredSender = DeferredSender()
+  if read_size is not None:
+    Connection.read_size = int(read_size)
+  if coalesce_size is not None:
+    Connection.coalesce_size = int(coalesce_size)
+  if max_backlog is not None:
+    Connection.max_backlog = int(max_backlog)
+  if backlog_action is not None:
+    if backlog_action not in ('disconnect', 'backpressure'):
+      raise RuntimeError("Unknown backlog action " + backlog_action)
+    Connection.backlog_action = backlog_action
+  if stream_stats is not None:
+    types = set()
+    for name in stream_stats.split(","):
+      t = of.ofp_stats_type_rev_map.get("OFPST_" + name.strip().upper())
+      if t is None:
+        raise RuntimeError("Unknown stats type " + name)
+      types.add(t)
+    Connection.stream_stats = frozenset(types)
+  if request_timeout is not None:
+    Connection.request_timeout = float(request_timeout)
 
   if of._logger is None:
     of._logger = core.getLogger('libopenflow_01')
 
-  l = OpenFlow_01_Task(port = int(port), address = address)
+  if epoll is None:
+    epoll = hasattr(select, 'epoll')
+  else:
+    epoll = pox.lib.util.str_to_bool(epoll)
+
+  if epoll:
+    l = OpenFlow_01_EpollTask(port = int(port), address = address,
+                              backlog = int(backlog))
+  else:
+    l = OpenFlow_01_Task(port = int(port), address = address,
+                         backlog = int(backlog))
   core.register("of_01", l)
   return l
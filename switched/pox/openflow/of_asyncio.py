@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+OpenFlow 1.0 transport on an asyncio event loop.
+
+An alternative to openflow.of_01.  Accepting switches, reading, writing
+and keepalives are done by asyncio protocols on an event loop that runs
+in a thread of its own.  Messages are still unpacked and handled in the
+recoco scheduler by the usual Connection objects, so core.openflow and
+its events work just like with of_01 and apps do not have to change.
+
+Data is passed between the two in batches.  The scheduler is woken once
+for everything that was received since it last ran, without going
+through the SelectHub, and the loop is woken once for everything the
+apps sent during a scheduler cycle.
+
+On Python 2 the trollius backport of asyncio is used.  uvloop is used if
+it is installed, unless --uvloop=False is given.
+
+It supports the following commandline options:
+ --port=X       Port to listen on (default 6633)
+ --address=X    Address to listen on (default 0.0.0.0)
+ --backlog=X    Listen backlog (default 1024)
+ --uvloop=X     Whether to use uvloop (default: if it is installed)
+ --interval=X   Send an echo request to switches that were quiet for X
+                seconds (default 20, 0 disables keepalives)
+ --timeout=X    Disconnect switches that did not answer within X seconds
+                (default 3)
+ --max_backlog=X
+                Buffer at most X bytes for a switch that does not keep up
+ --backlog_action=X
+                Whether a switch over the limit is disconnected or not
+                read from (disconnect or backpressure)
+
+The limit and action can also be changed per Connection, as
+openflow.admission does.
+"""
+
+from pox.core import core
+import pox
+from pox.lib.recoco.recoco import BaseTask
+from pox.lib.util import str_to_bool
+from pox.openflow.of_01 import Connection
+import pox.openflow.libopenflow_01 as of
+import threading
+import time
+
+try:
+  import asyncio
+except ImportError:
+  try:
+    import trollius as asyncio
+  except ImportError:
+    asyncio = None
+
+log = core.getLogger()
+
+
+class _TransportSocket (object):
+  """
+  What a Connection takes its transport for
+
+  Sends are handed to the event loop, which always takes all of the data.
+  Keeping the backlog short is up to the transport's flow control.
+  """
+  def __init__ (self, bridge, protocol):
+    self.bridge = bridge
+    self.protocol = protocol
+
+  def send (self, data):
+    self.bridge.write(self.protocol, data)
+    return len(data)
+
+  def shutdown (self, how):
+    self.bridge.write(self.protocol, None)
+
+  def close (self):
+    self.bridge.write(self.protocol, None)
+
+  def fileno (self):
+    return self.protocol.transport.get_extra_info('socket').fileno()
+
+  def getpeername (self):
+    return self.protocol.transport.get_extra_info('peername')
+
+
+class _Protocol (asyncio.Protocol if asyncio else object):
+  """
+  The loop side of a switch connection
+  """
+  def __init__ (self, bridge):
+    self.bridge = bridge
+    self.transport = None
+    self.con = None # Only used by the scheduler side
+    self.last_seen = time.time()
+    self.reads_paused = False
+    self.closed = False
+    # The write buffer limit, changed by the scheduler side to follow
+    # the Connection's max_backlog
+    self.max_backlog = Connection.max_backlog
+
+  def connection_made (self, transport):
+    self.transport = transport
+    self.bridge.protocols.add(self)
+    self.apply_max_backlog()
+    self.bridge.received(self, None)
+
+  def apply_max_backlog (self):
+    """
+    Sets the write buffer limits from max_backlog, called in the loop
+    """
+    if self.closed: return
+    # The transport buffers what the switch does not take right away
+    self.transport.set_write_buffer_limits(high = self.max_backlog,
+                                           low = self.max_backlog // 2)
+
+  def data_received (self, data):
+    self.last_seen = time.time()
+    self.bridge.received(self, data)
+
+  def connection_lost (self, exc):
+    self.closed = True
+    self.bridge.protocols.discard(self)
+    self.bridge.received(self, b'')
+
+  def pause_writing (self):
+    con = self.con
+    action = Connection.backlog_action if con is None else con.backlog_action
+    if action == 'backpressure':
+      log.info("Send backlog of %i bytes, pausing reads",
+               self.transport.get_write_buffer_size())
+      self.reads_paused = True
+      self.transport.pause_reading()
+    else:
+      log.error("Send backlog of %i bytes, disconnecting",
+                self.transport.get_write_buffer_size())
+      self.transport.abort()
+
+  def resume_writing (self):
+    if self.reads_paused:
+      self.reads_paused = False
+      self.transport.resume_reading()
+
+
+class AsyncioBridge (BaseTask):
+  """
+  Runs the event loop and passes data between it and the scheduler
+
+  The task itself runs in the scheduler and hands received data to the
+  Connections.  It is scheduled by the loop whenever there is some.
+  """
+  def __init__ (self, port = 6633, address = '0.0.0.0', backlog = 1024,
+                use_uvloop = None, interval = 20, timeout = 3):
+    BaseTask.__init__(self)
+    self.port = port
+    self.address = address
+    self.backlog = backlog
+    self.interval = interval
+    self.timeout = timeout
+
+    if use_uvloop is not False:
+      try:
+        import uvloop
+        self.loop = uvloop.new_event_loop()
+      except ImportError:
+        if use_uvloop:
+          raise RuntimeError("uvloop is not installed")
+        self.loop = asyncio.new_event_loop()
+    else:
+      self.loop = asyncio.new_event_loop()
+
+    self.protocols = set() # Only used in the loop
+
+    self._lock = threading.Lock()
+    self._incoming = [] # (protocol, data) for the scheduler
+    self._outgoing = [] # (protocol, data) for the loop
+    self._read_scheduled = False
+    self._write_scheduled = False
+
+    self._echo = of.ofp_echo_request().pack()
+
+    core.addListener(pox.core.GoingUpEvent, self._handle_GoingUpEvent)
+    core.addListener(pox.core.DownEvent, self._handle_DownEvent)
+
+  def _handle_GoingUpEvent (self, event):
+    thread = threading.Thread(target = self._run_loop, name = "of_asyncio")
+    thread.daemon = True
+    thread.start()
+
+  def _handle_DownEvent (self, event):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+
+  def _run_loop (self):
+    asyncio.set_event_loop(self.loop)
+    try:
+      self.loop.run_until_complete(self.loop.create_server(
+          lambda: _Protocol(self), self.address, self.port,
+          backlog = self.backlog))
+    except Exception as e:
+      log.error("Could not listen on %s:%s: %s", self.address, self.port, e)
+      return
+    log.debug("Listening on %s:%s", self.address, self.port)
+    if self.interval:
+      self.loop.call_later(self.interval, self._keepalive)
+    self.loop.run_forever()
+
+  def _keepalive (self):
+    now = time.time()
+    for p in list(self.protocols):
+      idle = now - p.last_seen
+      if idle > self.interval + self.timeout:
+        log.info("Switch at %s timed out",
+                 p.transport.get_extra_info('peername'))
+        p.transport.abort()
+      elif idle > self.interval:
+        p.transport.write(self._echo)
+    self.loop.call_later(self.interval, self._keepalive)
+
+  def received (self, protocol, data):
+    """
+    Hand data to the scheduler, called in the loop
+
+    data is None for new connections and empty when the connection
+    was lost.
+    """
+    with self._lock:
+      self._incoming.append((protocol, data))
+      if self._read_scheduled:
+        return
+      self._read_scheduled = True
+    core.scheduler.schedule(self)
+
+  def write (self, protocol, data):
+    """
+    Hand data to the loop, called in the scheduler
+
+    data is None to close the connection.
+    """
+    with self._lock:
+      self._outgoing.append((protocol, data))
+      if self._write_scheduled:
+        return
+      self._write_scheduled = True
+    self.loop.call_soon_threadsafe(self._write_all)
+
+  def _write_all (self):
+    with self._lock:
+      outgoing = self._outgoing
+      self._outgoing = []
+      self._write_scheduled = False
+    for protocol, data in outgoing:
+      if protocol.closed:
+        continue
+      if data is None:
+        protocol.closed = True
+        protocol.transport.close()
+      else:
+        protocol.transport.write(data)
+
+  def run (self):
+    while True:
+      with self._lock:
+        incoming = self._incoming
+        self._incoming = []
+        self._read_scheduled = False
+
+      for protocol, data in incoming:
+        try:
+          if data is None:
+            con = Connection(_TransportSocket(self, protocol))
+            protocol.con = con
+            continue
+          con = protocol.con
+          if not data:
+            if not con.disconnected:
+              con.close()
+            continue
+          con.idle_time = protocol.last_seen
+          if con.feed(data) is False:
+            con.close()
+          elif con.max_backlog != protocol.max_backlog:
+            # E.g., set by openflow.admission when the switch came up
+            protocol.max_backlog = con.max_backlog
+            self.loop.call_soon_threadsafe(protocol.apply_max_backlog)
+        except Exception:
+          log.exception("Exception handling %s", protocol.con)
+
+      yield False # Sleep until the loop has more
+
+
+def launch (port = 6633, address = "0.0.0.0", backlog = 1024, uvloop = None,
+            interval = 20, timeout = 3, max_backlog = None,
+            backlog_action = None):
+  if asyncio is None:
+    raise RuntimeError("of_asyncio needs asyncio or trollius")
+  if core.hasComponent('of_01'):
+    return None
+
+  if max_backlog is not None:
+    Connection.max_backlog = int(max_backlog)
+  if backlog_action is not None:
+    if backlog_action not in ('disconnect', 'backpressure'):
+      raise RuntimeError("Unknown backlog action " + backlog_action)
+    Connection.backlog_action = backlog_action
+  if uvloop is not None:
+    uvloop = str_to_bool(uvloop)
+
+  if of._logger is None:
+    of._logger = core.getLogger('libopenflow_01')
+
+  # Registered as of_01 so that the default of_01 does not start as well
+  bridge = AsyncioBridge(port = int(port), address = address,
+                         backlog = int(backlog), use_uvloop = uvloop,
+                         interval = float(interval),
+                         timeout = float(timeout))
+  core.register("of_01", bridge)
+  return bridge
@@ -17,17 +17,20 @@ import struct
 from pox.lib.revent import EventMixin
 import pox.openflow
 
-def make_type_to_unpacker_table ():
+def make_type_to_unpacker_table (lazy_types = ()):
   """
   Returns a list of unpack methods.
 
   The resulting list maps OpenFlow types to functions which unpack
-  data for those types into message objects.
+  data for those types into message objects.  Messages of the types in
+  lazy_types are only unpacked once they are used (see unpack_lazy() in
+  libopenflow_01).
   """
 
   top = max(of._message_type_to_class)
 
-  r = [of._message_type_to_class[i].unpack_new for i in range(0, top)]
+  r = [of._message_type_to_class[i].unpack_lazy if i in lazy_types
+       else of._message_type_to_class[i].unpack_new for i in range(0, top)]
 
   return r
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+from flood_control import FloodLimiter, ArpProxy
+
+
+class FloodLimiterTest (unittest.TestCase):
+  def setUp (self):
+    self.limiter = FloodLimiter(switch_rate = 100, switch_burst = 5,
+                                source_rate = 1, source_burst = 2,
+                                block_time = 10, max_sources = 2)
+    # The switch's bucket starts at the current time
+    self.now = time.time()
+
+  def test_source_blocked_once (self):
+    """
+    A source over its rate is reported once per block_time
+    """
+    now = self.now
+    self.assertEqual(self.limiter.allow('a', now), (True, False))
+    self.assertEqual(self.limiter.allow('a', now), (True, False))
+    self.assertEqual(self.limiter.allow('a', now), (False, True))
+    self.assertEqual(self.limiter.allow('a', now + 0.5), (False, False))
+    self.assertEqual(self.limiter.suppressed, 2)
+
+    # Other sources are not affected
+    self.assertEqual(self.limiter.allow('b', now), (True, False))
+
+    # Tokens come back at the source rate, the block ends after a while
+    self.assertEqual(self.limiter.allow('a', now + 1.5), (True, False))
+    self.assertEqual(self.limiter.allow('a', now + 1.5), (False, False))
+    self.assertEqual(self.limiter.allow('a', now + 10.5), (True, False))
+    self.assertEqual(self.limiter.allow('a', now + 10.5), (True, False))
+    self.assertEqual(self.limiter.allow('a', now + 10.5), (False, True))
+
+  def test_switch_limit (self):
+    now = self.now
+    allowed = [self.limiter.allow(mac, now)[0]
+               for mac in ('a', 'b', 'c', 'd', 'e', 'f')]
+    self.assertEqual(allowed, [True] * 5 + [False])
+
+  def test_max_sources (self):
+    for mac in ('a', 'b', 'c'):
+      self.limiter.allow(mac, self.now)
+    self.assertEqual(list(self.limiter.sources), ['b', 'c'])
+
+
+class ArpProxyTest (unittest.TestCase):
+  def test_lru (self):
+    proxy = ArpProxy(max_entries = 2)
+    proxy.learn('10.0.0.1', 'a')
+    proxy.learn('10.0.0.2', 'b')
+    proxy.learn('10.0.0.1', 'c') # Seen again, with a new MAC
+    proxy.learn('10.0.0.3', 'd')
+    self.assertEqual(proxy.lookup('10.0.0.1'), 'c')
+    self.assertIsNone(proxy.lookup('10.0.0.2'))
+    self.assertEqual(len(proxy), 2)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+from mac_table import MacTable
+
+
+class MacTableTest (unittest.TestCase):
+  def setUp (self):
+    self.removed = []
+    self.table = MacTable(lambda mac, port: self.removed.append((mac, port)),
+                          max_entries = 2, max_age = 300)
+
+  def test_lru (self):
+    """
+    The least recently seen MAC is evicted when the table is full
+    """
+    self.table.learn('a', 1, now = 0)
+    self.table.learn('b', 2, now = 1)
+    self.table.learn('a', 1, now = 2) # Seen again
+    self.table.learn('c', 3, now = 3)
+    self.assertEqual(self.removed, [('b', 2)])
+    self.assertEqual(sorted(self.table.ports()), [('a', 1), ('c', 3)])
+    self.assertEqual(len(self.table), 2)
+
+  def test_aging (self):
+    self.table.learn('a', 1, now = 0)
+    self.table.learn('b', 2, now = 100)
+    self.assertEqual(self.table.lookup('a', now = 299), 1)
+    self.assertIsNone(self.table.lookup('a', now = 300))
+    self.assertEqual(self.removed, [('a', 1)])
+    self.assertEqual(self.table.lookup('b', now = 300), 2)
+
+    # Refreshing pushes the age back
+    self.table.learn('b', 2, now = 350)
+    self.assertEqual(self.table.lookup('b', now = 600), 2)
+    self.assertIsNone(self.table.lookup('b', now = 650))
+
+  def test_move (self):
+    self.assertIsNone(self.table.learn('a', 1, now = 0))
+    self.assertIsNone(self.table.learn('a', 1, now = 1))
+    self.assertEqual(self.table.learn('a', 2, now = 2), 1)
+    self.assertEqual(self.table.lookup('a', now = 2), 2)
+    self.assertEqual(self.removed, [])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.admission import PacketInAdmission
+import pox.openflow.libopenflow_01 as of
+
+
+class MockNexus (object):
+  def raiseEventNoErrors (self, event, *args):
+    return None
+
+
+class MockConnection (object):
+  def __init__ (self):
+    self.dpid = 1
+    self.ofnexus = MockNexus()
+    self.events = []
+    self.sent = []
+
+  def send (self, data):
+    self.sent.append(data)
+
+  def raiseEventNoErrors (self, event, *args):
+    self.events.append(event(*args))
+
+
+class AdmissionTest (unittest.TestCase):
+  def setUp (self):
+    self.con = MockConnection()
+    self.admission = PacketInAdmission(self.con, port_rate = 1,
+                                       port_burst = 1)
+
+  def packet_in (self, port, buffer_id = None):
+    return self.admission.admit(of.ofp_packet_in(in_port = port,
+                                                 buffer_id = buffer_id))
+
+  def test_quiet_port_stops_shedding (self):
+    """
+    A port that goes quiet while shed gets its stop event from expire()
+    """
+    self.assertTrue(self.packet_in(1))
+    self.assertFalse(self.packet_in(1))
+    self.assertEqual([(e.port, e.started) for e in self.con.events],
+                     [(1, True)])
+
+    # Nothing else comes in
+    self.admission.expire(time.time() + PacketInAdmission.hold_time / 2)
+    self.assertIn(1, self.admission.shedding)
+    self.admission.expire(time.time() + PacketInAdmission.hold_time)
+    self.assertEqual(self.admission.shedding, {})
+    self.assertEqual([(e.port, e.started) for e in self.con.events],
+                     [(1, True), (1, False)])
+
+    # It is only raised once
+    self.admission.expire(time.time() + 2 * PacketInAdmission.hold_time)
+    self.assertEqual(len(self.con.events), 2)
+
+  def test_shed_buffers_released (self):
+    """
+    The switch's buffers of shed packet-ins are freed
+    """
+    self.assertTrue(self.packet_in(1, buffer_id = 10))
+    self.assertFalse(self.packet_in(1, buffer_id = 11))
+    self.assertFalse(self.packet_in(1))
+    self.assertEqual(len(self.con.sent), 1)
+    po = self.con.sent[0]
+    self.assertIsInstance(po, of.ofp_packet_out)
+    self.assertEqual((po.buffer_id, po.in_port, po.actions), (11, 1, []))
+
+  def test_event_rate (self):
+    self.admission.rate = 42.0
+    self.packet_in(1)
+    self.packet_in(1)
+    self.assertEqual(self.con.events[0].rate, 42.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
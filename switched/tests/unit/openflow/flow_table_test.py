@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Copyright 2018 Leonard Göhrs
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+
+from pox.openflow.flow_table import FlowTable, TableEntry
+import pox.openflow.libopenflow_01 as of
+import pox.lib.packet as pkt
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+MACS = [EthAddr("02:00:00:00:00:0%i" % (i,)) for i in range(1, 4)]
+IPS = ["10.0.0.1", "10.0.0.2", "10.0.1.1", "10.1.0.1"]
+NETS = IPS + ["10.0.0.0/24", "10.0.0.0/16", "10.0.0.0/8", "10.0.1.0/24",
+              "10.1.0.0/16", "10.0.0.2/31", "0.0.0.0/0"]
+
+
+def linear_lookup (table, packet, in_port):
+  """
+  What entry_for_packet() did before the tuple space search
+  """
+  packet_match = of.ofp_match.from_packet(packet, in_port, spec_frags = True)
+  for entry in table.entries:
+    if entry.match.matches_with_wildcards(packet_match,
+                                          consider_other_wildcards=False):
+      return entry
+  return None
+
+
+def random_match (r):
+  m = of.ofp_match()
+  if r.random() < .3: m.in_port = r.randint(1, 3)
+  if r.random() < .3:
+    # EthAddrs given as strings do not compile
+    m.dl_src = r.choice(MACS) if r.random() < .9 else str(r.choice(MACS))
+  if r.random() < .3: m.dl_dst = r.choice(MACS)
+  if r.random() < .5:
+    m.dl_type = r.choice([pkt.ethernet.IP_TYPE, pkt.ethernet.IP_TYPE,
+                          pkt.ethernet.ARP_TYPE])
+    if r.random() < .5: m.nw_src = r.choice(NETS)
+    if r.random() < .5: m.nw_dst = r.choice(NETS)
+    if r.random() < .5:
+      m.nw_proto = r.choice([pkt.ipv4.TCP_PROTOCOL, pkt.ipv4.UDP_PROTOCOL,
+                             pkt.ipv4.ICMP_PROTOCOL])
+      if r.random() < .4: m.tp_dst = r.choice([80, 81])
+      if r.random() < .3: m.tp_src = r.choice([1, 2])
+  if r.random() < .1: m.dl_vlan = 0xffff
+  if r.random() < .05: m.nw_tos = 0
+  if r.random() < .03:
+    # Host bits outside of the netmask do not compile either
+    m.set_nw_src(IPAddr("10.0.0.1"), 8)
+  return m
+
+
+def random_packet (r):
+  e = pkt.ethernet(src = r.choice(MACS), dst = r.choice(MACS))
+  kind = r.random()
+  if kind < .7:
+    e.type = pkt.ethernet.IP_TYPE
+    ip = pkt.ipv4(srcip = IPAddr(r.choice(IPS)), dstip = IPAddr(r.choice(IPS)))
+    ip.protocol = r.choice([pkt.ipv4.TCP_PROTOCOL, pkt.ipv4.UDP_PROTOCOL,
+                            pkt.ipv4.ICMP_PROTOCOL])
+    if ip.protocol == pkt.ipv4.TCP_PROTOCOL:
+      ip.payload = pkt.tcp(srcport = r.choice([1, 2]),
+                           dstport = r.choice([80, 81]))
+    elif ip.protocol == pkt.ipv4.UDP_PROTOCOL:
+      ip.payload = pkt.udp(srcport = r.choice([1, 2]),
+                           dstport = r.choice([80, 81]))
+    else:
+      ip.payload = pkt.icmp()
+    e.payload = ip
+  elif kind < .85:
+    e.type = pkt.ethernet.ARP_TYPE
+    a = pkt.arp(protosrc = IPAddr(r.choice(IPS)),
+                protodst = IPAddr(r.choice(IPS)))
+    a.opcode = pkt.arp.REQUEST
+    e.payload = a
+  else:
+    e.type = pkt.ethernet.LLDP_TYPE
+  return e, r.randint(1, 3)
+
+
+class EntryForPacketTest (unittest.TestCase):
+  def test_priority (self):
+    t = FlowTable()
+    low = TableEntry(priority = 1, match = of.ofp_match(dl_type = 0x800),
+                     now = 0)
+    high = TableEntry(priority = 2, match = of.ofp_match(
+        dl_type = 0x800, nw_dst = "10.0.0.0/24"), now = 0)
+    t.add_entry(low)
+    t.add_entry(high)
+    p = pkt.ethernet(type = pkt.ethernet.IP_TYPE, payload = pkt.ipv4(
+        srcip = IPAddr("10.1.0.1"), dstip = IPAddr("10.0.0.1")))
+    self.assertIs(t.entry_for_packet(p, 1), high)
+    t.remove_entry(high)
+    self.assertIs(t.entry_for_packet(p, 1), low)
+    t.remove_entry(low)
+    self.assertIsNone(t.entry_for_packet(p, 1))
+
+  def test_same_as_linear_scan (self):
+    """
+    Random changes to the table never make the lookup differ from a scan
+    """
+    r = random.Random(1)
+    for _ in range(10):
+      t = FlowTable()
+      for _ in range(300):
+        c = r.random()
+        if c < .5 or len(t) < 3:
+          if r.random() < .1:
+            # An exact match
+            m = of.ofp_match.from_packet(*random_packet(r))
+          else:
+            m = random_match(r)
+          e = TableEntry(priority = r.randint(0, 4), match = m, now = 0)
+          t.add_entry(e)
+          if r.random() < .03:
+            t.add_entry(e)
+        elif c < .65:
+          t.remove_entry(r.choice(t.entries))
+        elif c < .72:
+          t.remove_matching_entries(random_match(r),
+                                    priority = r.randint(0, 4),
+                                    strict = r.random() < .5)
+        elif c < .75:
+          for e in r.sample(t.entries, min(3, len(t))):
+            e.hard_timeout = 1
+          t.remove_expired_entries(now = 10)
+
+        for _ in range(5):
+          packet, in_port = random_packet(r)
+          self.assertIs(t.entry_for_packet(packet, in_port),
+                        linear_lookup(t, packet, in_port))
+
+
+if __name__ == '__main__':
+  unittest.main()